@@ -0,0 +1,111 @@
+# app/cold_start.py
+# cold-start report: import time per module for each app entry point, measured in fresh interpreters
+#   python -m app.cold_start                                  # report for app.main, app.main_normalize, app.main_convert
+#   python -m app.cold_start --json cold_start.json           # save it
+#   python -m app.cold_start --baseline cold_start.json       # exit 1 when an entry point got slower
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ENTRY_MODULES = ["app.main", "app.main_normalize", "app.main_convert"]
+# dependencies whose presence at import time is worth calling out
+HEAVY_MODULES = ["pandas", "numpy", "openai", "pinecone", "pdfplumber", "openpyxl", "httpx"]
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """`python -X importtime` output -> cumulative microseconds per module."""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue  # header line
+        cumulative.setdefault(parts[2].strip(), int(parts[1]))
+    return cumulative
+
+
+def measure_imports(module: str, runs: int = 3) -> Dict[str, float]:
+    """Median cumulative import time (ms) per module when importing `module` in a new process."""
+    samples: Dict[str, List[int]] = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, cwd=os.getcwd()
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+        for name, micros in parse_importtime(result.stderr).items():
+            samples.setdefault(name, []).append(micros)
+    return {name: statistics.median(values) / 1000 for name, values in samples.items()}
+
+
+def cold_start_report(modules: List[str], runs: int = 3, top: int = 15) -> Dict[str, dict]:
+    report = {}
+    for module in modules:
+        times = measure_imports(module, runs)
+        # top-level packages and our own modules; submodules are already inside their package's time
+        rows = {name: ms for name, ms in times.items() if "." not in name or name.startswith("app.")}
+        report[module] = {
+            "total_ms": round(times.get(module, 0.0), 1),
+            "heavy_loaded": [name for name in HEAVY_MODULES if name in times],
+            "modules": {
+                name: round(ms, 1)
+                for name, ms in sorted(rows.items(), key=lambda item: item[1], reverse=True)[:top]
+            },
+        }
+    return report
+
+
+def print_report(report: Dict[str, dict]):
+    for module, entry in report.items():
+        print(f"{module}: {entry['total_ms']:.1f} ms  (heavy: {', '.join(entry['heavy_loaded']) or 'none'})")
+        for name, ms in entry["modules"].items():
+            print(f"    {ms:9.1f} ms  {name}")
+
+
+def compare(report: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """Entry points whose total import time grew by more than `tolerance` (fraction)."""
+    regressions = []
+    for module, entry in report.items():
+        if module not in baseline:
+            continue
+        before = baseline[module]["total_ms"]
+        if entry["total_ms"] > before * (1 + tolerance):
+            regressions.append(f"{module}: {before:.1f} ms -> {entry['total_ms']:.1f} ms")
+        added = sorted(set(entry["heavy_loaded"]) - set(baseline[module]["heavy_loaded"]))
+        if added:
+            regressions.append(f"{module}: now imports {', '.join(added)} at startup")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time per module for each app entry point")
+    parser.add_argument("modules", nargs="*", default=ENTRY_MODULES)
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per entry point (median is reported)")
+    parser.add_argument("--top", type=int, default=15, help="modules listed per entry point")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--baseline", help="report from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed growth of the total before failing")
+    args = parser.parse_args()
+
+    report = cold_start_report(args.modules, args.runs, args.top)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"[REGRESSION] {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# embedding cache shared by every QueryProductNames instance
+# tier 1 : in-process LRU
+# tier 2 : SQLite file, survives restarts
+import sqlite3
+import threading
+import hashlib
+import unicodedata
+import time
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+# cache hit rates on /metrics
+from app.dependencies.metrics import register_cache
+# float16 / int8 storage
+from app.dependencies.vector_quantization import decode_vector, encode_vector
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000"))
+EMBEDDING_CACHE_DISK_ITEMS = int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", "500000"))
+# storage of cached vectors on disk: float32 | float16 (half the bytes) | int8 (a quarter);
+# the memory tier holds decoded vectors so a hit costs no conversion
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float32")
+
+
+def canonicalize_product_name(name: str) -> str:
+    """
+    Canonical form used for cache keys:
+    - NFKC folds full-width / half-width variants ("ＩＶ１．２５" -> "IV1.25")
+    - surrounding whitespace stripped, inner whitespace collapsed
+    """
+    normalized = unicodedata.normalize("NFKC", name or "")
+    return re.sub(r"\s+", " ", normalized).strip()
+
+
+class EmbeddingCache:
+    def __init__(self,
+                 path: Optional[str] = EMBEDDING_CACHE_PATH,
+                 memory_items: int = EMBEDDING_CACHE_MEMORY_ITEMS,
+                 disk_items: int = EMBEDDING_CACHE_DISK_ITEMS,
+                 dtype: str = EMBEDDING_CACHE_DTYPE):
+        """
+        path=None keeps the cache in memory only.
+        The disk tier holds encoded vectors (dtype), the memory tier the decoded
+        ones, so both tiers return the same (quantized) values.
+        """
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self.dtype = dtype
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = self._open(path) if path else None
+        # upper bound of the disk rows (replaced keys are counted again), so
+        # put_many only counts the table when it may have outgrown disk_items
+        self._disk_rows = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] if self._conn else 0
+
+    def _open(self, path: str) -> sqlite3.Connection:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        conn.commit()
+        return conn
+
+    def make_key(self, name: str, model: str, dimensions: int) -> str:
+        # float32 keys stay as they were, so existing cache files remain valid
+        storage = "" if self.dtype == "float32" else f"\x1f{self.dtype}"
+        raw = f"{model}\x1f{dimensions}{storage}\x1f{canonicalize_product_name(name)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    # --- tier 1 ---
+    def _remember(self, key: str, vector: List[float]):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    # --- public api ---
+    def get_many(self, names: List[str], model: str, dimensions: int) -> Dict[str, List[float]]:
+        """
+        Returns {name: vector} for every name found in either tier.
+        Names not in the result are counted as misses.
+        """
+        found = {}
+        pending = {}
+        with self._lock:
+            for name in names:
+                if name in found or name in pending:
+                    continue
+                key = self.make_key(name, model, dimensions)
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    found[name] = vector
+                else:
+                    pending[name] = key
+
+            if pending and self._conn is not None:
+                keys = list(set(pending.values()))
+                rows = {}
+                # stay below SQLite's bound-parameter limit
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    for key, blob in self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                    ):
+                        rows[key] = blob
+                if rows:
+                    now = time.time()
+                    self._conn.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(now, key) for key in rows]
+                    )
+                    self._conn.commit()
+                for name, key in list(pending.items()):
+                    if key in rows:
+                        vector = decode_vector(rows[key], self.dtype)
+                        self._remember(key, vector)
+                        self.disk_hits += 1
+                        found[name] = vector
+                        del pending[name]
+
+            self.misses += len(pending)
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]], model: str, dimensions: int):
+        if not vectors:
+            return
+        now = time.time()
+        rows = []
+        with self._lock:
+            for name, vector in vectors.items():
+                key = self.make_key(name, model, dimensions)
+                blob = encode_vector(vector, self.dtype)
+                # float32 keeps the vector as given, float16 / int8 what the disk tier will return
+                self._remember(key, vector if self.dtype == "float32" else decode_vector(blob, self.dtype))
+                rows.append((key, blob, now))
+
+            if self._conn is not None:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    rows
+                )
+                self._disk_rows += len(rows)
+                self._evict_disk()
+                self._conn.commit()
+
+    def _evict_disk(self):
+        if self._disk_rows <= self.disk_items:
+            return
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        overflow = count - self.disk_items
+        if overflow > 0:
+            # evict a little more than needed so the next puts do not count again right away
+            overflow += self.disk_items // 100
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+            count -= overflow
+        self._disk_rows = max(count, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "memory_items": len(self._memory),
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM embeddings")
+                self._conn.commit()
+                self._disk_rows = 0
+
+
+# Create and reuse a single cache instance
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Shared cache, or None when EMBEDDING_CACHE_ENABLED=0."""
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = cache = EmbeddingCache()
+            register_cache("embedding", lambda: (
+                cache.memory_hits + cache.disk_hits, cache.misses, len(cache._memory)
+            ))
+        return _embedding_cache
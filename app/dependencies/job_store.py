@@ -0,0 +1,202 @@
+# SQLite-backed queue of conversion jobs and their per-line results
+# no broker: web processes and standalone workers share one database file
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", ".cache/jobs.sqlite3")
+# uploaded files / orders waiting to be converted
+JOB_DATA_DIR = os.getenv("JOB_DATA_DIR", ".cache/jobs")
+# a running job without a heartbeat for this long belonged to a dead worker and is queued again
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "120"))
+
+JOB_COLUMNS = (
+    "id, kind, status, filename, input_path, detection, total_lines, done_lines, "
+    "error, created_at, started_at, finished_at, heartbeat_at"
+)
+
+
+class JobStore:
+    def __init__(self, path: str = JOB_STORE_PATH, data_dir: str = JOB_DATA_DIR):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = self._open(path)
+
+    def _open(self, path: str) -> sqlite3.Connection:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # autocommit mode, transactions are opened explicitly where needed
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " kind TEXT NOT NULL,"            # file | normalized
+            " status TEXT NOT NULL,"          # queued | running | done | failed
+            " filename TEXT,"
+            " input_path TEXT NOT NULL,"
+            " detection TEXT,"                # DetectionConfig json, file jobs only
+            " total_lines INTEGER,"
+            " done_lines INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " heartbeat_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs(status, created_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_lines ("
+            " job_id TEXT NOT NULL,"
+            " line_id INTEGER NOT NULL,"
+            " result TEXT NOT NULL,"          # ConvertedProduct json
+            " PRIMARY KEY (job_id, line_id))"
+        )
+        return conn
+
+    def input_path(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.data_dir, f"{job_id}{suffix}")
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def create(self, job_id: str, kind: str, input_path: str, filename: Optional[str] = None,
+               detection: Optional[str] = None, total_lines: Optional[int] = None) -> dict:
+        """Queue a job whose input is already written to input_path."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, filename, input_path, detection, total_lines, created_at)"
+                " VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, filename, input_path, detection, total_lines, time.time())
+            )
+        return self.get(job_id)
+
+    def claim_next(self) -> Optional[dict]:
+        """
+        Oldest queued job, marked running by this caller.
+        Running jobs whose worker stopped sending heartbeats are queued again first.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'queued' WHERE status = 'running' AND heartbeat_at < ?",
+                    (now - JOB_STALE_SECONDS,)
+                )
+                row = self._conn.execute(
+                    f"UPDATE jobs SET status = 'running', started_at = ?, heartbeat_at = ?, error = NULL"
+                    f" WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1)"
+                    f" RETURNING {JOB_COLUMNS}",
+                    (now, now)
+                ).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return dict(row) if row else None
+
+    def save_lines(self, job_id: str, lines: List[Tuple[int, str]], total_lines: Optional[int] = None):
+        """Store finished lines (line_id, ConvertedProduct json) and refresh progress + heartbeat."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO job_lines (job_id, line_id, result) VALUES (?, ?, ?)",
+                    [(job_id, line_id, result) for line_id, result in lines]
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ?, total_lines = COALESCE(?, total_lines),"
+                    " done_lines = (SELECT COUNT(*) FROM job_lines WHERE job_id = ?) WHERE id = ?",
+                    (time.time(), total_lines, job_id, job_id)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def heartbeat(self, job_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish(self, job_id: str, total_lines: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'done', total_lines = ?, finished_at = ? WHERE id = ?",
+                (total_lines, time.time(), job_id)
+            )
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (error, time.time(), job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        query = f"SELECT {JOB_COLUMNS} FROM jobs"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def results(self, job_id: str) -> List[dict]:
+        """Finished lines of a job so far, in line order."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT result FROM job_lines WHERE job_id = ? ORDER BY line_id", (job_id,)
+            ).fetchall()
+        return [json.loads(row["result"]) for row in rows]
+
+    def delete(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        if job is None:
+            return False
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM job_lines WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            self._conn.execute("COMMIT")
+        if os.path.exists(job["input_path"]):
+            os.remove(job["input_path"])
+        return True
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+# Create and reuse a single store instance
+_job_store: Optional[JobStore] = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    global _job_store
+    with _job_store_lock:
+        if _job_store is None:
+            _job_store = JobStore()
+        return _job_store
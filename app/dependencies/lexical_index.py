@@ -0,0 +1,203 @@
+# in-memory character n-gram index over the internal catalog names (BM25 scoring)
+# catches what embeddings miss on part-number-heavy names ("ｉＤ６９００Ｄ－Ｗ１５０昼白色", "KIV1.25sq 青");
+# QueryProductNames fuses its results with the vector matches (reciprocal rank fusion),
+# or uses it alone as a cheap prefilter without embeddings / vector queries (LEXICAL_SEARCH)
+#   python -m app.dependencies.lexical_index "ｉＤ６９００Ｄ－Ｗ１５０昼白色"
+import math
+import re
+import threading
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.dependencies.product_code_index import read_catalog
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+# "hybrid": vector + lexical fused, "lexical": lexical only (no embeddings), "off": vector only
+LEXICAL_SEARCH = os.getenv("LEXICAL_SEARCH", "hybrid")
+LEXICAL_NGRAM_SIZES = tuple(int(n) for n in os.getenv("LEXICAL_NGRAM_SIZES", "2,3").split(",") if n.strip())
+# constant of reciprocal rank fusion: score = sum(1 / (RRF_K + rank))
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# dash look-alikes that survive NFKC (not "ー", it is part of katakana words)
+_DASHES = re.compile(r"[‐‑‒–—―−]")
+
+
+def normalize_for_search(text: str) -> str:
+    """NFKC (full-width -> half-width), lower case, one kind of dash."""
+    return _DASHES.sub("-", unicodedata.normalize("NFKC", text or "").lower())
+
+
+def char_ngrams(text: str, sizes: Tuple[int, ...] = LEXICAL_NGRAM_SIZES) -> List[str]:
+    """
+    n-grams of every whitespace separated token of the normalized text;
+    tokens shorter than the smallest n ("青") are kept whole.
+    """
+    grams = []
+    for token in normalize_for_search(text).split():
+        if len(token) < min(sizes):
+            grams.append(token)
+            continue
+        for n in sizes:
+            grams.extend(token[i:i + n] for i in range(len(token) - n + 1))
+    return grams
+
+
+class LexicalIndex:
+    def __init__(self, sizes: Tuple[int, ...] = LEXICAL_NGRAM_SIZES):
+        self.sizes = sizes
+        self.metadata: List[Dict] = []
+        # gram -> (document numbers, BM25 weight of the gram in each document), idf of the gram
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._idf: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.source = None
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def load_entries(self, entries, source: str = "entries"):
+        """entries: iterable of (internal_product_id, internal_product_name)"""
+        metadata, counts = [], []
+        seen = set()
+        for product_id, product_name in entries:
+            product_id = str(product_id or "").strip()
+            product_name = str(product_name or "").strip()
+            if not product_name or (product_id, product_name) in seen:
+                continue
+            seen.add((product_id, product_name))
+            grams: Dict[str, int] = {}
+            for gram in char_ngrams(product_name, self.sizes):
+                grams[gram] = grams.get(gram, 0) + 1
+            metadata.append({"internal_product_name": product_name, "internal_product_id": product_id})
+            counts.append(grams)
+
+        # the document-dependent part of BM25 is known up front, a query only adds up weights
+        lengths = np.array([sum(grams.values()) for grams in counts], dtype=np.float32)
+        average = float(lengths.mean()) if len(lengths) else 0.0
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        for doc, grams in enumerate(counts):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc] / average) if average else BM25_K1
+            for gram, tf in grams.items():
+                docs, weights = postings.setdefault(gram, ([], []))
+                docs.append(doc)
+                weights.append(tf * (BM25_K1 + 1) / (tf + norm))
+        idf = {gram: math.log(1 + (len(counts) - len(docs) + 0.5) / (len(docs) + 0.5))
+               for gram, (docs, _) in postings.items()}
+        arrays = {gram: (np.array(docs, dtype=np.int32), np.array(weights, dtype=np.float32) * idf[gram])
+                  for gram, (docs, weights) in postings.items()}
+        # swap in one step so readers never see a half-built index
+        with self._lock:
+            self.metadata, self._postings, self._idf = metadata, arrays, idf
+            self.source = source
+
+    def reload(self) -> int:
+        """(Re)build from the catalog the product code index uses (PRODUCT_CATALOG_PATH or the local snapshot)."""
+        entries, source = read_catalog()
+        self.load_entries(entries, source=source)
+        return len(self)
+
+    def search(self, text: str, top_k: int = 10) -> Dict:
+        """
+        Best catalog names for text, in the vector backends' result format.
+        score is the BM25 score relative to the best a document could reach for
+        this query (every query gram matched once), clipped to 1; query grams that
+        no catalog name contains count with the highest idf, so they lower it.
+        """
+        with self._lock:
+            metadata, postings, idf = self.metadata, self._postings, self._idf
+        query_grams = set(char_ngrams(text, self.sizes))
+        grams = query_grams & postings.keys()
+        if not grams or top_k <= 0:
+            return {"matches": []}
+        unseen_idf = math.log(1 + (len(metadata) + 0.5) / 0.5)
+        best_possible = sum(idf[gram] for gram in grams) + unseen_idf * (len(query_grams) - len(grams))
+        scores = np.zeros(len(metadata), dtype=np.float32)
+        for gram in grams:
+            docs, weights = postings[gram]
+            scores[docs] += weights
+        count = min(top_k, int(np.count_nonzero(scores)))
+        if count == 0:
+            return {"matches": []}
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        matches = []
+        for i in top:
+            score = min(1.0, float(scores[i]) / best_possible)
+            matches.append({
+                "id": metadata[i]["internal_product_id"] or str(i),
+                "score": score,
+                # same key as in fused matches: tells lexical scores apart from vector similarities
+                "lexical_score": score,
+                "metadata": metadata[i],
+            })
+        return {"matches": matches}
+
+
+def _match_key(match: Dict) -> tuple:
+    metadata = match.get("metadata") or {}
+    return str(metadata.get("internal_product_name") or "").strip(), str(metadata.get("internal_product_id") or "").strip()
+
+
+def fuse_results(vector_result: Dict, lexical_result: Dict, top_k: int = 10, k: int = RRF_K) -> Dict:
+    """
+    Reciprocal rank fusion of a vector and a lexical result (same product = same name and id).
+    Matches come out in fused order; score is the vector similarity where the vector search
+    found the product and None for products only the n-gram index found: a relative BM25
+    score is no similarity and must not sit next to them (it stays in lexical_score).
+    """
+    fused: Dict[tuple, Dict] = {}
+    for source, result in (("vector", vector_result), ("lexical", lexical_result)):
+        for rank, match in enumerate(result.get("matches", []), start=1):
+            key = _match_key(match)
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = {"id": match.get("id"), "score": None,
+                                      "metadata": match.get("metadata") or {}, "rrf": 0.0}
+            if source == "vector":
+                entry["score"] = match.get("score") or 0.0
+            entry["rrf"] += 1.0 / (k + rank)
+            entry[f"{source}_score"] = match.get("score") or 0.0
+    ordered = sorted(fused.values(), key=lambda entry: entry["rrf"], reverse=True)[:top_k]
+    return {"matches": ordered}
+
+
+# Create and reuse a single index instance (built on first use)
+_lexical_index: Optional[LexicalIndex] = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> LexicalIndex:
+    global _lexical_index
+    with _lexical_index_lock:
+        if _lexical_index is None:
+            _lexical_index = LexicalIndex()
+            _lexical_index.reload()
+        return _lexical_index
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    ap = argparse.ArgumentParser(description="Search the catalog n-gram index.")
+    ap.add_argument("names", nargs="+")
+    ap.add_argument("--top-k", type=int, default=10)
+    args = ap.parse_args()
+
+    start = time.perf_counter()
+    index = get_lexical_index()
+    print(f"{len(index)} catalog names from {index.source} indexed in {time.perf_counter() - start:.2f}s")
+    for name in args.names:
+        start = time.perf_counter()
+        result = index.search(name, args.top_k)
+        print(f"\n{name} ({(time.perf_counter() - start) * 1000:.1f}ms)")
+        for match in result["matches"]:
+            print(f"  {match['score']:.3f}  {match['metadata']['internal_product_id']}  {match['metadata']['internal_product_name']}")
@@ -1,7 +1,10 @@
 # app/dependencies/openai_client.py
 
-from openai import OpenAI
+from openai import OpenAI, DefaultHttpxClient
 from dotenv import load_dotenv
+from typing import Optional
+import httpx
+import threading
 import os
 
 # Load environment *once* at module level
@@ -10,13 +13,43 @@ load_dotenv()
 # Fetch your secret *once*
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# Optional: raise an error if it's missing
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY not found in environment")
+# connection pool / timeouts shared by every embeddings and chat call of the process
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "5"))
+# retries are done by the upstream scheduler (backoff + adaptive concurrency), not the SDK
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "0"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "64"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "32"))
 
-# Create and reuse a single client instance
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
+# Create and reuse a single client instance (built on first use, not at import)
+_openai_client: Optional[OpenAI] = None
+_openai_client_lock = threading.Lock()
 
 
 def get_openai_client() -> OpenAI:
-    return openai_client
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is None:
+            # raise here instead of at import, so modules load without a key
+            if not OPENAI_API_KEY:
+                raise RuntimeError("OPENAI_API_KEY not found in environment")
+            _openai_client = OpenAI(
+                api_key=OPENAI_API_KEY,
+                max_retries=OPENAI_MAX_RETRIES,
+                http_client=DefaultHttpxClient(
+                    timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_MAX_CONNECTIONS,
+                        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+                    ),
+                ),
+            )
+        return _openai_client
+
+
+def close_openai_client():
+    global _openai_client
+    with _openai_client_lock:
+        if _openai_client is not None:
+            _openai_client.close()
+            _openai_client = None
@@ -0,0 +1,301 @@
+# per-stage timings, token usage and cache hit rates in Prometheus text format (GET /metrics),
+# optional per-request trace summaries, and the logging setup that replaces the debug prints
+#
+# stages: decode (encoding detection), parse (CSV chunks / PDF tables / sheet rows), normalize (row rules),
+#         embed (embeddings request), vector_query (one index query), lexical_query (one n-gram index search),
+#         llm (one chat completion)
+import contextvars
+import functools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+# DEBUG shows every line's matches and candidates (formerly printed unconditionally)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# log a stage summary for every request (otherwise only requests sent with "X-Trace: 1")
+REQUEST_TRACE = os.getenv("REQUEST_TRACE", "0") == "1"
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+def configure_logging(level: str = LOG_LEVEL):
+    """Log format for the app's own loggers; uvicorn keeps its own handlers."""
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    # third-party clients stay quiet unless they have something to warn about
+    for name in ("httpx", "openai", "pinecone", "urllib3", "pdfminer"):
+        logging.getLogger(name).setLevel(max(logging.getLevelName(level), logging.WARNING))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = [str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values]
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # labels -> [count per bucket (not cumulative), sum, count]
+        self._values: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels(self.labels + ("le",), labels + (f"{bound:g}",))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                inf_labels = _format_labels(self.labels + ("le",), labels + ("+Inf",))
+                lines.append(f"{self.name}_bucket{inf_labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total:g}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("order_stage_seconds", "Time spent per pipeline stage call", ("stage",))
+STAGE_ERRORS = Counter("order_stage_errors_total", "Stage calls that raised", ("stage",))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by chat completions", ("type",))
+HTTP_SECONDS = Histogram("http_request_seconds", "Request time until the last body byte",
+                         ("method", "route", "status"))
+
+# upstream scheduler (app/dependencies/upstream_scheduler.py)
+UPSTREAM_WAIT_SECONDS = Histogram("upstream_wait_seconds", "Time a call waited for rate limit tokens", ("upstream",))
+UPSTREAM_RETRIES = Counter("upstream_retries_total", "Calls retried after a retryable error", ("upstream", "reason"))
+UPSTREAM_FAILURES = Counter("upstream_failures_total", "Calls that failed after all retries", ("upstream",))
+UPSTREAM_CONCURRENCY = Gauge("upstream_concurrency_limit", "Current adaptive concurrency limit", ("upstream",))
+
+# confidence-gated LLM bypass (app/services/local_reranker.py)
+RERANK_DECISIONS = Counter("rerank_decisions_total", "Lines answered by the local reranker or sent to the LLM",
+                           ("decision",))
+
+_metrics = [STAGE_SECONDS, STAGE_ERRORS, LLM_TOKENS, HTTP_SECONDS,
+            UPSTREAM_WAIT_SECONDS, UPSTREAM_RETRIES, UPSTREAM_FAILURES, UPSTREAM_CONCURRENCY, RERANK_DECISIONS]
+# cache name -> () -> (hits, misses, items)
+_caches: Dict[str, Callable[[], Tuple[int, int, int]]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], Tuple[int, int, int]]):
+    """Report a cache's (hits, misses, items) on /metrics; called where the shared cache is created."""
+    _caches[name] = stats
+
+
+def _render_caches() -> List[str]:
+    samples = {name: stats() for name, stats in list(_caches.items())}
+    lines = []
+    for metric, kind, help, pick in (
+        ("cache_hits_total", "counter", "Cache lookups answered from the cache", lambda h, m, i: h),
+        ("cache_misses_total", "counter", "Cache lookups that had to compute the value", lambda h, m, i: m),
+        ("cache_items", "gauge", "Entries held in memory", lambda h, m, i: i),
+        ("cache_hit_ratio", "gauge", "Hits / lookups since start", lambda h, m, i: h / (h + m) if h + m else 0.0),
+    ):
+        lines += [f"# HELP {metric} {help}", f"# TYPE {metric} {kind}"]
+        for name, (hits, misses, items) in sorted(samples.items()):
+            lines.append(f'{metric}{{cache="{name}"}} {pick(hits, misses, items):g}')
+    return lines
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    lines += _render_caches()
+    return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    """Stage calls and tokens of one request, filled from any thread that carries its context."""
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = {}  # stage -> [calls, seconds]
+        self.tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_tokens(self, kind: str, count: int):
+        with self._lock:
+            self.tokens[kind] = self.tokens.get(kind, 0) + count
+
+    def server_timing(self) -> str:
+        """Server-Timing header value (seconds summed over calls, so parallel calls can exceed the total)."""
+        with self._lock:
+            return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, (_, seconds) in self.stages.items())
+
+    def summary(self) -> str:
+        with self._lock:
+            stages = " ".join(f"{stage}={calls}x{seconds * 1000:.1f}ms"
+                              for stage, (calls, seconds) in self.stages.items())
+            tokens = " ".join(f"{kind}_tokens={count}" for kind, count in self.tokens.items())
+        return " ".join(part for part in (stages, tokens) if part)
+
+
+_current_trace: contextvars.ContextVar[Optional[RequestTrace]] = contextvars.ContextVar("request_trace", default=None)
+
+
+def carry_context(fn: Callable[..., T]) -> Callable[..., T]:
+    """
+    fn bound to a copy of the caller's context, so stage timings recorded on an
+    executor thread reach the request trace. Make one per submitted call.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(1, stage)
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed_iter(stage: str, iterable: Iterable[T]) -> Iterator[T]:
+    """Yields the items of iterable, timing only the work of producing each one."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            observe_stage(stage, time.perf_counter() - start)
+            return
+        observe_stage(stage, time.perf_counter() - start)
+        yield item
+
+
+def record_tokens(usage) -> None:
+    """Token usage of a chat completion response (response.usage, may be None)."""
+    if usage is None:
+        return
+    trace = _current_trace.get()
+    for kind, count in (("prompt", usage.prompt_tokens), ("completion", usage.completion_tokens)):
+        LLM_TOKENS.inc(count, kind)
+        if trace is not None:
+            trace.add_tokens(kind, count)
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: request duration per route (until the last body byte, so
+    streamed responses are measured completely) and, when tracing, a stage summary
+    in the Server-Timing header and the log.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] == "/metrics":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        headers = dict(scope.get("headers") or [])
+        trace = RequestTrace() if REQUEST_TRACE or headers.get(b"x-trace") == b"1" else None
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if trace is not None and trace.stages:
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", trace.server_timing().encode())
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            seconds = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", "other")
+            HTTP_SECONDS.observe(seconds, scope["method"], route, str(status))
+            if trace is not None:
+                logger.info("trace %s %s %s %.1fms %s", scope["method"], scope["path"], status,
+                            seconds * 1000, trace.summary())
+
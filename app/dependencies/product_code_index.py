@@ -0,0 +1,171 @@
+# in-memory index of internal catalog product codes
+# lets ConvertProduct resolve lines that already carry a manufacturer part number
+# without embeddings, vector search or LLM
+import csv
+import io
+import json
+import re
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+# CSV with internal_product_id / internal_product_name columns
+PRODUCT_CATALOG_PATH = os.getenv("PRODUCT_CATALOG_PATH", "")
+LOCAL_VECTOR_SNAPSHOT = os.getenv("LOCAL_VECTOR_SNAPSHOT", "data/vector_snapshot")
+# shortest name token (normalized) that may be taken for a part number; short ones like "5C2V"
+# are as often a cable type or size written in the name as the catalog id they happen to equal
+NAME_CODE_MIN_LENGTH = int(os.getenv("NAME_CODE_MIN_LENGTH", "5"))
+
+# hyphen / dash look-alikes that survive NFKC
+_HYPHENS = re.compile(r"[\-‐‑‒–—―−ー－]")
+_SPACES = re.compile(r"\s+")
+# codes need at least one latin letter or digit to be worth indexing
+_CODE_LIKE = re.compile(r"[A-Z0-9]")
+# part numbers in names: latin letters and digits (hyphens already removed), at least one of each
+_PART_NUMBER = re.compile(r"(?=.*[A-Z])(?=.*[0-9])[A-Z0-9]+")
+
+
+def normalize_product_code(code: str) -> str:
+    """
+    Canonical form of a product code:
+    full-width -> half-width (NFKC), upper case, no hyphens or spaces.
+    "ＸＦＸ４６０ＡＥＮ－ＬＥ９" and "xfx460aen-le9" both become "XFX460AENLE9".
+    """
+    normalized = unicodedata.normalize("NFKC", code or "").upper()
+    normalized = _HYPHENS.sub("", normalized)
+    return _SPACES.sub("", normalized)
+
+
+def looks_like_part_number(token: str) -> bool:
+    """Whether a token of a product name can stand for a part number on its own."""
+    key = normalize_product_code(token)
+    return len(key) >= NAME_CODE_MIN_LENGTH and _PART_NUMBER.fullmatch(key) is not None
+
+
+def read_catalog_csv(path: str) -> List[Tuple[str, str]]:
+    """(internal_product_id, internal_product_name) rows of a catalog CSV (UTF-8 or Shift_JIS)."""
+    raw = Path(path).read_bytes()
+    try:
+        text = raw.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        text = raw.decode("cp932", errors="ignore")
+    reader = csv.DictReader(io.StringIO(text))
+    return [(row.get("internal_product_id"), row.get("internal_product_name")) for row in reader]
+
+
+def _snapshot_metadata_path(snapshot_dir: str) -> Path:
+    # same lookup as vector_backends.current_snapshot_dir, repeated so this module does not import numpy
+    snapshot = Path(snapshot_dir)
+    pointer = snapshot / "CURRENT"
+    if pointer.exists():
+        snapshot = snapshot / pointer.read_text(encoding="utf-8").strip()
+    return snapshot / "metadata.json"
+
+
+def read_snapshot_catalog(snapshot_dir: str) -> List[Tuple[str, str]]:
+    """(internal_product_id, internal_product_name) of every vector in a local snapshot."""
+    with open(_snapshot_metadata_path(snapshot_dir), encoding="utf-8") as f:
+        metadata = json.load(f)["metadata"]
+    return [(m.get("internal_product_id"), m.get("internal_product_name")) for m in metadata]
+
+
+def read_catalog() -> Tuple[List[Tuple[str, str]], Optional[str]]:
+    """
+    Catalog entries and their source: PRODUCT_CATALOG_PATH, else the local vector
+    snapshot metadata, else nothing ([], None).
+    """
+    if PRODUCT_CATALOG_PATH and Path(PRODUCT_CATALOG_PATH).exists():
+        return read_catalog_csv(PRODUCT_CATALOG_PATH), PRODUCT_CATALOG_PATH
+    if _snapshot_metadata_path(LOCAL_VECTOR_SNAPSHOT).exists():
+        return read_snapshot_catalog(LOCAL_VECTOR_SNAPSHOT), LOCAL_VECTOR_SNAPSHOT
+    return [], None
+
+
+class ProductCodeIndex:
+    def __init__(self):
+        self._codes: Dict[str, List[Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+        self.source = None
+
+    def __len__(self):
+        return len(self._codes)
+
+    @staticmethod
+    def _build(entries) -> Dict[str, List[Tuple[str, str]]]:
+        codes: Dict[str, List[Tuple[str, str]]] = {}
+        for product_id, product_name in entries:
+            product_id = str(product_id or "").strip()
+            product_name = str(product_name or "").strip()
+            key = normalize_product_code(product_id)
+            if not key or not _CODE_LIKE.search(key):
+                continue
+            bucket = codes.setdefault(key, [])
+            if (product_id, product_name) not in bucket:
+                bucket.append((product_id, product_name))
+        return codes
+
+    def load_entries(self, entries, source: str = "entries"):
+        """entries: iterable of (internal_product_id, internal_product_name)"""
+        codes = self._build(entries)
+        # swap in one step so readers never see a half-built index
+        with self._lock:
+            self._codes = codes
+            self.source = source
+
+    def load_csv(self, path: str):
+        self.load_entries(read_catalog_csv(path), source=path)
+
+    def load_snapshot_metadata(self, snapshot_dir: str):
+        self.load_entries(read_snapshot_catalog(snapshot_dir), source=snapshot_dir)
+
+    def reload(self) -> int:
+        """
+        (Re)build from PRODUCT_CATALOG_PATH, or from the local vector snapshot metadata.
+        With neither available the index stays empty and every line takes the AI path.
+        """
+        entries, source = read_catalog()
+        self.load_entries(entries, source=source)
+        return len(self)
+
+    def lookup(self, code: str) -> List[Tuple[str, str]]:
+        """Catalog entries (internal_product_id, internal_product_name) whose code matches exactly."""
+        key = normalize_product_code(code)
+        if not key:
+            return []
+        return list(self._codes.get(key, []))
+
+    def resolve(self, external_product_code: str, external_product_name: str = "") -> List[Tuple[str, str]]:
+        """
+        Exact match on the line's product code first, then on whitespace separated
+        tokens of the name that look like part numbers (e.g. "ケーブル HC-5L2").
+        """
+        found = self.lookup(external_product_code)
+        if found:
+            return found
+        for token in unicodedata.normalize("NFKC", external_product_name or "").split():
+            if not looks_like_part_number(token):
+                continue
+            found = self.lookup(token)
+            if found:
+                return found
+        return []
+
+
+# Create and reuse a single index instance
+_product_code_index: Optional[ProductCodeIndex] = None
+_product_code_index_lock = threading.Lock()
+
+
+def get_product_code_index() -> ProductCodeIndex:
+    global _product_code_index
+    with _product_code_index_lock:
+        if _product_code_index is None:
+            _product_code_index = ProductCodeIndex()
+            _product_code_index.reload()
+        return _product_code_index
@@ -0,0 +1,131 @@
+# application-lifetime resources for order conversion
+# pooled clients are created once (at startup via the lifespan), optionally warmed up,
+# and handed to request handlers with Depends instead of being rebuilt per request
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from app.dependencies.product_code_index import ProductCodeIndex, get_product_code_index
+from app.dependencies.result_cache import SingleFlightCache, get_conversion_cache
+
+# openai / pinecone / numpy load on first use, importing this module stays cheap (cold start)
+if TYPE_CHECKING:
+    from openai import OpenAI
+    from app.dependencies.vector_database import QueryProductNames
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+# open connections and touch the index before the first request
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionResources:
+    """Everything ConvertProduct needs, shared by all requests."""
+
+    def __init__(self, client: "OpenAI", vdatabase: "QueryProductNames",
+                 code_index: ProductCodeIndex, result_cache: SingleFlightCache):
+        self.client = client
+        self.vdatabase = vdatabase
+        self.code_index = code_index
+        self.result_cache = result_cache
+
+
+# Create and reuse a single instance
+_conversion_resources: Optional[ConversionResources] = None
+_conversion_resources_lock = threading.Lock()
+
+
+def get_conversion_resources() -> ConversionResources:
+    global _conversion_resources
+    with _conversion_resources_lock:
+        if _conversion_resources is None:
+            from app.dependencies.llm import get_openai_client
+            from app.dependencies.vector_database import get_query_product_names
+
+            _conversion_resources = ConversionResources(
+                client=get_openai_client(),
+                vdatabase=get_query_product_names(),
+                code_index=get_product_code_index(),
+                result_cache=get_conversion_cache(),
+            )
+        return _conversion_resources
+
+
+async def conversion_resources() -> ConversionResources:
+    """
+    FastAPI dependency. async so resolving it costs no threadpool hop per request;
+    only the first build (main_convert has no startup work) runs in the threadpool,
+    client setup, the index lookup and the catalog loads block.
+    """
+    resources = _conversion_resources
+    if resources is not None:
+        return resources
+    try:
+        return await run_in_threadpool(get_conversion_resources)
+    except Exception as e:
+        # missing API keys: normalization still works, conversion is unavailable
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+def warm_up(resources: ConversionResources) -> Dict[str, float]:
+    """
+    Open the HTTP connections (TLS handshake, keep-alive) and touch the vector index.
+    Returns seconds per step; a failing step is reported and skipped.
+    """
+    from app.dependencies.vector_database import EMBEDDING_MODEL
+
+    timings = {}
+    steps = {
+        "openai": lambda: resources.client.models.retrieve(EMBEDDING_MODEL),
+        "vector_index": lambda: resources.vdatabase.vector_backend.describe(),
+    }
+    for name, step in steps.items():
+        start = time.perf_counter()
+        try:
+            step()
+            timings[name] = time.perf_counter() - start
+        except Exception as e:
+            logger.warning("warm-up %s failed: %s", name, e)
+    return timings
+
+
+def open_resources(warm: bool = WARMUP_ON_STARTUP) -> Optional[ConversionResources]:
+    """
+    Build the shared clients (and warm them up). Without API keys the app still
+    starts: normalization works and conversion requests report the error.
+    """
+    try:
+        resources = get_conversion_resources()
+    except Exception as e:
+        logger.warning("conversion resources unavailable: %s", e)
+        return None
+    if warm:
+        timings = warm_up(resources)
+        if timings:
+            logger.info("warm-up: %s", ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return resources
+
+
+def close_resources():
+    global _conversion_resources
+    with _conversion_resources_lock:
+        resources, _conversion_resources = _conversion_resources, None
+    if resources is None:
+        # never opened, nothing to close (and nothing heavy to import)
+        return
+    from app.dependencies.llm import close_openai_client
+    from app.dependencies.vector_database import reset_query_product_names
+    from app.dependencies.vector_backends import close_vector_backend
+
+    reset_query_product_names()
+    close_vector_backend()
+    close_openai_client()
@@ -0,0 +1,127 @@
+# TTL result cache with single-flight: concurrent requests for the same key
+# share one computation instead of each paying for it
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Hashable, List, Optional, Tuple
+
+# cache hit rates on /metrics
+from app.dependencies.metrics import register_cache
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+CONVERSION_CACHE_TTL = float(os.getenv("CONVERSION_CACHE_TTL", "3600"))
+CONVERSION_CACHE_MAX_ITEMS = int(os.getenv("CONVERSION_CACHE_MAX_ITEMS", "10000"))
+
+
+class KeyReleased(Exception):
+    """The leader of a key gave up on it (cancelled or failed); claim() the key again."""
+
+
+class SingleFlightCache:
+    def __init__(self, ttl: float = CONVERSION_CACHE_TTL, max_items: int = CONVERSION_CACHE_MAX_ITEMS):
+        self.ttl = ttl
+        self.max_items = max_items
+        self._values: "OrderedDict[Hashable, Tuple[float, object]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.evictions = 0
+
+    def _get_fresh(self, key, now: float):
+        item = self._values.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < now:
+            del self._values[key]
+            return None
+        self._values.move_to_end(key)
+        return item
+
+    def claim(self, keys: List[Hashable]) -> Tuple[Dict[Hashable, object], List[Hashable], Dict[Hashable, Future]]:
+        """
+        Split keys into
+        - hits    : {key: cached value}
+        - leaders : keys this caller must compute, then resolve() or release()
+        - waiting : {key: Future} for keys another caller is already computing;
+                    the future raises KeyReleased if that caller gives up
+        """
+        hits, leaders, waiting = {}, [], {}
+        now = time.monotonic()
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                item = self._get_fresh(key, now)
+                if item is not None:
+                    hits[key] = item[1]
+                    self.hits += 1
+                elif key in self._in_flight:
+                    waiting[key] = self._in_flight[key]
+                    self.shared += 1
+                else:
+                    self._in_flight[key] = Future()
+                    leaders.append(key)
+                    self.misses += 1
+        return hits, leaders, waiting
+
+    def resolve(self, key: Hashable, value, cache: bool = True):
+        """Publish a leader's result to waiting callers and, if cache=True, store it."""
+        with self._lock:
+            future = self._in_flight.pop(key, None)
+            if cache and self.ttl > 0:
+                self._values[key] = (time.monotonic() + self.ttl, value)
+                self._values.move_to_end(key)
+                while len(self._values) > self.max_items:
+                    self._values.popitem(last=False)
+                    self.evictions += 1
+        if future is not None:
+            future.set_result(value)
+
+    def release(self, keys: List[Hashable]):
+        """
+        Give up keys a leader could not compute. The leader's error stays with
+        the leader: waiting callers get KeyReleased and claim the keys again,
+        so one of them takes over.
+        """
+        with self._lock:
+            futures = [self._in_flight.pop(key) for key in keys if key in self._in_flight]
+        for future in futures:
+            future.set_exception(KeyReleased())
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.shared
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "shared_in_flight": self.shared,
+                "evictions": self.evictions,
+                "items": len(self._values),
+                "in_flight": len(self._in_flight),
+                "hit_rate": (self.hits + self.shared) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+# Create and reuse a single cache for converted lines
+_conversion_cache: Optional[SingleFlightCache] = None
+_conversion_cache_lock = threading.Lock()
+
+
+def get_conversion_cache() -> SingleFlightCache:
+    global _conversion_cache
+    with _conversion_cache_lock:
+        if _conversion_cache is None:
+            _conversion_cache = cache = SingleFlightCache()
+            # lines shared with an in-flight request count as hits
+            register_cache("conversion", lambda: (cache.hits + cache.shared, cache.misses, len(cache._values)))
+        return _conversion_cache
@@ -0,0 +1,242 @@
+# one scheduler per upstream (chat, embeddings, vector index), shared by every request of the process:
+# - token buckets sized from the configured RPM / TPM, so bursts wait instead of collecting 429s
+# - AIMD concurrency: +1/limit per good call, halved on a 429 or on latency far above normal
+# - retries of 429 / 5xx / timeouts with full-jitter exponential backoff (Retry-After wins when sent)
+# calls are blocking and run on executor threads, like the clients they wrap
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, TypeVar
+
+from app.dependencies.metrics import (
+    UPSTREAM_CONCURRENCY, UPSTREAM_FAILURES, UPSTREAM_RETRIES, UPSTREAM_WAIT_SECONDS
+)
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+# attempts after the first one, for every upstream
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "4"))
+UPSTREAM_BACKOFF_BASE = float(os.getenv("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.getenv("UPSTREAM_BACKOFF_MAX", "20"))
+# a call slower than this many times the usual (per token) latency counts as congestion
+UPSTREAM_LATENCY_FACTOR = float(os.getenv("UPSTREAM_LATENCY_FACTOR", "3"))
+# rate limit buckets hold this many seconds of budget; providers enforce limits over short windows
+UPSTREAM_BURST_SECONDS = float(os.getenv("UPSTREAM_BURST_SECONDS", "2"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# multiplicative decrease, applied at most once per cooldown so one burst of 429s halves only once
+DECREASE_FACTOR = 0.5
+DECREASE_COOLDOWN_SECONDS = 1.0
+
+logger = logging.getLogger(__name__)
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """
+    Reservation bucket: a caller takes its tokens right away (the balance may go
+    negative) and waits until the debt is refilled, so callers are served in order.
+    rate_per_minute <= 0 disables the bucket.
+    """
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = UPSTREAM_BURST_SECONDS):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = self.rate * burst_seconds
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens; returns the seconds to wait before using them."""
+        if self.rate <= 0 or amount <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def adjust(self, amount: float):
+        """Correct an earlier estimate (positive: more tokens were used than reserved)."""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self.tokens -= amount
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on calls in flight."""
+
+    def __init__(self, name: str, initial: int, maximum: int, minimum: int = 1):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        # EWMA of seconds per unit of work of successful calls
+        self.usual_latency: Optional[float] = None
+        self._condition = threading.Condition()
+        UPSTREAM_CONCURRENCY.set(self.limit, name)
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float):
+        """A successful call; latency: seconds per unit of work."""
+        with self._condition:
+            self.in_flight -= 1
+            if self.usual_latency is not None and latency > UPSTREAM_LATENCY_FACTOR * self.usual_latency:
+                self._decrease()
+            else:
+                self.usual_latency = latency if self.usual_latency is None else \
+                    0.9 * self.usual_latency + 0.1 * latency
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            UPSTREAM_CONCURRENCY.set(self.limit, self.name)
+            self._condition.notify_all()
+
+    def release_failed(self, throttled: bool):
+        """
+        A failed call; throttled: the upstream answered 429. Failures say nothing about
+        the usual latency and earn no increase, other errors leave the limit alone.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self._decrease()
+                UPSTREAM_CONCURRENCY.set(self.limit, self.name)
+            self._condition.notify_all()
+
+    def _decrease(self):
+        now = time.monotonic()
+        if now - self.last_decrease >= DECREASE_COOLDOWN_SECONDS:
+            self.limit = max(self.minimum, self.limit * DECREASE_FACTOR)
+            self.last_decrease = now
+            logger.info("%s: concurrency limit lowered to %d", self.name, int(self.limit))
+
+
+def _status(error: BaseException) -> Optional[int]:
+    # openai: status_code, pinecone: status, httpx.HTTPStatusError: response.status_code
+    status = getattr(error, "status_code", None) or getattr(error, "status", None) \
+        or getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _is_retryable(error: BaseException) -> bool:
+    if getattr(error, "code", None) == "insufficient_quota":
+        # a 429 that waiting does not fix
+        return False
+    status = _status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    # connection resets / timeouts of httpx, urllib3 and the SDKs wrapping them
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or "Timeout" in name or "Connection" in name
+
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class UpstreamScheduler:
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, initial_concurrency: int = 8,
+                 max_concurrency: int = 64, max_retries: int = UPSTREAM_MAX_RETRIES):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrency(name, initial_concurrency, max_concurrency)
+        self.max_retries = max_retries
+
+    def _backoff(self, attempt: int, error: BaseException) -> float:
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, UPSTREAM_BACKOFF_MAX)
+        # full jitter: retries of many callers spread out instead of arriving together
+        return random.uniform(0, min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_BASE * 2 ** attempt))
+
+    def call(self, fn: Callable[[], T], tokens: int = 0,
+             used_tokens: Optional[Callable[[T], Optional[int]]] = None) -> T:
+        """
+        Run fn() within the rate limits and the concurrency limit, retrying retryable errors.
+        tokens: estimated tokens of the call (prompt + expected completion) for the TPM bucket.
+        used_tokens: reads the real count from the result, the estimate is corrected with it.
+        """
+        attempt = 0
+        while True:
+            wait = max(self.requests.reserve(1), self.tokens.reserve(tokens))
+            UPSTREAM_WAIT_SECONDS.observe(wait, self.name)
+            if wait:
+                time.sleep(wait)
+            self.concurrency.acquire()
+            start = time.perf_counter()
+            try:
+                result = fn()
+            except Exception as e:
+                status = _status(e)
+                self.concurrency.release_failed(throttled=status == 429)
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    UPSTREAM_FAILURES.inc(1, self.name)
+                    raise
+                delay = self._backoff(attempt, e)
+                attempt += 1
+                UPSTREAM_RETRIES.inc(1, self.name, str(status or type(e).__name__))
+                logger.info("%s: %s, retry %d/%d in %.2fs", self.name, status or type(e).__name__,
+                            attempt, self.max_retries, delay)
+                time.sleep(delay)
+                continue
+            self.concurrency.release((time.perf_counter() - start) / max(tokens, 1))
+            if used_tokens is not None:
+                used = used_tokens(result)
+                if used is not None:
+                    self.tokens.adjust(used - tokens)
+            return result
+
+
+def _scheduler_from_env(name: str, prefix: str, initial: int, maximum: int) -> UpstreamScheduler:
+    # e.g. OPENAI_CHAT_RPM / OPENAI_CHAT_TPM / OPENAI_CHAT_MAX_CONCURRENCY; 0 = no rate limit
+    return UpstreamScheduler(
+        name,
+        rpm=float(os.getenv(f"{prefix}_RPM", "0")),
+        tpm=float(os.getenv(f"{prefix}_TPM", "0")),
+        initial_concurrency=int(os.getenv(f"{prefix}_INITIAL_CONCURRENCY", str(initial))),
+        max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(maximum))),
+    )
+
+
+# upstream -> (env prefix, initial concurrency, max concurrency)
+UPSTREAMS = {
+    "chat": ("OPENAI_CHAT", 8, 64),
+    "embed": ("OPENAI_EMBED", 4, 16),
+    "vector": ("VECTOR", 16, 64),
+}
+
+# Create and reuse a single scheduler per upstream
+_schedulers: Dict[str, UpstreamScheduler] = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_scheduler(name: str) -> UpstreamScheduler:
+    with _schedulers_lock:
+        if name not in _schedulers:
+            prefix, initial, maximum = UPSTREAMS[name]
+            _schedulers[name] = _scheduler_from_env(name, prefix, initial, maximum)
+        return _schedulers[name]
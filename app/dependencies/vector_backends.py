@@ -0,0 +1,305 @@
+# vector search backends used by QueryProductNames
+# - PineconeBackend : serverless index (default)
+# - LocalVectorIndex : memory-mapped NumPy snapshot searched in-process
+#
+# Both return the same plain structure so callers do not depend on the SDK:
+#   {"matches": [{"id": "...", "score": 0.91, "metadata": {...}}, ...]}
+import json
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.dependencies.vector_quantization import VECTOR_DTYPES, quantize_matrix, reduce_dimensions
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
+# index host from the pinecone console; skips the describe_index lookup when the client starts
+PINECONE_INDEX_HOST = os.getenv("PINECONE_INDEX_HOST", "")
+# keep-alive connections to the index, at least the number of parallel vector queries
+PINECONE_POOL_MAXSIZE = int(os.getenv("PINECONE_POOL_MAXSIZE", "32"))
+# data plane API version of the direct upsert requests, the one the pinned SDK (pinecone==7.3.0) speaks
+PINECONE_API_VERSION = os.getenv("PINECONE_API_VERSION", "2025-04")
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")  # "pinecone" | "local"
+LOCAL_VECTOR_SNAPSHOT = os.getenv("LOCAL_VECTOR_SNAPSHOT", "data/vector_snapshot")
+# storage of snapshots written by export: float32 | float16 | int8, and an optional shorter dimension
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32")
+LOCAL_VECTOR_DIMENSIONS = int(os.getenv("LOCAL_VECTOR_DIMENSIONS", "0")) or None
+
+SNAPSHOT_VECTORS = "vectors.npy"
+SNAPSHOT_SCALES = "scales.npy"
+SNAPSHOT_METADATA = "metadata.json"
+# each export goes to its own subdirectory; this file names the one readers use
+SNAPSHOT_CURRENT = "CURRENT"
+# float16 / int8 rows are widened to float32 this many at a time while scoring;
+# small blocks stay in the CPU cache (int8 at 1024 rows: ~1.5x the float32 query time, 32768 rows: ~4x)
+SCORE_BLOCK_ROWS = 1024
+
+
+def current_snapshot_dir(snapshot_dir: str) -> Path:
+    """
+    Directory holding the files of the snapshot in snapshot_dir that is current right now.
+    Snapshots written before versioning keep their files directly in snapshot_dir.
+    """
+    snapshot = Path(snapshot_dir)
+    pointer = snapshot / SNAPSHOT_CURRENT
+    if not pointer.exists():
+        return snapshot
+    return snapshot / pointer.read_text(encoding="utf-8").strip()
+
+
+class VectorSearchBackend:
+    """Interface every backend implements."""
+
+    def query(self, vector: List[float], top_k: int = 10) -> Dict:
+        raise NotImplementedError
+
+    def describe(self) -> Dict:
+        raise NotImplementedError
+
+    def close(self):
+        """Release connections / files held by the backend."""
+
+
+class PineconeBackend(VectorSearchBackend):
+    def __init__(self, api_key: Optional[str] = PINECONE_API_KEY, index_name: Optional[str] = PINECONE_INDEX_NAME,
+                 host: str = PINECONE_INDEX_HOST, pool_maxsize: int = PINECONE_POOL_MAXSIZE):
+        from pinecone import Pinecone
+        self.pinecone_client = Pinecone(api_key=api_key)
+        self.api_key = api_key
+        self.index_name = index_name
+        self.host = host
+        self._http = None
+        if host:
+            self.index = self.pinecone_client.Index(host=host, connection_pool_maxsize=pool_maxsize)
+        else:
+            self.index = self.pinecone_client.Index(index_name, connection_pool_maxsize=pool_maxsize)
+
+    def query(self, vector: List[float], top_k: int = 10) -> Dict:
+        result = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True
+        )
+        return {
+            "matches": [
+                {"id": match.id, "score": match.score, "metadata": dict(match.metadata or {})}
+                for match in result.matches
+            ]
+        }
+
+    # writes, used by the catalog indexer (app/services/catalog_indexer.py)
+    def upsert(self, records: List[Dict]):
+        """
+        records: [{"id": ..., "values": [...], "metadata": {...}}, ...]
+        Posted to the data plane directly: the SDK validates every float of every
+        vector in Python (~4 ms per 1536-d vector), more than the request itself takes.
+        """
+        import httpx
+
+        if self._http is None:
+            host = self.host or self.pinecone_client.describe_index(self.index_name).host
+            self._http = httpx.Client(
+                base_url=host if "://" in host else f"https://{host}",
+                headers={"Api-Key": self.api_key or "", "X-Pinecone-API-Version": PINECONE_API_VERSION},
+                timeout=60,
+            )
+        response = self._http.post("/vectors/upsert", json={"vectors": records})
+        response.raise_for_status()
+
+    def update_metadata(self, vector_id: str, metadata: Dict):
+        self.index.update(id=vector_id, set_metadata=metadata)
+
+    def delete(self, ids: List[str]):
+        self.index.delete(ids=ids)
+
+    def describe(self) -> Dict:
+        stats = self.index.describe_index_stats()
+        return {"backend": "pinecone", "dimension": stats.dimension, "vector_count": stats.total_vector_count}
+
+    def close(self):
+        self.index.close()
+        if self._http is not None:
+            self._http.close()
+
+
+class LocalVectorIndex(VectorSearchBackend):
+    def __init__(self, snapshot_dir: str = LOCAL_VECTOR_SNAPSHOT):
+        """
+        Loads a snapshot written by write_snapshot().
+        vectors.npy is opened with mmap_mode="r": the matrix is never copied
+        into the process, so every uvicorn worker shares the same read-only
+        pages from the OS page cache.
+        """
+        # resolved once: a later export does not change the files this instance reads
+        snapshot = current_snapshot_dir(snapshot_dir)
+        self.snapshot_dir = snapshot
+        self.vectors = np.load(snapshot / SNAPSHOT_VECTORS, mmap_mode="r")
+        # int8 snapshots: one scale per row
+        self.scales = np.load(snapshot / SNAPSHOT_SCALES) if self.vectors.dtype == np.int8 else None
+        with open(snapshot / SNAPSHOT_METADATA, encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids: List[str] = meta["ids"]
+        self.metadata: List[Dict] = meta["metadata"]
+        if self.vectors.ndim != 2 or len(self.ids) != self.vectors.shape[0]:
+            raise ValueError(f"Corrupt vector snapshot in {snapshot_dir}")
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    def _scores(self, query: np.ndarray) -> np.ndarray:
+        # rows are unit length, so the dot product is the cosine similarity
+        if self.vectors.dtype == np.float32:
+            return self.vectors @ query
+        # no BLAS for float16 / int8: widen block by block instead of copying the whole matrix
+        scores = np.empty(self.vectors.shape[0], dtype=np.float32)
+        for start in range(0, self.vectors.shape[0], SCORE_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + block.shape[0]] = block @ query
+        if self.scales is not None:
+            scores *= self.scales
+        return scores
+
+    def query(self, vector: List[float], top_k: int = 10) -> Dict:
+        query = np.asarray(vector, dtype=np.float32)
+        if query.ndim != 1 or query.shape[0] < self.dimension:
+            raise ValueError(f"Query dimension {query.shape[-1]} does not match snapshot dimension {self.dimension}")
+        # a longer query is shortened like the snapshot was (first values, re-normalized below)
+        query = query[:self.dimension]
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        scores = self._scores(query)
+        count = min(top_k, scores.shape[0])
+        if count <= 0:
+            return {"matches": []}
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+        return {
+            "matches": [
+                {"id": self.ids[i], "score": float(scores[i]), "metadata": self.metadata[i]}
+                for i in top
+            ]
+        }
+
+    def describe(self) -> Dict:
+        return {"backend": "local", "dimension": self.dimension, "vector_count": len(self.ids),
+                "dtype": str(self.vectors.dtype), "bytes": self.nbytes}
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.vectors.nbytes + (self.scales.nbytes if self.scales is not None else 0))
+
+
+def write_snapshot(snapshot_dir: str, ids: List[str], vectors, metadata: List[Dict],
+                   dtype: str = "float32", dimensions: Optional[int] = None):
+    """
+    Store vectors as one contiguous, L2-normalized matrix plus metadata,
+    optionally cut to `dimensions` and stored as float16 / int8 (+ scales.npy).
+    All files go to a new version subdirectory, then the CURRENT pointer is
+    replaced in one rename: a reader sees either the old or the new set of
+    files, never vectors of one export with ids of another. The previous
+    version is kept for readers that resolved it just before the swap,
+    older ones are removed.
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim != 2 or matrix.shape[0] != len(ids) or len(ids) != len(metadata):
+        raise ValueError("ids, vectors and metadata must have the same length")
+    stored, scales = quantize_matrix(reduce_dimensions(matrix, dimensions), dtype)
+
+    snapshot = Path(snapshot_dir)
+    snapshot.mkdir(parents=True, exist_ok=True)
+    previous = current_snapshot_dir(snapshot_dir)
+    # unique, and dated for anyone listing the directory
+    version = Path(tempfile.mkdtemp(prefix=time.strftime("%Y%m%d%H%M%S-"), dir=snapshot))
+    version.chmod(0o755)
+    with open(version / SNAPSHOT_VECTORS, "wb") as f:
+        np.save(f, stored)
+    if scales is not None:
+        with open(version / SNAPSHOT_SCALES, "wb") as f:
+            np.save(f, scales)
+    with open(version / SNAPSHOT_METADATA, "w", encoding="utf-8") as f:
+        json.dump({"ids": list(ids), "metadata": list(metadata)}, f, ensure_ascii=False)
+
+    tmp_pointer = snapshot / (SNAPSHOT_CURRENT + ".tmp")
+    tmp_pointer.write_text(version.name, encoding="utf-8")
+    os.replace(tmp_pointer, snapshot / SNAPSHOT_CURRENT)
+
+    # workers that mapped an older version keep their open files
+    for old in snapshot.iterdir():
+        if old.is_dir() and old not in (version, previous):
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def export_pinecone_snapshot(snapshot_dir: str, backend: Optional[PineconeBackend] = None, fetch_batch: int = 100,
+                             dtype: str = LOCAL_VECTOR_DTYPE, dimensions: Optional[int] = LOCAL_VECTOR_DIMENSIONS):
+    """Copy every vector and its metadata from the Pinecone index into a local snapshot."""
+    backend = backend or PineconeBackend()
+    ids, vectors, metadata = [], [], []
+    for id_page in backend.index.list():
+        for start in range(0, len(id_page), fetch_batch):
+            fetched = backend.index.fetch(ids=id_page[start:start + fetch_batch])
+            for vector_id, record in fetched.vectors.items():
+                ids.append(vector_id)
+                vectors.append(record.values)
+                metadata.append(dict(record.metadata or {}))
+    write_snapshot(snapshot_dir, ids, vectors, metadata, dtype=dtype, dimensions=dimensions)
+    return len(ids)
+
+
+# Create and reuse a single backend per process
+_vector_backend: Optional[VectorSearchBackend] = None
+_vector_backend_lock = threading.Lock()
+
+
+def get_vector_backend() -> VectorSearchBackend:
+    global _vector_backend
+    with _vector_backend_lock:
+        if _vector_backend is None:
+            if VECTOR_BACKEND == "local":
+                _vector_backend = LocalVectorIndex(LOCAL_VECTOR_SNAPSHOT)
+            elif VECTOR_BACKEND == "pinecone":
+                _vector_backend = PineconeBackend()
+            else:
+                raise RuntimeError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+        return _vector_backend
+
+
+def close_vector_backend():
+    global _vector_backend
+    with _vector_backend_lock:
+        if _vector_backend is not None:
+            _vector_backend.close()
+            _vector_backend = None
+
+
+if __name__ == "__main__":
+    # python -m app.dependencies.vector_backends export data/vector_snapshot
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Vector backend utilities.")
+    sub = ap.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export the Pinecone index into a local snapshot")
+    export.add_argument("snapshot_dir", nargs="?", default=LOCAL_VECTOR_SNAPSHOT)
+    export.add_argument("--dtype", choices=VECTOR_DTYPES, default=LOCAL_VECTOR_DTYPE)
+    export.add_argument("--dimensions", type=int, default=LOCAL_VECTOR_DIMENSIONS,
+                        help="keep the first N values of every vector (re-normalized)")
+    sub.add_parser("describe", help="Print stats of the configured backend")
+    args = ap.parse_args()
+
+    if args.command == "export":
+        count = export_pinecone_snapshot(args.snapshot_dir, dtype=args.dtype, dimensions=args.dimensions)
+        print(f"Done. Wrote {count} vectors to: {args.snapshot_dir}")
+    else:
+        print(get_vector_backend().describe())
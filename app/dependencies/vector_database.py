@@ -1,53 +1,201 @@
 # embeddings and vector database 
 from openai import OpenAI
-from pinecone import Pinecone 
+from app.dependencies.llm import get_openai_client
+from app.dependencies.vector_backends import VectorSearchBackend, get_vector_backend
+# char n-gram index fused with (or replacing) the vector matches
+from app.dependencies.lexical_index import LEXICAL_SEARCH, LexicalIndex, fuse_results, get_lexical_index
 
 # data types 
-from typing import List
+from typing import List, Optional
+import threading
+
+# parallel vector queries
+from concurrent.futures import ThreadPoolExecutor
+
+# embedding cache
+from app.dependencies.embedding_cache import EmbeddingCache, get_embedding_cache
+# stage timings
+from app.dependencies.metrics import carry_context, timed
+# rate limits, adaptive concurrency and retries per upstream
+from app.dependencies.upstream_scheduler import get_scheduler
 
 # load api keys 
 from dotenv import load_dotenv
 import os
 
-# out
-import json
-
-# get api keys 
 load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
+
+# embedding settings
+EMBEDDING_MODEL = "text-embedding-3-small"
+# text-embedding-3 vectors can be shortened (e.g. 512 / 256) with a small loss in matching quality;
+# the Pinecone index / local snapshot must have the same dimension (python -m app.services.embedding_eval)
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "1536"))
+# OpenAI accepts at most 2048 inputs and ~300k tokens per embeddings request
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "2048"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "300000"))
+# concurrent vector queries, shared by all requests of the process
+VECTOR_QUERY_CONCURRENCY = int(os.getenv("VECTOR_QUERY_CONCURRENCY", "16"))
+# matches per name, from the vector index, the n-gram index and after fusing both
+TOP_K = 10
+_query_executor = ThreadPoolExecutor(max_workers=max(1, VECTOR_QUERY_CONCURRENCY), thread_name_prefix="vector-query")
+
+def split_embedding_batches(names: List[str]) -> List[List[str]]:
+    """
+    Split names into request-sized batches.
+    Token count is estimated as one token per character, which is
+    an upper bound for the Japanese product names we receive.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for name in names:
+        tokens = max(len(name), 1)
+        if current and (len(current) >= EMBEDDING_BATCH_SIZE
+                        or current_tokens + tokens > EMBEDDING_BATCH_TOKENS):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(name)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def embed_batch(openai_client: OpenAI, batch: List[str]) -> List[List[float]]:
+    """One embeddings request through the embed scheduler (rate limits, retries), in input order."""
+    def create():
+        with timed("embed"):
+            return openai_client.embeddings.create(
+                input=batch,
+                model=EMBEDDING_MODEL,
+                dimensions=EMBEDDING_DIMENSIONS
+            )
+
+    response = get_scheduler("embed").call(
+        create,
+        tokens=sum(max(len(name), 1) for name in batch),
+        used_tokens=lambda response: response.usage.total_tokens if response.usage is not None else None
+    )
+    # response items carry their input position; keep input order
+    ordered = sorted(response.data, key=lambda item: item.index)
+    return [item.embedding for item in ordered]
+
+
+def request_embeddings(openai_client: OpenAI, names: List[str]) -> List[List[float]]:
+    """Embeddings of names (no cache), requested batch by batch."""
+    embeddings = []
+    for batch in split_embedding_batches(names):
+        embeddings.extend(embed_batch(openai_client, batch))
+    return embeddings
+
 
 class QueryProductNames:
-    def __init__(self): 
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY)
-        self.pinecone_client = Pinecone(api_key=PINECONE_API_KEY)
-        self.index = self.pinecone_client.Index(PINECONE_INDEX_NAME) 
+    def __init__(self, openai_client: Optional[OpenAI] = None,
+                 vector_backend: Optional[VectorSearchBackend] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None,
+                 lexical_index: Optional[LexicalIndex] = None,
+                 lexical_search: str = LEXICAL_SEARCH): 
+        # process-wide pooled clients unless given explicitly
+        self.openai_client = openai_client or get_openai_client()
+        # pinecone or local snapshot, chosen by VECTOR_BACKEND
+        self.vector_backend = vector_backend or get_vector_backend()
+        self.embedding_cache = embedding_cache if embedding_cache is not None else get_embedding_cache()
+        # without a catalog (PRODUCT_CATALOG_PATH / local snapshot) the index is empty and only vectors are used
+        self.lexical_search = lexical_search
+        self.lexical_index = None
+        if lexical_search in ("hybrid", "lexical"):
+            self.lexical_index = lexical_index if lexical_index is not None else get_lexical_index()
+
+    def _request_embeddings(self, external_product_names: List[str]) -> List[List[float]]:
+        return request_embeddings(self.openai_client, external_product_names)
+
+    def _create_embeddings_batch(self, external_product_names: List[str]) -> List[List[float]]:
+        """
+        Embeddings in input order. Cached names skip the embedding API,
+        the remaining unique names are requested in batches and cached.
+        """
+        cache = self.embedding_cache
+        if cache is None:
+            return self._request_embeddings(external_product_names)
+
+        vectors = cache.get_many(external_product_names, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+        missing = list(dict.fromkeys(name for name in external_product_names if name not in vectors))
+        if missing:
+            fresh = dict(zip(missing, self._request_embeddings(missing)))
+            cache.put_many(fresh, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS)
+            vectors.update(fresh)
+        return [vectors[name] for name in external_product_names]
 
     def _create_embeddings(self, external_product_name: str) -> List[float]:
-        set_dimension = 1536
-        response = self.openai_client.embeddings.create(
-            input=[external_product_name],
-            model="text-embedding-3-small",
-            dimensions = set_dimension 
-        )
-        return response.data[0].embedding
-
-    def _query_pinecone(self, vector: List[float] ) -> List[str]:
-        number_returns = 10 
-        result = self.index.query(
-            vector=vector,
-            top_k=number_returns, 
-            include_metadata=True
-        )
-        return result 
+        return self._create_embeddings_batch([external_product_name])[0]
+
+    def _query_index(self, vector: List[float] ) -> dict:
+        number_returns = TOP_K
+        def query():
+            with timed("vector_query"):
+                return self.vector_backend.query(vector, top_k=number_returns)
+        return get_scheduler("vector").call(query)
     
-    def query_product_names(self, external_product_name :str ) -> List[str]: 
-        query_embedding = self._create_embeddings(external_product_name)
-        return self._query_pinecone(query_embedding)
+    def _query_lexical(self, external_product_name: str) -> dict:
+        with timed("lexical_query"):
+            return self.lexical_index.search(external_product_name, top_k=TOP_K)
+
+    def _lexical_mode(self) -> Optional[str]:
+        """LEXICAL_SEARCH mode ("hybrid" / "lexical") when the n-gram index has entries, None for vector search only."""
+        if self.lexical_index is None or not len(self.lexical_index):
+            return None
+        return self.lexical_search
+
+    def query_product_names(self, external_product_name :str ) -> dict: 
+        return self.query_product_names_batch([external_product_name])[0]
+
+    def query_product_names_batch(self, external_product_names: List[str]) -> List[dict]:
+        """
+        Query similar products for every name of an order.
+        All names are embedded in as few requests as possible,
+        results are returned in input order.
+        """
+        if not external_product_names:
+            return []
+        mode = self._lexical_mode()
+        if mode == "lexical":
+            # prefilter only: no embeddings, no vector queries
+            return [self._query_lexical(name) for name in external_product_names]
+        query_embeddings = self._create_embeddings_batch(external_product_names)
+        if len(query_embeddings) == 1 or VECTOR_QUERY_CONCURRENCY <= 1:
+            results = [self._query_index(vector) for vector in query_embeddings]
+        else:
+            # one context copy per query so its timing lands in the caller's request trace; input order kept
+            futures = [_query_executor.submit(carry_context(self._query_index), vector) for vector in query_embeddings]
+            results = [future.result() for future in futures]
+        if mode == "hybrid":
+            results = [fuse_results(result, self._query_lexical(name), top_k=TOP_K)
+                       for name, result in zip(external_product_names, results)]
+        return results
+
+
+# Create and reuse a single instance (pooled clients, no per-request setup)
+_query_product_names: Optional[QueryProductNames] = None
+_query_product_names_lock = threading.Lock()
+
+
+def get_query_product_names() -> QueryProductNames:
+    global _query_product_names
+    with _query_product_names_lock:
+        if _query_product_names is None:
+            _query_product_names = QueryProductNames()
+        return _query_product_names
+
+
+def reset_query_product_names():
+    """Forget the shared instance, e.g. after its clients were closed."""
+    global _query_product_names
+    with _query_product_names_lock:
+        _query_product_names = None
  
  
 # # sample usage 
 # q_inst = QueryProductNames() 
 # result = q_inst.query_product_names("VE22硬質ビニル電線管(4m)ベージュ") 
-# print(result)
\ No newline at end of file
+# print(result)
@@ -0,0 +1,66 @@
+# reduced-dimension / quantized storage of embedding vectors
+# - reduce_dimensions: text-embedding-3 vectors can be cut to their first d values and re-normalized,
+#   which is what the API's `dimensions` parameter returns, so stored 1536-d vectors shrink without re-embedding
+# - float16 halves, int8 (one float32 scale per vector) quarters the bytes of a float32 vector
+# numpy is imported inside the functions: the embedding cache uses this module and stays cheap to import
+from typing import List, Optional, Tuple
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+def _check_dtype(dtype: str):
+    if dtype not in VECTOR_DTYPES:
+        raise ValueError(f"Unknown vector dtype {dtype!r}, expected one of {', '.join(VECTOR_DTYPES)}")
+
+
+def reduce_dimensions(vectors, dimensions: Optional[int]):
+    """First `dimensions` values of each row, L2-normalized again (float32 matrix)."""
+    import numpy as np
+
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if dimensions and dimensions < matrix.shape[-1]:
+        matrix = matrix[..., :dimensions]
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return np.ascontiguousarray(matrix / norms)
+
+
+def quantize_matrix(matrix, dtype: str) -> Tuple[object, Optional[object]]:
+    """
+    (stored matrix, per-row scales or None). int8 rows are x / scale rounded, with
+    scale = max|x| / 127, so a dot product is (stored @ q) * scale.
+    """
+    import numpy as np
+
+    _check_dtype(dtype)
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if dtype == "float32":
+        return matrix, None
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    scales = np.abs(matrix).max(axis=-1) / 127.0
+    scales[scales == 0] = 1.0
+    stored = np.clip(np.rint(matrix / scales[..., None]), -127, 127).astype(np.int8)
+    return stored, scales.astype(np.float32)
+
+
+def encode_vector(vector: List[float], dtype: str = "float32") -> bytes:
+    """One vector as bytes; int8 blobs start with their float32 scale."""
+    import numpy as np
+
+    stored, scales = quantize_matrix(np.asarray(vector, dtype=np.float32)[None, :], dtype)
+    if scales is None:
+        return stored.tobytes()
+    return scales.tobytes() + stored.tobytes()
+
+
+def decode_vector(blob: bytes, dtype: str = "float32") -> List[float]:
+    import numpy as np
+
+    _check_dtype(dtype)
+    if dtype == "float32":
+        return np.frombuffer(blob, dtype=np.float32).tolist()
+    if dtype == "float16":
+        return np.frombuffer(blob, dtype=np.float16).astype(np.float32).tolist()
+    scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+    return (np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale).tolist()
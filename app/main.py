@@ -1,9 +1,41 @@
 # app/main.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from app.dependencies.metrics import MetricsMiddleware, configure_logging
+from fastapi.concurrency import run_in_threadpool
+from app.routers import metrics
 from app.routers import raw_order
 from app.routers import normalized_order 
+from app.routers import jobs
+from app.dependencies.product_code_index import get_product_code_index
+from app.dependencies.resources import open_resources, close_resources
+from app.services.order_normalizer import shutdown_pdf_pool
+from app.services.job_runner import get_job_runner
 
-app = FastAPI()
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # build the product code index once, before the first request
+    get_product_code_index()
+    # pooled llm / vector clients for the whole app lifetime, warmed up (WARMUP_ON_STARTUP)
+    await run_in_threadpool(open_resources)
+    # background conversion jobs (JOB_WORKERS=0 leaves them to a standalone worker)
+    job_runner = get_job_runner()
+    job_runner.start()
+    yield
+    await job_runner.stop()
+    # stop the pdf worker processes with the app
+    shutdown_pdf_pool()
+    close_resources()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.include_router(metrics.router)
 app.include_router(raw_order.router)
+app.include_router(raw_order.convert_router)
 app.include_router(normalized_order.router)
-
+app.include_router(jobs.router)
@@ -0,0 +1,25 @@
+# app/main_convert.py
+# convert-only app for serverless deployment: /normalized_order/*
+# no startup work; the openai / vector clients and the product code index are built on the first request,
+# in the threadpool so the event loop keeps serving meanwhile
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from app.dependencies.metrics import MetricsMiddleware, configure_logging
+from app.routers import metrics
+from app.routers import normalized_order
+from app.dependencies.resources import close_resources
+
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    close_resources()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.include_router(metrics.router)
+app.include_router(normalized_order.router)
@@ -0,0 +1,24 @@
+# app/main_normalize.py
+# normalize-only app for serverless deployment: /raw_order/normalize_* and /raw_order/detections
+# loads pandas (plus pdfplumber / openpyxl on the first PDF / XLSX), never openai or pinecone
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from app.dependencies.metrics import MetricsMiddleware, configure_logging
+from app.routers import metrics
+from app.routers import raw_order
+from app.services.order_normalizer import shutdown_pdf_pool
+
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    shutdown_pdf_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.include_router(metrics.router)
+app.include_router(raw_order.router)
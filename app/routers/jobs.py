@@ -0,0 +1,106 @@
+# routers/jobs.py
+# bulk conversion without holding a request open: submit, poll status, fetch result
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+import os
+import shutil
+
+# programmer defined schema
+from app.schemas.normalized_order import NormalizedOrder
+from app.schemas.job import JobStatus, JobList, JobResult
+# job queue
+from app.dependencies.job_store import get_job_store
+from app.services.job_runner import get_job_runner
+# shared upload handling
+from app.routers.raw_order import check_upload_size, read_detection_config
+
+router = APIRouter(
+    prefix="/jobs",
+    tags=["jobs"]
+)
+
+
+def _save_upload(file: UploadFile, path: str):
+    with open(path, "wb") as target:
+        shutil.copyfileobj(file.file, target)
+
+
+def _save_order(order: NormalizedOrder, path: str):
+    with open(path, "w", encoding="utf-8") as target:
+        target.write(order.model_dump_json())
+
+
+@router.post("/files", response_model=JobList)
+async def submit_files(
+    files: List[UploadFile] = File(..., description="CSV, PDF or XLSX files, one job per file"),
+    detection: Optional[UploadFile] = File(None, description="Detection JSON configuration file for all files (optional for registered formats)")
+):
+    """Queue raw files for normalize + convert. Returns immediately with one job per file."""
+    detection_config = await read_detection_config(detection) if detection is not None else None
+    detection_json = detection_config.model_dump_json() if detection_config is not None else None
+    store = get_job_store()
+    jobs = []
+    for file in files:
+        check_upload_size(file)
+        job_id = store.new_id()
+        path = store.input_path(job_id, os.path.splitext(file.filename or "")[1].lower())
+        await run_in_threadpool(_save_upload, file, path)
+        jobs.append(await run_in_threadpool(
+            store.create, job_id, "file", path, filename=file.filename, detection=detection_json
+        ))
+    get_job_runner().notify()
+    return JobList(jobs=[JobStatus(**job) for job in jobs])
+
+
+@router.post("/orders", response_model=JobList)
+async def submit_orders(orders: List[NormalizedOrder]):
+    """Queue normalized orders for conversion. Returns immediately with one job per order."""
+    store = get_job_store()
+    jobs = []
+    for order in orders:
+        job_id = store.new_id()
+        path = store.input_path(job_id, ".json")
+        await run_in_threadpool(_save_order, order, path)
+        jobs.append(await run_in_threadpool(
+            store.create, job_id, "normalized", path, total_lines=len(order.components)
+        ))
+    get_job_runner().notify()
+    return JobList(jobs=[JobStatus(**job) for job in jobs])
+
+
+@router.get("/", response_model=JobList)
+async def list_jobs(status: Optional[str] = None, limit: int = 100):
+    jobs = await run_in_threadpool(get_job_store().list, status, limit)
+    return JobList(jobs=[JobStatus(**job) for job in jobs])
+
+
+@router.get("/{job_id}", response_model=JobStatus)
+async def job_status(job_id: str):
+    job = await run_in_threadpool(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobStatus(**job)
+
+
+@router.get("/{job_id}/result", response_model=JobResult)
+async def job_result(job_id: str):
+    """Lines converted so far (all of them once the job is done), in line order."""
+    store = get_job_store()
+    job = await run_in_threadpool(store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    records = await run_in_threadpool(store.results, job_id)
+    return JobResult(job=JobStatus(**job), records=records)
+
+
+@router.delete("/{job_id}")
+async def delete_job(job_id: str):
+    store = get_job_store()
+    job = await run_in_threadpool(store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == "running":
+        raise HTTPException(status_code=409, detail="Job is running")
+    await run_in_threadpool(store.delete, job_id)
+    return {"deleted": job_id}
@@ -0,0 +1,13 @@
+# routers/metrics.py
+# Prometheus scrape endpoint: stage timings, LLM tokens, cache hit rates, request durations
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.dependencies.metrics import render_metrics
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,6 +1,9 @@
 # routers/normalized_order.py (MODIFIED)
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from typing import List
+import json
 
 # programmer defined schema 
 from app.schemas.normalized_order import NormalizedOrder 
@@ -8,6 +11,10 @@ from app.schemas.converted_order import ConvertedProduct
 
 # routers 
 from app.services.order_converter import ConvertProduct
+# product code fast path
+from app.dependencies.product_code_index import get_product_code_index
+# shared clients
+from app.dependencies.resources import ConversionResources, conversion_resources
 
 router = APIRouter(
     prefix="/normalized_order",
@@ -19,6 +26,38 @@ async def list_orders():
     return {"message": "This endpoint receive normalize order and convert external product names to internal ones. along with internal product id"}
 
 @router.post("/convert_internal", response_model=List[ConvertedProduct])  # Changed response model
-async def upload_csv(normalized_order: NormalizedOrder): 
-    converter = ConvertProduct(normalized_order)
-    return converter.convert_single_order()  # This now returns a list directly
\ No newline at end of file
+async def upload_csv(normalized_order: NormalizedOrder,
+                     resources: ConversionResources = Depends(conversion_resources)): 
+    converter = ConvertProduct(normalized_order, resources=resources)
+    # lines are converted concurrently off the event loop
+    return await converter.convert_single_order_async()
+
+@router.post("/convert_internal/stream")
+async def convert_internal_stream(normalized_order: NormalizedOrder,
+                                  resources: ConversionResources = Depends(conversion_resources)):
+    """
+    Same conversion as /convert_internal, streamed as NDJSON:
+    one ConvertedProduct per line, sent as soon as it is ready.
+    Lines arrive in completion order; use pre-convert.id to place each one.
+    """
+    converter = ConvertProduct(normalized_order, resources=resources)
+
+    async def ndjson():
+        async for converted in converter.iter_single_order_async():
+            yield json.dumps(converted.model_dump(mode="json", by_alias=True), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@router.post("/product_codes/reload")
+async def reload_product_codes():
+    """Rebuild the exact product code index and the n-gram name index after the internal catalog changed."""
+    # numpy based, imported here so the convert app starts without it
+    from app.dependencies.lexical_index import get_lexical_index
+
+    # reading and parsing the catalog blocks, so does building either index on first use
+    index = await run_in_threadpool(get_product_code_index)
+    count = await run_in_threadpool(index.reload)
+    lexical_index = await run_in_threadpool(get_lexical_index)
+    names = await run_in_threadpool(lexical_index.reload)
+    return {"codes": count, "names": names, "source": index.source}
\ No newline at end of file
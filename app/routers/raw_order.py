@@ -1,11 +1,24 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 import json
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, List, Optional
 
 # services 
 from app.services.order_normalizer import NormalizeCsvOrder 
-# from app.services.order_normalizer import NormalizePDFOrder 
+from app.services.order_normalizer import NormalizePDFOrder 
+from app.services.order_normalizer import NormalizeXlsxOrder
+from app.services.detection_registry import DetectionMismatchError, UnknownFormatError, get_detection_registry
+# one-shot normalize + convert
+from app.services.order_pipeline import convert_raw_order, make_normalizer
+# shared clients
+from app.dependencies.resources import ConversionResources, conversion_resources
 # common output structure 
 from app.schemas.normalized_order import NormalizedOrder
+from app.schemas.converted_order import ConvertedProduct
 # detection schema
 from app.schemas.detection import DetectionConfig
 
@@ -13,68 +26,219 @@ router = APIRouter(
     prefix="/raw_order",
     tags=["raw_order"]
 )
+# raw file -> internal candidates, kept apart so the normalize-only handler (app/main_normalize.py) can leave it out
+convert_router = APIRouter(
+    prefix="/raw_order",
+    tags=["raw_order"]
+)
+
+# largest accepted upload, in bytes
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# uploads copied for streamed responses stay in memory up to this size, then go to disk
+SPOOL_MAX_BYTES = 1024 * 1024
+
+
+def check_upload_size(file: UploadFile):
+    """Reject uploads over MAX_UPLOAD_BYTES with 413."""
+    size = file.size
+    if size is None:
+        # measure the spooled file without reading it
+        file.file.seek(0, os.SEEK_END)
+        size = file.file.tell()
+        file.file.seek(0)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large: {size} bytes (limit {MAX_UPLOAD_BYTES} bytes)"
+        )
+
+async def read_detection_config(detection: UploadFile) -> DetectionConfig:
+    """Parse and validate an uploaded detection JSON file (400 if invalid)."""
+    try:
+        detection_contents = await detection.read()
+        detection_json = detection_contents.decode('utf-8')
+        detection_dict = json.loads(detection_json)
+        return DetectionConfig(**detection_dict)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid detection JSON file: {str(e)}")
 
 @router.get("/")
 async def list_orders():
-    return {"message": "Raw order endpoint. Use /csv or /pdf to upload files."}
+    return {"message": "Raw order endpoint. Use /csv, /pdf or /xlsx to upload files."}
 
 @router.post("/normalize_csv", response_model=NormalizedOrder)
 async def upload_csv(
     file: UploadFile = File(..., description="CSV file to process"),
-    detection: UploadFile = File(..., description="Detection JSON configuration file")
+    detection: Optional[UploadFile] = File(None, description="Detection JSON configuration file (optional for registered formats)")
 ):
     """
     Upload a CSV file and detection JSON configuration.
     The detection JSON should contain column mapping information.
+    It can be left out when the file's format was registered via POST /raw_order/detections.
     """
     # Read and parse detection JSON file
-    try:
-        detection_contents = await detection.read()
-        detection_json = detection_contents.decode('utf-8')
-        detection_dict = json.loads(detection_json)
-        detection_config = DetectionConfig(**detection_dict)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid detection JSON file: {str(e)}")
+    detection_config = await read_detection_config(detection) if detection is not None else None
     
     # Read CSV file and process
-    
+    check_upload_size(file)
     try:
-        # contents = await file.read()
-        # normalizer = NormalizeCsvOrder(contents)
-        # converted_data = normalizer.convert_to_component_list()
-        # return converted_data 
-            # app/routers/raw_order.py (inside /normalize_csv)
-        contents = await file.read()
-        normalizer = NormalizeCsvOrder(contents, detection_config)  # pass detection_config
-        converted_data = normalizer.convert_to_component_list()
+        # stream straight from the spooled upload instead of reading it into memory
+        normalizer = NormalizeCsvOrder(file.file, detection_config)  # pass detection_config
+        converted_data = await run_in_threadpool(normalizer.convert_to_component_list)
         return converted_data
 
+    except UnknownFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DetectionMismatchError as e:
+        raise HTTPException(status_code=400, detail=f"Detection config does not fit the file: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
 
+@router.post("/detections")
+async def register_detection(
+    file: UploadFile = File(..., description="Sample CSV file of the format"),
+    detection: UploadFile = File(..., description="Detection JSON configuration file"),
+    name: str = Form("", description="Label for the format, e.g. the supplier")
+):
+    """
+    Register a detection config for the format of a sample file.
+    Later uploads with the same header row no longer need the detection file.
+    """
+    detection_config = await read_detection_config(detection)
+    check_upload_size(file)
+    try:
+        header = await run_in_threadpool(NormalizeCsvOrder(file.file, detection_config).read_header)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read CSV header: {str(e)}")
+
+    registry = get_detection_registry()
+    try:
+        # compile once so a config that does not fit the file is rejected now, not per upload
+        registry.plan_for(header, detection_config)
+    except DetectionMismatchError as e:
+        raise HTTPException(status_code=400, detail=f"Detection config does not fit the file: {str(e)}")
+    fingerprint = await run_in_threadpool(registry.register, header, detection_config, name)
+    return {"fingerprint": fingerprint, "name": name, "n_columns": len(header)}
+
+@router.get("/detections")
+async def list_detections():
+    registry = get_detection_registry()
+    return {"detections": registry.list(), "stats": registry.stats()}
+
 @router.post("/normalize_pdf", response_model=NormalizedOrder) 
 async def upload_pdf(
     file: UploadFile = File(..., description="PDF file to process"),
-    detection: UploadFile = File(..., description="Detection JSON configuration file")
+    detection: Optional[UploadFile] = File(None, description="Detection JSON configuration file (optional for registered formats)")
 ):
     """
     Upload a PDF file and detection JSON configuration.
-    The detection JSON should contain column mapping information.
+    The detection JSON should contain column mapping information,
+    column indexes refer to the columns of the tables in the PDF.
     """
     # Read and parse detection JSON file
-    try:
-        detection_contents = await detection.read()
-        detection_json = detection_contents.decode('utf-8')
-        detection_dict = json.loads(detection_json)
-        detection_config = DetectionConfig(**detection_dict)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid detection JSON file: {str(e)}")
+    detection_config = await read_detection_config(detection) if detection is not None else None
     
     # Read PDF file and process
+    check_upload_size(file)
+    try:
+        # pages are extracted in worker processes, the event loop only waits
+        normalizer = NormalizePDFOrder(file.file, detection_config)
+        normalized_data = await run_in_threadpool(normalizer.convert_to_component_list)
+        return normalized_data
+    except UnknownFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DetectionMismatchError as e:
+        raise HTTPException(status_code=400, detail=f"Detection config does not fit the file: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
+
+@router.post("/normalize_xlsx", response_model=NormalizedOrder)
+async def upload_xlsx(
+    file: UploadFile = File(..., description="XLSX file to process"),
+    detection: Optional[UploadFile] = File(None, description="Detection JSON configuration file (optional for registered formats)")
+):
+    """
+    Upload an XLSX workbook and detection JSON configuration.
+    The detection JSON is applied to every visible sheet,
+    sheets it does not fit are skipped.
+    """
+    # Read and parse detection JSON file
+    detection_config = await read_detection_config(detection) if detection is not None else None
+
+    # Read XLSX file and process
+    check_upload_size(file)
     try:
-        contents = await file.read() 
-        normalizer = NormalizePDFOrder(contents)
-        normalized_data = normalizer.convert_to_component_list()
+        # sheets are streamed from the spooled upload, no full workbook in memory
+        normalizer = NormalizeXlsxOrder(file.file, detection_config)
+        normalized_data = await run_in_threadpool(normalizer.convert_to_component_list)
         return normalized_data
+    except UnknownFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DetectionMismatchError as e:
+        raise HTTPException(status_code=400, detail=f"Detection config does not fit the file: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing PDF: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error processing XLSX: {str(e)}")
+
+
+async def start_conversion(source: BinaryIO, filename: str, detection_config: Optional[DetectionConfig],
+                           resources: ConversionResources):
+    """Starts the pipeline; parse errors become 400 / 500 before any output."""
+    try:
+        return await convert_raw_order(make_normalizer(source, filename, detection_config), resources)
+    except UnknownFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DetectionMismatchError as e:
+        raise HTTPException(status_code=400, detail=f"Detection config does not fit the file: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
+
+
+@convert_router.post("/convert_internal", response_model=List[ConvertedProduct])
+async def convert_internal(
+    file: UploadFile = File(..., description="CSV, PDF or XLSX file to process"),
+    detection: Optional[UploadFile] = File(None, description="Detection JSON configuration file (optional for registered formats)"),
+    resources: ConversionResources = Depends(conversion_resources)
+):
+    """
+    Raw file straight to internal candidates in one request:
+    same result as /raw_order/normalize_* followed by /normalized_order/convert_internal,
+    but each line is converted as soon as it has been parsed.
+    """
+    detection_config = await read_detection_config(detection) if detection is not None else None
+    check_upload_size(file)
+    converted_lines = await start_conversion(file.file, file.filename, detection_config, resources)
+    converted = [item async for item in converted_lines]
+    return sorted(converted, key=lambda item: item.pre_convert.id)
+
+
+@convert_router.post("/convert_internal/stream")
+async def convert_internal_stream(
+    file: UploadFile = File(..., description="CSV, PDF or XLSX file to process"),
+    detection: Optional[UploadFile] = File(None, description="Detection JSON configuration file (optional for registered formats)"),
+    resources: ConversionResources = Depends(conversion_resources)
+):
+    """
+    Same pipeline as /raw_order/convert_internal, streamed as NDJSON
+    (one ConvertedProduct per line, completion order, place each by pre-convert.id).
+    """
+    detection_config = await read_detection_config(detection) if detection is not None else None
+    check_upload_size(file)
+    # form files are closed when this function returns, the stream outlives it
+    source = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    await run_in_threadpool(shutil.copyfileobj, file.file, source)
+    source.seek(0)
+    try:
+        converted_lines = await start_conversion(source, file.filename, detection_config, resources)
+    except BaseException:
+        source.close()
+        raise
+
+    async def ndjson():
+        try:
+            async for converted in converted_lines:
+                yield json.dumps(converted.model_dump(mode="json", by_alias=True), ensure_ascii=False) + "\n"
+        finally:
+            await converted_lines.aclose()
+            source.close()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
@@ -18,3 +18,5 @@ class MixedColumn(BaseModel):
 class DetectionConfig(BaseModel):
     mixed: MixedColumn
     quantity_col: int  # 0-based index
+    code_col: Optional[int] = None  # 0-based index of the product code (品番) column, optional
+    header_keywords: Optional[List[str]] = None  # names containing these are header rows; default list when omitted
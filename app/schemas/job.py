@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import List, Literal, Optional
+
+from app.schemas.converted_order import ConvertedProduct
+
+class JobStatus(BaseModel):
+    id: str
+    kind: Literal["file", "normalized"]
+    status: Literal["queued", "running", "done", "failed"]
+    filename: Optional[str] = None
+    total_lines: Optional[int] = None  # unknown while a file job is still being parsed
+    done_lines: int = 0
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class JobList(BaseModel):
+    jobs: List[JobStatus]
+
+class JobResult(BaseModel):
+    job: JobStatus
+    records: List[ConvertedProduct]  # finished lines so far, in line order
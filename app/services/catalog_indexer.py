@@ -0,0 +1,247 @@
+# services/catalog_indexer.py
+# loads the internal catalog CSV (internal_product_id, internal_product_name, any other columns)
+# into the Pinecone index that QueryProductNames searches, incrementally:
+# a manifest keeps a content hash per vector, so a re-run embeds and upserts only new rows,
+# updates the metadata of changed rows and deletes the vectors of removed rows
+#   python -m app.services.catalog_indexer data/catalog.csv --dry-run
+#   python -m app.services.catalog_indexer data/catalog.csv
+import codecs
+import csv
+import hashlib
+import json
+import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from app.dependencies.upstream_scheduler import get_scheduler
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+CATALOG_MANIFEST_PATH = os.getenv("CATALOG_MANIFEST_PATH", ".cache/catalog_manifest.json")
+# rows read, compared and embedded together
+CATALOG_CHUNK_ROWS = int(os.getenv("CATALOG_CHUNK_ROWS", "8192"))
+# vectors per upsert request (Pinecone allows 2 MB per request, ~100 x 1536 floats)
+CATALOG_UPSERT_BATCH = int(os.getenv("CATALOG_UPSERT_BATCH", "100"))
+CATALOG_DELETE_BATCH = 1000
+# parallel embedding / upsert requests (further limited by the upstream schedulers)
+CATALOG_CONCURRENCY = int(os.getenv("CATALOG_CONCURRENCY", "8"))
+
+logger = logging.getLogger(__name__)
+
+
+def detect_encoding(path: str, chunk_size: int = 1 << 20) -> str:
+    """utf-8-sig when the whole file decodes as UTF-8, cp932 otherwise (read in chunks, never held in memory)."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    with open(path, "rb") as f:
+        try:
+            while chunk := f.read(chunk_size):
+                decoder.decode(chunk)
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            return "cp932"
+    return "utf-8-sig"
+
+
+def iter_catalog_rows(path: str) -> Iterator[Dict[str, str]]:
+    """Catalog rows with a name, columns stripped; empty columns are left out."""
+    with open(path, encoding=detect_encoding(path), errors="replace", newline="") as f:
+        for row in csv.DictReader(f):
+            row = {key.strip(): (value or "").strip() for key, value in row.items() if key and (value or "").strip()}
+            if row.get("internal_product_name"):
+                yield row
+
+
+def vector_id(row: Dict[str, str]) -> str:
+    """
+    Stable id from product id and name: the embedded text is part of the identity,
+    so a row whose other columns change keeps its vector and only gets new metadata.
+    """
+    key = f"{row.get('internal_product_id', '')}\t{row['internal_product_name']}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def content_hash(row: Dict[str, str]) -> str:
+    return hashlib.sha1(json.dumps(row, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class CatalogManifest:
+    """vector id -> content hash of what the index holds, plus the embedding settings it was built with."""
+
+    def __init__(self, path: str = CATALOG_MANIFEST_PATH):
+        self.path = Path(path)
+        self.settings: Dict = {}
+        self.rows: Dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.settings = data.get("settings", {})
+            self.rows = data.get("rows", {})
+
+    def save(self):
+        # written next to the target and renamed, a crash never leaves half a manifest
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"settings": self.settings, "rows": self.rows}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+
+class CatalogIndexer:
+    def __init__(self, backend=None, openai_client=None, manifest: Optional[CatalogManifest] = None,
+                 concurrency: int = CATALOG_CONCURRENCY, dry_run: bool = False):
+        # clients are only needed when something is written
+        self.backend = backend
+        self.openai_client = openai_client
+        self.manifest = manifest or CatalogManifest()
+        self.dry_run = dry_run
+        self._executor = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="catalog")
+        self._pending: List[Future] = []
+        self._max_pending = 4 * max(1, concurrency)
+        self.counts = {"rows": 0, "unchanged": 0, "new": 0, "changed": 0, "removed": 0}
+        # re-embed rows the manifest already knows
+        self.force = False
+
+    def _settings(self) -> Dict:
+        from app.dependencies.vector_database import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL
+
+        return {"model": EMBEDDING_MODEL, "dimensions": EMBEDDING_DIMENSIONS}
+
+    def _submit(self, fn, *args):
+        # bounded: the next chunk is read only while the index keeps up
+        self._pending.append(self._executor.submit(fn, *args))
+        while len(self._pending) > self._max_pending:
+            self._pending.pop(0).result()
+
+    def _drain(self):
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def _embed_and_upsert(self, rows: List[Tuple[str, Dict[str, str]]]):
+        from app.dependencies.vector_database import embed_batch, split_embedding_batches
+
+        names = [row["internal_product_name"] for _, row in rows]
+        start = 0
+        # large embedding batches in parallel, each followed by its upserts
+        futures = []
+        for batch in split_embedding_batches(names):
+            futures.append((start, self._executor.submit(embed_batch, self.openai_client, batch)))
+            start += len(batch)
+        for offset, future in futures:
+            vectors = future.result()
+            records = [{"id": vid, "values": vector, "metadata": row}
+                       for (vid, row), vector in zip(rows[offset:offset + len(vectors)], vectors)]
+            for i in range(0, len(records), CATALOG_UPSERT_BATCH):
+                self._submit(self._upsert, records[i:i + CATALOG_UPSERT_BATCH])
+
+    def _upsert(self, records: List[Dict]):
+        get_scheduler("vector").call(lambda: self.backend.upsert(records))
+
+    def _update(self, vid: str, row: Dict[str, str]):
+        get_scheduler("vector").call(lambda: self.backend.update_metadata(vid, row))
+
+    def _delete(self, ids: List[str]):
+        get_scheduler("vector").call(lambda: self.backend.delete(ids))
+
+    def _sync_chunk(self, chunk: List[Dict[str, str]], seen: Set[str], updated: Dict[str, str]):
+        new_rows = []
+        for row in chunk:
+            vid = vector_id(row)
+            if vid in seen:
+                # the same product listed twice, the first row wins
+                continue
+            seen.add(vid)
+            digest = content_hash(row)
+            known = None if self.force else self.manifest.rows.get(vid)
+            if known == digest:
+                self.counts["unchanged"] += 1
+                continue
+            self.counts["new" if known is None else "changed"] += 1
+            updated[vid] = digest
+            if self.dry_run:
+                continue
+            if known is None:
+                new_rows.append((vid, row))
+            else:
+                self._submit(self._update, vid, row)
+        if new_rows:
+            self._embed_and_upsert(new_rows)
+
+    def sync(self, path: str, full: bool = False) -> Dict[str, int]:
+        """
+        Bring the index in line with the catalog at path. full, or a manifest written with
+        another embedding model / dimension, re-embeds every row. The manifest is saved only
+        after every write succeeded; an interrupted run is repeated (upserts are idempotent).
+        """
+        settings = self._settings()
+        # vectors of another model / dimension are overwritten (same ids); removed rows are still deleted
+        self.force = full or self.manifest.settings != settings
+        if self.force and self.manifest.rows:
+            logger.info("embedding settings changed or --full: re-embedding every row")
+        started = time.perf_counter()
+        seen: Set[str] = set()
+        updated: Dict[str, str] = {}
+        chunk: List[Dict[str, str]] = []
+        try:
+            for row in iter_catalog_rows(path):
+                self.counts["rows"] += 1
+                chunk.append(row)
+                if len(chunk) >= CATALOG_CHUNK_ROWS:
+                    self._sync_chunk(chunk, seen, updated)
+                    chunk = []
+                    logger.info("%d rows read (%d new, %d changed)", self.counts["rows"],
+                                self.counts["new"], self.counts["changed"])
+            self._sync_chunk(chunk, seen, updated)
+
+            removed = [vid for vid in self.manifest.rows if vid not in seen]
+            self.counts["removed"] = len(removed)
+            if not self.dry_run:
+                for i in range(0, len(removed), CATALOG_DELETE_BATCH):
+                    self._submit(self._delete, removed[i:i + CATALOG_DELETE_BATCH])
+            self._drain()
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+        if not self.dry_run:
+            for vid in removed:
+                del self.manifest.rows[vid]
+            self.manifest.rows.update(updated)
+            self.manifest.settings = settings
+            self.manifest.save()
+        self.counts["seconds"] = round(time.perf_counter() - started, 1)
+        return self.counts
+
+
+def sync_catalog(path: str, manifest_path: str = CATALOG_MANIFEST_PATH, full: bool = False,
+                 dry_run: bool = False) -> Dict[str, int]:
+    backend = openai_client = None
+    if not dry_run:
+        from app.dependencies.llm import get_openai_client
+        from app.dependencies.vector_backends import PineconeBackend
+
+        backend, openai_client = PineconeBackend(), get_openai_client()
+    indexer = CatalogIndexer(backend, openai_client, CatalogManifest(manifest_path), dry_run=dry_run)
+    return indexer.sync(path, full=full)
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.dependencies.metrics import configure_logging
+
+    ap = argparse.ArgumentParser(description="Load the internal catalog CSV into the Pinecone index incrementally.")
+    ap.add_argument("csv_path")
+    ap.add_argument("--manifest", default=CATALOG_MANIFEST_PATH)
+    ap.add_argument("--full", action="store_true", help="ignore the manifest and re-embed every row")
+    ap.add_argument("--dry-run", action="store_true", help="only count new / changed / removed rows")
+    args = ap.parse_args()
+
+    configure_logging()
+    counts = sync_catalog(args.csv_path, args.manifest, full=args.full, dry_run=args.dry_run)
+    print(json.dumps(counts))
+    if not args.dry_run and (counts["new"] or counts["changed"] or counts["removed"]):
+        print("reload the product code / n-gram indexes: POST /normalized_order/product_codes/reload")
@@ -0,0 +1,201 @@
+# services/detection_registry.py
+# server-side store of detection configs keyed by a header fingerprint,
+# plus compiled extraction plans so known formats skip validation and column resolution
+import hashlib
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# settings
+from dotenv import load_dotenv
+import os
+
+from app.schemas.detection import DetectionConfig
+# plan cache hit rate on /metrics
+from app.dependencies.metrics import register_cache
+
+load_dotenv()
+DETECTION_REGISTRY_PATH = os.getenv("DETECTION_REGISTRY_PATH", "data/detection_registry.json")
+PLAN_CACHE_ITEMS = int(os.getenv("PLAN_CACHE_ITEMS", "256"))
+
+# rows whose name contains one of these are table headers, not products
+HEADER_KEYWORDS = ["名称", "規格", "数量", "単位", "金額", "備考"]
+
+
+class UnknownFormatError(ValueError):
+    """No detection file was given and the header fingerprint is not registered."""
+
+
+class DetectionMismatchError(IndexError):
+    """The detection config refers to columns the file does not have."""
+
+
+def header_fingerprint(header: List[str]) -> str:
+    """Column count plus the NFKC-normalized cells of the first record."""
+    cells = [unicodedata.normalize("NFKC", str(cell)).strip() for cell in header]
+    raw = f"{len(cells)}\x1f" + "\x1f".join(cells)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ExtractionPlan:
+    """
+    A DetectionConfig resolved against one table layout:
+    column positions are absolute and in range, the code column is known.
+    """
+
+    def __init__(self, name_type: str, name_cols: List[int], name_sep: str, quantity_col: int,
+                 code_cols: List[int], n_columns: int, header_keywords: List[str]):
+        self.name_type = name_type
+        self.name_cols = name_cols
+        self.name_sep = name_sep
+        self.quantity_col = quantity_col
+        self.code_cols = code_cols
+        self.n_columns = n_columns
+        self.header_keywords = header_keywords
+
+    @property
+    def usecols(self) -> List[int]:
+        """The only columns the parser needs to materialize."""
+        return sorted(set(self.name_cols + [self.quantity_col] + self.code_cols))
+
+
+def compile_plan(config: DetectionConfig, header: List[str]) -> ExtractionPlan:
+    n_columns = len(header)
+
+    def resolve(c: int) -> int:
+        # same meaning as positional (iloc) access on the full table
+        position = c + n_columns if c < 0 else c
+        if not 0 <= position < n_columns:
+            raise DetectionMismatchError(f"column {c} is out of range, the file has {n_columns} columns")
+        return position
+
+    mixed = config.mixed
+    name_cols = [resolve(c) for c in (mixed.cols if mixed.type == "concat" else mixed.cols[:1])]
+
+    code_cols = []
+    if config.code_col is not None:
+        # an out of range code column means "no code", not an error
+        code_col = config.code_col + n_columns if config.code_col < 0 else config.code_col
+        if 0 <= code_col < n_columns:
+            code_cols = [code_col]
+
+    return ExtractionPlan(
+        name_type=mixed.type,
+        name_cols=name_cols,
+        name_sep=mixed.sep or "",
+        quantity_col=resolve(config.quantity_col),
+        code_cols=code_cols,
+        n_columns=n_columns,
+        header_keywords=list(config.header_keywords or HEADER_KEYWORDS),
+    )
+
+
+class DetectionRegistry:
+    def __init__(self, path: Optional[str] = DETECTION_REGISTRY_PATH, plan_cache_items: int = PLAN_CACHE_ITEMS):
+        """path=None keeps registrations in memory only."""
+        self.path = Path(path) if path else None
+        self.plan_cache_items = plan_cache_items
+        self._entries: Dict[str, dict] = {}
+        self._configs: Dict[str, DetectionConfig] = {}
+        self._plans: "OrderedDict[Tuple[str, str], ExtractionPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.plan_hits = 0
+        self.plan_misses = 0
+        self._load()
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return
+        with open(self.path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for fingerprint, entry in entries.items():
+            # validated once here, never again per request
+            self._configs[fingerprint] = DetectionConfig(**entry["detection"])
+            self._entries[fingerprint] = entry
+
+    def _save(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+
+    def register(self, header: List[str], config: DetectionConfig, name: str = "") -> str:
+        fingerprint = header_fingerprint(header)
+        with self._lock:
+            self._entries[fingerprint] = {
+                "name": name,
+                "n_columns": len(header),
+                "detection": config.model_dump(),
+            }
+            self._configs[fingerprint] = config
+            # the plan compiled from the previous config of this format is stale
+            self._plans.pop((fingerprint, ""), None)
+            self._save()
+        return fingerprint
+
+    def get(self, fingerprint: str) -> Optional[DetectionConfig]:
+        return self._configs.get(fingerprint)
+
+    def list(self) -> List[dict]:
+        with self._lock:
+            return [{"fingerprint": fingerprint, **entry} for fingerprint, entry in self._entries.items()]
+
+    def plan_for(self, header: List[str], config: Optional[DetectionConfig] = None) -> ExtractionPlan:
+        """
+        Compiled plan for a table with this header row.
+        Without config the registered config of the header fingerprint is used.
+        """
+        fingerprint = header_fingerprint(header)
+        if config is None:
+            config = self._configs.get(fingerprint)
+            if config is None:
+                raise UnknownFormatError(
+                    f"Unknown file format (fingerprint {fingerprint}); upload a detection JSON file"
+                )
+            key = (fingerprint, "")
+        else:
+            key = (fingerprint, config.model_dump_json())
+
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                self.plan_hits += 1
+                return plan
+            self.plan_misses += 1
+
+        plan = compile_plan(config, header)
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > self.plan_cache_items:
+                self._plans.popitem(last=False)
+        return plan
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "formats": len(self._entries),
+                "plans": len(self._plans),
+                "plan_hits": self.plan_hits,
+                "plan_misses": self.plan_misses,
+            }
+
+
+# Create and reuse a single registry instance
+_detection_registry: Optional[DetectionRegistry] = None
+_detection_registry_lock = threading.Lock()
+
+
+def get_detection_registry() -> DetectionRegistry:
+    global _detection_registry
+    with _detection_registry_lock:
+        if _detection_registry is None:
+            _detection_registry = registry = DetectionRegistry()
+            register_cache("detection_plan", lambda: (registry.plan_hits, registry.plan_misses, len(registry._plans)))
+        return _detection_registry
@@ -0,0 +1,130 @@
+# services/embedding_eval.py
+# how much matching quality shorter / quantized embeddings cost on our catalog:
+# for every dimension x storage dtype, recall@k against the full-precision search,
+# memory of the vectors and local query latency
+#   python -m app.services.embedding_eval                                   # catalog rows as queries
+#   python -m app.services.embedding_eval --queries names.txt --dims 1536,512,256 --json eval.json
+import argparse
+import json
+import math
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.dependencies.vector_backends import LOCAL_VECTOR_SNAPSHOT, LocalVectorIndex, write_snapshot
+from app.dependencies.vector_quantization import VECTOR_DTYPES, reduce_dimensions
+
+
+def full_precision_matrix(index: LocalVectorIndex) -> np.ndarray:
+    """The snapshot's vectors as float32 (quantized snapshots are widened, which makes a weaker reference)."""
+    matrix = np.asarray(index.vectors, dtype=np.float32)
+    if index.scales is not None:
+        matrix = matrix * index.scales[:, None]
+    return reduce_dimensions(matrix, None)
+
+
+def embed_queries(names: List[str]) -> np.ndarray:
+    from app.dependencies.llm import get_openai_client
+    from app.dependencies.vector_database import request_embeddings
+
+    return np.asarray(request_embeddings(get_openai_client(), names), dtype=np.float32)
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def evaluate(reference: np.ndarray, queries: np.ndarray, exclude: Optional[List[int]], dims: List[int],
+             dtypes: List[str], top_k: int = 10) -> List[Dict]:
+    """
+    reference: catalog vectors (float32, unit rows); queries: full-dimension query vectors;
+    exclude: per query a catalog row left out of both result lists (the query's own row), or None.
+    """
+    queries = reduce_dimensions(queries, None)
+    extra = 1 if exclude is not None else 0
+    truth = []
+    for i, query in enumerate(queries):
+        scores = reference @ query
+        if exclude is not None:
+            scores[exclude[i]] = -np.inf
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        truth.append(set(top.tolist()))
+
+    ids = [str(i) for i in range(reference.shape[0])]
+    metadata = [{}] * reference.shape[0]
+    results = []
+    for dimensions in dims:
+        for dtype in dtypes:
+            with tempfile.TemporaryDirectory() as snapshot_dir:
+                write_snapshot(snapshot_dir, ids, reference, metadata, dtype=dtype, dimensions=dimensions)
+                index = LocalVectorIndex(snapshot_dir)
+                recalls, latencies = [], []
+                for i, query in enumerate(queries):
+                    start = time.perf_counter()
+                    matches = index.query(query, top_k=top_k + extra)["matches"]
+                    latencies.append(time.perf_counter() - start)
+                    found = [int(m["id"]) for m in matches if exclude is None or int(m["id"]) != exclude[i]]
+                    recalls.append(len(truth[i] & set(found[:top_k])) / top_k)
+                result = {
+                    "dimensions": index.dimension,
+                    "dtype": dtype,
+                    f"recall@{top_k}": round(float(np.mean(recalls)), 4),
+                    "bytes_per_vector": round(index.nbytes / reference.shape[0], 1),
+                    "memory_mb": round(index.nbytes / 1024 / 1024, 2),
+                    "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                    "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+                }
+                del index
+            print(f"{result['dimensions']:>6} {dtype:<8} {result[f'recall@{top_k}']:>10.4f} "
+                  f"{result['bytes_per_vector']:>9.0f} {result['memory_mb']:>10.2f} "
+                  f"{result['p50_ms']:>8.3f} {result['p95_ms']:>8.3f}", flush=True)
+            results.append(result)
+    return results
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Recall / memory / latency of reduced and quantized embeddings")
+    parser.add_argument("--snapshot", default=LOCAL_VECTOR_SNAPSHOT,
+                        help="full-precision local snapshot (python -m app.dependencies.vector_backends export)")
+    parser.add_argument("--queries", help="text file with one product name per line (embedded with the API); "
+                                          "default: a sample of catalog rows, each excluded from its own results")
+    parser.add_argument("--sample", type=int, default=500, help="catalog rows used as queries")
+    parser.add_argument("--dims", default="1536,1024,512,256")
+    parser.add_argument("--dtypes", default=",".join(VECTOR_DTYPES))
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    index = LocalVectorIndex(args.snapshot)
+    reference = full_precision_matrix(index)
+    if args.queries:
+        with open(args.queries, encoding="utf-8") as f:
+            names = [line.strip() for line in f if line.strip()]
+        queries, exclude = embed_queries(names), None
+        if queries.shape[1] < reference.shape[1]:
+            raise SystemExit(f"query vectors have {queries.shape[1]} dimensions, the snapshot {reference.shape[1]}: "
+                             f"set EMBEDDING_DIMENSIONS={reference.shape[1]}")
+    else:
+        rng = np.random.default_rng(args.seed)
+        exclude = rng.choice(reference.shape[0], size=min(args.sample, reference.shape[0]), replace=False).tolist()
+        queries = reference[exclude]
+    dims = sorted({min(int(d), reference.shape[1]) for d in args.dims.split(",") if d.strip()}, reverse=True)
+    dtypes = [d.strip() for d in args.dtypes.split(",") if d.strip()]
+
+    print(f"{reference.shape[0]} catalog vectors x {reference.shape[1]}, {len(queries)} queries, "
+          f"recall against float32 / {reference.shape[1]} dimensions")
+    print(f"{'dims':>6} {'dtype':<8} {f'recall@{args.top_k}':>10} {'bytes/vec':>9} {'memory MB':>10} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    results = evaluate(reference, queries, exclude, dims, dtypes, args.top_k)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "catalog_size": reference.shape[0], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# services/job_runner.py
+# background workers for queued conversion jobs (see dependencies/job_store.py)
+# runs inside the web app (JOB_WORKERS > 0) or standalone: python -m app.services.job_runner
+import asyncio
+import json
+import logging
+import time
+from typing import List, Optional, Tuple
+
+# settings
+from dotenv import load_dotenv
+import os
+
+from app.dependencies.job_store import JobStore, get_job_store
+from app.schemas.normalized_order import NormalizedOrder
+from app.schemas.detection import DetectionConfig
+from app.services.order_converter import ConvertProduct
+from app.services.order_pipeline import convert_raw_order, make_normalizer
+
+load_dotenv()
+# jobs converted at the same time by one process (0 = this process only queues)
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# idle workers look for jobs queued by other processes this often
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# finished lines are written in groups of this size, or after this many seconds
+JOB_PROGRESS_LINES = int(os.getenv("JOB_PROGRESS_LINES", "50"))
+JOB_PROGRESS_SECONDS = float(os.getenv("JOB_PROGRESS_SECONDS", "1"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+
+logger = logging.getLogger(__name__)
+
+
+class JobRunner:
+    def __init__(self, store: JobStore, workers: int = JOB_WORKERS):
+        self.store = store
+        self.workers = workers
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """Start the worker tasks on the running event loop."""
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        # interrupted jobs stay "running" and are picked up again once their heartbeat is stale
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """A job was queued: wake an idle worker instead of waiting for the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                job = await loop.run_in_executor(None, self.store.claim_next)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_SECONDS)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self.run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # e.g. the job database is locked or the disk is full: keep the worker, retry later
+                logger.exception("job worker error, retrying in %.1fs", JOB_POLL_SECONDS)
+                await asyncio.sleep(JOB_POLL_SECONDS)
+
+    async def run_job(self, job: dict):
+        loop = asyncio.get_running_loop()
+        job_id = job["id"]
+        heartbeat = asyncio.ensure_future(self._heartbeat(job_id))
+        try:
+            total_lines = await self._convert(job)
+            await loop.run_in_executor(None, self.store.finish, job_id, total_lines)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("job %s failed: %s", job_id, e)
+            await loop.run_in_executor(None, self.store.fail, job_id, str(e))
+        else:
+            # results are in the store now, the uploaded input is no longer needed
+            if os.path.exists(job["input_path"]):
+                os.remove(job["input_path"])
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str):
+        # keeps a job with slow upstream calls from looking abandoned
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                await loop.run_in_executor(None, self.store.heartbeat, job_id)
+            except Exception as e:
+                # a missed beat is retried on the next one
+                logger.warning("job %s heartbeat failed: %s", job_id, e)
+
+    async def _convert(self, job: dict) -> int:
+        """Runs the conversion, writing lines as they finish. Returns the number of lines."""
+        loop = asyncio.get_running_loop()
+        job_id = job["id"]
+        with open(job["input_path"], "rb") as source:
+            if job["kind"] == "normalized":
+                order = NormalizedOrder.model_validate_json(source.read())
+                total_lines = len(order.components)
+                converted_lines = ConvertProduct(order).iter_single_order_async()
+            else:
+                detection = DetectionConfig(**json.loads(job["detection"])) if job["detection"] else None
+                total_lines = None
+                converted_lines = await convert_raw_order(make_normalizer(source, job["filename"], detection))
+
+            buffer: List[Tuple[int, str]] = []
+            done = 0
+            last_flush = time.monotonic()
+            try:
+                async for converted in converted_lines:
+                    buffer.append((
+                        converted.pre_convert.id,
+                        json.dumps(converted.model_dump(mode="json", by_alias=True), ensure_ascii=False)
+                    ))
+                    done += 1
+                    if len(buffer) >= JOB_PROGRESS_LINES or time.monotonic() - last_flush >= JOB_PROGRESS_SECONDS:
+                        await loop.run_in_executor(None, self.store.save_lines, job_id, buffer, total_lines)
+                        buffer = []
+                        last_flush = time.monotonic()
+            finally:
+                await converted_lines.aclose()
+            if buffer:
+                await loop.run_in_executor(None, self.store.save_lines, job_id, buffer, total_lines)
+        return total_lines if total_lines is not None else done
+
+
+# Create and reuse a single runner instance
+_job_runner: Optional[JobRunner] = None
+
+
+def get_job_runner() -> JobRunner:
+    global _job_runner
+    if _job_runner is None:
+        _job_runner = JobRunner(get_job_store())
+    return _job_runner
+
+
+async def _run_forever(workers: int):
+    runner = JobRunner(get_job_store(), workers=workers)
+    runner.start()
+    logger.info("job worker started with %d workers", workers)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.stop()
+
+
+if __name__ == "__main__":
+    # standalone worker process for nightly batch loads: python -m app.services.job_runner [workers]
+    import sys
+    from app.dependencies.metrics import configure_logging
+    configure_logging()
+    asyncio.run(_run_forever(int(sys.argv[1]) if len(sys.argv) > 1 else max(1, JOB_WORKERS)))
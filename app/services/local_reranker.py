@@ -0,0 +1,180 @@
+# services/local_reranker.py
+# deterministic reranking of the similarity matches of one line, and the decision whether
+# the LLM is needed at all: lines whose best match is clearly right get their candidates
+# from the match metadata in milliseconds, the rest go to GPT-4o as before
+#
+# confidence = weighted vector similarity + name similarity (char bigram Dice) + product code overlap;
+# a line skips the LLM when the best product scores >= LLM_BYPASS_MIN_SCORE and leads the best
+# *other* product by >= LLM_BYPASS_MIN_MARGIN. every decision is logged ("rerank_decision {json}")
+# only the raw cosine similarity is used as vector score: hybrid results keep it as vector_score,
+# fused / BM25 scores are on another scale, so products found by the n-gram index alone (and every
+# line in LEXICAL_SEARCH=lexical) have no vector feature and cannot be bypassed
+import json
+import logging
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Set
+
+from app.schemas.converted_order import Candidate
+from app.dependencies.embedding_cache import canonicalize_product_name
+from app.dependencies.product_code_index import normalize_product_code
+from app.dependencies.metrics import RERANK_DECISIONS
+
+# settings
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+# "on": confident lines skip the LLM, "shadow": decide and log only (every line still goes to the LLM), "off"
+# thresholds are untuned until checked against the shadow log, hence shadow by default
+LLM_BYPASS = os.getenv("LLM_BYPASS", "shadow")
+LLM_BYPASS_MIN_SCORE = float(os.getenv("LLM_BYPASS_MIN_SCORE", "0.9"))
+LLM_BYPASS_MIN_MARGIN = float(os.getenv("LLM_BYPASS_MIN_MARGIN", "0.05"))
+# weights of vector similarity, name similarity and code overlap; a missing feature
+# (no vector similarity, no code on either side) is left out and the others rescaled
+RERANK_WEIGHTS = tuple(float(w) for w in os.getenv("RERANK_WEIGHTS", "0.5,0.35,0.15").split(","))
+# candidates returned for a bypassed line, like the LLM's 1-3
+RERANK_CANDIDATES = 3
+
+logger = logging.getLogger(__name__)
+
+
+def _bigrams(text: str) -> Set[str]:
+    compact = canonicalize_product_name(text).lower().replace(" ", "")
+    if len(compact) < 2:
+        return {compact} if compact else set()
+    return {compact[i:i + 2] for i in range(len(compact) - 1)}
+
+
+def name_similarity(external_name: str, internal_name: str) -> float:
+    """Dice coefficient of the character bigrams of both names (NFKC, case and spaces ignored)."""
+    a, b = _bigrams(external_name), _bigrams(internal_name)
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def code_overlap(external_code: str, external_name: str, internal_id: str) -> Optional[float]:
+    """
+    How well the catalog id matches the line's product code (or a part number written
+    in the name). None when neither side has anything to compare.
+    """
+    internal = normalize_product_code(internal_id)
+    if not internal:
+        return None
+    external = normalize_product_code(external_code)
+    if external:
+        return 1.0 if external == internal else SequenceMatcher(None, external, internal).ratio()
+    if len(internal) >= 4 and internal in normalize_product_code(external_name):
+        return 1.0
+    return None
+
+
+def _vector_matches(search_result) -> List[Dict]:
+    """
+    (name, id, vector similarity) per product, best similarity kept for duplicates.
+    vector is None for products that only the n-gram index found.
+    """
+    if isinstance(search_result, dict):
+        matches = search_result.get("matches", [])
+    else:
+        matches = getattr(search_result, "matches", None) or []
+    best: Dict[tuple, Dict] = {}
+    for match in matches:
+        if isinstance(match, dict):
+            metadata = match.get("metadata") or {}
+            if "vector_score" in match:
+                vector = match["vector_score"]
+            elif "lexical_score" in match:
+                vector = None
+            else:
+                vector = match.get("score") or 0.0
+        else:
+            metadata, vector = match.metadata or {}, match.score or 0.0
+        name = " ".join(str(metadata.get("internal_product_name") or "").split())
+        product_id = " ".join(str(metadata.get("internal_product_id") or "").split())
+        if not name and not product_id:
+            continue
+        entry = best.setdefault((name, product_id), {
+            "internal_product_name": name, "internal_product_id": product_id, "vector": None
+        })
+        if vector is not None and (entry["vector"] is None or vector > entry["vector"]):
+            entry["vector"] = max(0.0, min(1.0, float(vector)))
+    return list(best.values())
+
+
+def score_matches(product_name: str, product_code: str, search_result) -> List[Dict]:
+    """
+    Matches of search_result with their features and combined confidence, best first.
+    Missing features (no vector similarity, no code to compare) are left out and
+    the remaining weights rescaled.
+    """
+    weights = RERANK_WEIGHTS
+    scored = []
+    for match in _vector_matches(search_result):
+        name = name_similarity(product_name, match["internal_product_name"])
+        code = code_overlap(product_code, product_name, match["internal_product_id"])
+        features = [(weights[0], match["vector"]), (weights[1], name), (weights[2], code)]
+        present = [(weight, value) for weight, value in features if value is not None]
+        confidence = sum(weight * value for weight, value in present) / sum(weight for weight, _ in present)
+        scored.append({**match, "name": name, "code": code, "confidence": confidence})
+    scored.sort(key=lambda m: m["confidence"], reverse=True)
+    return scored
+
+
+def _log_decision(product_name: str, product_code: str, decision: str, scored: List[Dict], margin: Optional[float]):
+    RERANK_DECISIONS.inc(1, decision)
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    top = scored[0] if scored else None
+    logger.info("rerank_decision %s", json.dumps({
+        "decision": decision,
+        "name": product_name,
+        "code": product_code,
+        "top": None if top is None else {
+            "name": top["internal_product_name"],
+            "id": top["internal_product_id"],
+            "confidence": round(top["confidence"], 4),
+            "vector": None if top["vector"] is None else round(top["vector"], 4),
+            "name_similarity": round(top["name"], 4),
+            "code_overlap": None if top["code"] is None else round(top["code"], 4),
+        },
+        "margin": None if margin is None else round(margin, 4),
+        "min_score": LLM_BYPASS_MIN_SCORE,
+        "min_margin": LLM_BYPASS_MIN_MARGIN,
+    }, ensure_ascii=False))
+
+
+def bypass_candidates(product_name: str, product_code: str, search_result,
+                      mode: str = LLM_BYPASS) -> Optional[List[Candidate]]:
+    """
+    Candidates built from the match metadata when the line is confident enough
+    to skip the LLM, None when it has to be reranked by the LLM.
+    """
+    if mode not in ("on", "shadow"):
+        return None
+    scored = score_matches(product_name, product_code, search_result)
+    if not scored:
+        _log_decision(product_name, product_code, "llm", scored, None)
+        return None
+    top = scored[0]
+    # other spellings of the same product are not competition
+    rivals = [m for m in scored[1:] if m["internal_product_id"] != top["internal_product_id"]]
+    margin = top["confidence"] - (rivals[0]["confidence"] if rivals else 0.0)
+    # the thresholds are meant for cosine similarities: no vector evidence, no bypass
+    confident = top["vector"] is not None and top["confidence"] >= LLM_BYPASS_MIN_SCORE \
+        and margin >= LLM_BYPASS_MIN_MARGIN
+    if mode == "shadow":
+        _log_decision(product_name, product_code, "shadow_bypass" if confident else "llm", scored, margin)
+        return None
+    _log_decision(product_name, product_code, "bypass" if confident else "llm", scored, margin)
+    if not confident:
+        return None
+    return [
+        Candidate(
+            master_id=10001 + i,
+            product_name=match["internal_product_name"],
+            product_code=match["internal_product_id"],
+            score=round(match["confidence"], 3),
+        )
+        for i, match in enumerate(scored[:RERANK_CANDIDATES])
+    ]
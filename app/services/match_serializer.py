@@ -0,0 +1,95 @@
+# services/match_serializer.py
+# compact text form of vector similarity matches for the LLM prompt
+import os
+from typing import Dict, List, Optional
+
+# tiktoken is optional: exact counts when installed, estimate otherwise
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _encoding = None
+
+MATCH_PROMPT_TOKEN_BUDGET = int(os.getenv("MATCH_PROMPT_TOKEN_BUDGET", "400"))
+MATCH_SCORE_DIGITS = int(os.getenv("MATCH_SCORE_DIGITS", "3"))
+
+MATCH_HEADER = "internal_product_name\tinternal_product_id\tscore"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Token count of text for the gpt-4o tokenizer.
+    Without tiktoken: one token per non-ASCII character (kana/kanji are
+    roughly one token each) plus one per four ASCII characters.
+    """
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    ascii_chars = len(text) - non_ascii
+    return non_ascii + (ascii_chars + 3) // 4
+
+
+def _clean(value) -> str:
+    # tabs / newlines would break the row format
+    return " ".join(str(value or "").split())
+
+
+def _similarity(match: Dict) -> Optional[float]:
+    # lexical_score without vector_score: found by the n-gram index only, its score is no similarity
+    if "lexical_score" in match and "vector_score" not in match:
+        return None
+    score = match.get("vector_score", match.get("score"))
+    return float(score or 0.0)
+
+
+def compact_matches(search_result) -> List[Dict]:
+    """
+    Reduce a vector search result to the fields the prompt uses.
+    Matches pointing at the same internal product are merged, keeping the best score.
+    score is the cosine similarity, None for products only the n-gram index found.
+    Order is the result's own (best first; fused hybrid results are not sorted by score).
+    Accepts the backend dict ({"matches": [...]}) or a Pinecone QueryResponse.
+    """
+    if isinstance(search_result, dict):
+        matches = search_result.get("matches", [])
+    else:
+        matches = getattr(search_result, "matches", None) or []
+
+    best: Dict[tuple, Dict] = {}
+    for match in matches:
+        if isinstance(match, dict):
+            metadata, score = match.get("metadata") or {}, _similarity(match)
+        else:
+            metadata, score = match.metadata or {}, float(match.score or 0.0)
+        name = _clean(metadata.get("internal_product_name"))
+        product_id = _clean(metadata.get("internal_product_id"))
+        if not name and not product_id:
+            continue
+        key = (name, product_id)
+        if key not in best:
+            best[key] = {"internal_product_name": name, "internal_product_id": product_id, "score": score}
+        elif score is not None and (best[key]["score"] is None or score > best[key]["score"]):
+            best[key]["score"] = score
+    return list(best.values())
+
+
+def serialize_matches(search_result, token_budget: Optional[int] = None) -> str:
+    """
+    Tab-separated table, best match first:
+        internal_product_name<TAB>internal_product_id<TAB>score
+    score is empty for matches found by name text only (no similarity).
+    Rows that would push the table over token_budget are dropped.
+    """
+    budget = MATCH_PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    lines = [MATCH_HEADER]
+    used = estimate_tokens(MATCH_HEADER)
+    for match in compact_matches(search_result):
+        score = "" if match["score"] is None else round(match["score"], MATCH_SCORE_DIGITS)
+        row = f"{match['internal_product_name']}\t{match['internal_product_id']}\t{score}"
+        # +1 for the newline joining rows
+        cost = estimate_tokens(row) + 1
+        if used + cost > budget:
+            break
+        lines.append(row)
+        used += cost
+    return "\n".join(lines)
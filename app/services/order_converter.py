@@ -1,57 +1,173 @@
 # services/order_converter.py (MODIFIED)
 # schemas
-from app.schemas.normalized_order import NormalizedOrder 
-from app.schemas.converted_order import ConvertedProduct, ConvertOrder, Candidate, PreConvert, Converted
+from app.schemas.normalized_order import NormalizedOrder, ConstructionComponent
+from app.schemas.converted_order import ConvertedProduct, Candidate, PreConvert, Converted
 
-# vector database  
-from app.dependencies.vector_database import QueryProductNames 
-# llm
-from app.dependencies.llm import get_openai_client 
+# shared clients: llm, vector database, product code index, conversion cache
+from app.dependencies.resources import ConversionResources, get_conversion_resources
+# a request waiting on a line another request gave up on takes it over
+from app.dependencies.result_cache import KeyReleased
+# exact product code lookup
+from app.dependencies.product_code_index import normalize_product_code
+# order-level dedupe and cross-request single-flight
+from app.dependencies.embedding_cache import canonicalize_product_name
+# compact similarity matches for the prompt
+from app.services.match_serializer import serialize_matches, estimate_tokens
+# confident lines skip the LLM
+from app.services.local_reranker import bypass_candidates
+# stage timings / token usage
+from app.dependencies.metrics import carry_context, record_tokens, timed
+# rate limits, adaptive concurrency and retries for the chat upstream
+from app.dependencies.upstream_scheduler import get_scheduler
 
 # json handling
 import json
-from typing import List 
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+# concurrency
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# blocking OpenAI / Pinecone calls run on this shared pool so the event loop stays free.
+# CONVERT_MAX_WORKERS bounds upstream calls across all requests,
+# CONVERT_MAX_CONCURRENCY bounds the lines of a single order in flight.
+CONVERT_MAX_WORKERS = int(os.getenv("CONVERT_MAX_WORKERS", "16"))
+CONVERT_MAX_CONCURRENCY = int(os.getenv("CONVERT_MAX_CONCURRENCY", "8"))
+# lines reranked together in one chat completion (1 = one call per line)
+# and the estimated prompt tokens a single batch may carry
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "10"))
+RERANK_BATCH_TOKENS = int(os.getenv("RERANK_BATCH_TOKENS", "6000"))
+# pipelined conversion: a partly filled batch is sent after this many seconds without a new line
+PIPELINE_FLUSH_SECONDS = float(os.getenv("PIPELINE_FLUSH_SECONDS", "0.2"))
+# expected completion tokens per reranked line (three candidates), reserved against OPENAI_CHAT_TPM
+COMPLETION_TOKENS_PER_LINE = 150
+_executor = ThreadPoolExecutor(max_workers=CONVERT_MAX_WORKERS, thread_name_prefix="convert")
+
+logger = logging.getLogger(__name__)
 
 class ConvertProduct: 
-    def __init__(self, normalized_order: NormalizedOrder):
+    def __init__(self, normalized_order: NormalizedOrder, max_concurrency: int = CONVERT_MAX_CONCURRENCY,
+                 resources: Optional[ConversionResources] = None):
         # assign 
         self.product_list = normalized_order.components
-        self.client = get_openai_client() 
-        self.vdatabase = QueryProductNames()  
+        self.max_concurrency = max(1, max_concurrency)
+        # application-lifetime clients, nothing is built per request
+        resources = resources or get_conversion_resources()
+        self.client = resources.client
+        self.vdatabase = resources.vdatabase
+        self.code_index = resources.code_index
+        self.result_cache = resources.result_cache
+
+    def _match_by_code(self, single_product) -> List[Candidate]:
+        """
+        Deterministic candidates for lines whose product code exists in the catalog.
+        Returns an empty list when the line has to go through the AI path.
+        """
+        matches = self.code_index.resolve(
+            single_product.external_product_code,
+            single_product.external_product_name
+        )
+        return [
+            Candidate(
+                master_id=10001 + i,
+                product_name=internal_name,
+                product_code=internal_id,
+                score=1.0
+            )
+            for i, (internal_id, internal_name) in enumerate(matches)
+        ]
+
+    def _parse_candidates(self, candidates_data: list) -> List[Candidate]:
+        # Convert to Candidate objects
+        candidates = []
+        for i, candidate in enumerate(candidates_data):
+            try:
+                # Handle different key formats
+                master_id = candidate.get('master_id', 10001 + i)
+                product_name_key = candidate.get('product-name') or candidate.get('product_name') or candidate.get('name', f"Unknown Product {i+1}")
+                product_code_key = candidate.get('product-code') or candidate.get('product_code') or candidate.get('code', f"UNK{i+1}")
+                score = float(candidate.get('score', 0.5))
+
+                candidates.append(Candidate(
+                    master_id=master_id,
+                    product_name=product_name_key,
+                    product_code=product_code_key,
+                    score=score
+                ))
+            except Exception as e:
+                logger.warning("Error parsing candidate %d: %s", i, e)
+                # Add a fallback candidate
+                candidates.append(Candidate(
+                    master_id=10001 + i,
+                    product_name=f"Fallback Product {i+1}",
+                    product_code=f"FB{i+1}",
+                    score=0.1
+                ))
+
+        # Ensure we always return at least one candidate
+        if not candidates:
+            candidates.append(Candidate(
+                master_id=10001,
+                product_name="No Match Found",
+                product_code="NOMATCH",
+                score=0.0
+            ))
+
+        return candidates
+
+    def _chat_completion(self, messages: List[dict], lines: int):
+        """
+        One rerank chat completion through the chat scheduler: waits for OPENAI_CHAT_RPM / TPM
+        budget and retries 429 / 5xx, so the callers' fallbacks only see errors that persisted.
+        """
+        def create():
+            with timed("llm"):
+                return self.client.chat.completions.create(
+                    model="gpt-4o-2024-08-06",
+                    messages=messages,
+                    response_format={"type": "json_object"},
+                    temperature=0.1  # Lower temperature for more consistent results
+                )
+
+        tokens = sum(estimate_tokens(message["content"]) for message in messages) + COMPLETION_TOKENS_PER_LINE * lines
+        return get_scheduler("chat").call(
+            create, tokens=tokens,
+            used_tokens=lambda response: response.usage.total_tokens if response.usage is not None else None
+        )
 
-    def _query_similar_products(self, product_name: str): 
-        pinecone_result = self.vdatabase.query_product_names(product_name) 
-        return pinecone_result 
-    
     def _convert(self, product_name: str, product_code: str, similar_products: str) -> List[Candidate]:
         prompt = (
             "🎯 Task: Given a `target_product_name` and a list of top vector similarity matches, return multiple candidate matches "
-            "with their details. Input includes target name and a list of matches (each with external_product_name, "
-            "internal_product_name, internal_product_id, and score). "
+            "with their details. Input includes target name and a tab-separated table of matches "
+            "(columns: internal_product_name, internal_product_id, score; best match first; an empty score means the "
+            "match was found by its name text, not by similarity). "
             "Rules: "
             "1. Use ONLY the provided matches from the similarity search results "
             "2. ALWAYS return at least 1-3 candidates, even if scores are low "
             "3. Generate sequential master_id numbers starting from 10001 "
             "4. Use the internal_product_name as 'product-name' and internal_product_id as 'product-code' "
-            "5. Keep the original similarity scores "
+            "5. Keep the original similarity scores, use 0 for matches without a score "
             "6. If no good matches exist, still return the top available matches "
             "Output JSON format: {\"candidates\": [{\"master_id\": 10001, \"product-name\": \"...\", \"product-code\": \"...\", \"score\": 0.96}, ...]}"
         )
 
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o-2024-08-06",
-                messages=[
-                    {"role": "system", "content": prompt},
-                    {
-                        "role": "user",
-                        "content": f"Target product name: {product_name}\nTarget product code: {product_code}\n\nSimilarity matches:\n{similar_products}",
-                    },
-                ],
-                response_format={"type": "json_object"},
-                temperature=0.1  # Lower temperature for more consistent results
-            )
-            
+            response = self._chat_completion([
+                {"role": "system", "content": prompt},
+                {
+                    "role": "user",
+                    "content": f"Target product name: {product_name}\nTarget product code: {product_code}\n\nSimilarity matches:\n{similar_products}",
+                },
+            ], lines=1)
+
+            record_tokens(response.usage)
+            if response.usage is not None:
+                logger.debug("prompt_tokens: %d (similarity matches ~%d), completion_tokens: %d",
+                             response.usage.prompt_tokens, estimate_tokens(similar_products),
+                             response.usage.completion_tokens)
+
             # Parse the JSON response
             result_json = json.loads(response.choices[0].message.content)
             
@@ -68,45 +184,10 @@ class ConvertProduct:
                         candidates_data = value
                         break
             
-            # Convert to Candidate objects
-            candidates = []
-            for i, candidate in enumerate(candidates_data):
-                try:
-                    # Handle different key formats
-                    master_id = candidate.get('master_id', 10001 + i)
-                    product_name_key = candidate.get('product-name') or candidate.get('product_name') or candidate.get('name', f"Unknown Product {i+1}")
-                    product_code_key = candidate.get('product-code') or candidate.get('product_code') or candidate.get('code', f"UNK{i+1}")
-                    score = float(candidate.get('score', 0.5))
-                    
-                    candidates.append(Candidate(
-                        master_id=master_id,
-                        product_name=product_name_key,
-                        product_code=product_code_key,
-                        score=score
-                    ))
-                except Exception as e:
-                    print(f"Error parsing candidate {i}: {e}")
-                    # Add a fallback candidate
-                    candidates.append(Candidate(
-                        master_id=10001 + i,
-                        product_name=f"Fallback Product {i+1}",
-                        product_code=f"FB{i+1}",
-                        score=0.1
-                    ))
-            
-            # Ensure we always return at least one candidate
-            if not candidates:
-                candidates.append(Candidate(
-                    master_id=10001,
-                    product_name="No Match Found",
-                    product_code="NOMATCH",
-                    score=0.0
-                ))
-            
-            return candidates
+            return self._parse_candidates(candidates_data)
             
         except Exception as e:
-            print(f"Error in _convert method: {e}")
+            logger.warning("Error in _convert method: %s", e)
             # Return a fallback candidate in case of complete failure
             return [Candidate(
                 master_id=10001,
@@ -115,38 +196,131 @@ class ConvertProduct:
                 score=0.0
             )]
 
-    def _convert_single_product(self, single_product: dict, product_index: int) -> ConvertedProduct: 
-        # Extract data from the product
-        external_name = single_product.external_product_name
-        external_code = single_product.external_product_code
-        quantity = single_product.quantities
-        
-        # Get similar products
-        similar_products = str(self._query_similar_products(external_name))
-        
-        # Convert and get candidates
-        candidates = self._convert(external_name, external_code, similar_products)
-        
+    def _debug_print(self, single_product, product_index: int, similar_products: str, candidates: List[Candidate]):
+        # matches + candidates of every line, only at LOG_LEVEL=DEBUG
+        if not logger.isEnabledFor(logging.DEBUG):
+            return
+        logger.debug(
+            "Product #%d\nexternal_name: %s\nexternal_code: %s\nsimilar_products: %s\ncandidates:\n%s",
+            product_index,
+            single_product.external_product_name,
+            single_product.external_product_code,
+            similar_products,
+            "\n".join(f"    {c.model_dump()}" for c in candidates),
+        )
+
+    def _convert_batch(self, items: list) -> Dict[int, List[Candidate]]:
+        """
+        Rerank several lines in one chat completion.
+        items: [(product_index, single_product, similar_products), ...]
+        Returns candidates per product_index. Lines missing from the answer,
+        or the whole batch when the response cannot be parsed, are left out
+        so the caller can fall back to _convert.
+        """
+        prompt = (
+            "🎯 Task: For EACH target product, return multiple candidate matches chosen from that product's own "
+            "top vector similarity matches. Input is JSON: {\"products\": [{\"id\", \"name\", \"code\", \"matches\"}]} "
+            "where matches is a tab-separated table (columns: internal_product_name, internal_product_id, score; best match first; "
+            "an empty score means the match was found by its name text, not by similarity). "
+            "Rules for every product: "
+            "1. Use ONLY that product's provided matches "
+            "2. ALWAYS return at least 1-3 candidates, even if scores are low "
+            "3. Generate sequential master_id numbers starting from 10001 "
+            "4. Use the internal_product_name as 'product-name' and internal_product_id as 'product-code' "
+            "5. Keep the original similarity scores, use 0 for matches without a score "
+            "6. If no good matches exist, still return the top available matches "
+            "7. Return exactly one result per input id "
+            "Output JSON format: {\"results\": [{\"id\": 0, \"candidates\": [{\"master_id\": 10001, \"product-name\": \"...\", \"product-code\": \"...\", \"score\": 0.96}, ...]}, ...]}"
+        )
+        products = [
+            {
+                "id": product_index,
+                "name": single_product.external_product_name,
+                "code": single_product.external_product_code,
+                "matches": similar_products,
+            }
+            for product_index, single_product, similar_products in items
+        ]
+
+        try:
+            response = self._chat_completion([
+                {"role": "system", "content": prompt},
+                {"role": "user", "content": json.dumps({"products": products}, ensure_ascii=False)},
+            ], lines=len(items))
 
+            record_tokens(response.usage)
+            if response.usage is not None:
+                logger.debug("batch of %d: prompt_tokens: %d, completion_tokens: %d",
+                             len(items), response.usage.prompt_tokens, response.usage.completion_tokens)
 
-            # --- DEBUG: print to terminal ---
-        print(f"\n[DEBUG] Product #{product_index}")
-        print(f"[DEBUG] external_name: {external_name}")
-        print(f"[DEBUG] external_code: {external_code}")
-        print(f"[DEBUG] similar_products: {similar_products}")
-        print("[DEBUG] candidates:")
-        for c in candidates:
+            result_json = json.loads(response.choices[0].message.content)
+            results = result_json.get("results", []) if isinstance(result_json, dict) else []
+        except Exception as e:
+            logger.warning("Error in _convert_batch method: %s", e)
+            return {}
+
+        expected = {product_index for product_index, _, _ in items}
+        batch_candidates = {}
+        for result in results:
             try:
-                payload = c.model_dump() if hasattr(c, "model_dump") else (
-                        c.dict() if hasattr(c, "dict") else vars(c))
+                product_index = int(result.get("id"))
+                candidates_data = result.get("candidates")
             except Exception:
-                payload = str(c)
-            print("   ", payload)
-        # --- end DEBUG ---
+                continue
+            if product_index not in expected or not isinstance(candidates_data, list) or not candidates_data:
+                continue
+            if not all(isinstance(candidate, dict) for candidate in candidates_data):
+                continue
+            batch_candidates[product_index] = self._parse_candidates(candidates_data)
+        return batch_candidates
 
+    def _rerank_batches(self, indexes: List[int], similar_products: Dict[int, str]) -> List[List[int]]:
+        """Group line indexes into rerank batches bounded by RERANK_BATCH_SIZE and RERANK_BATCH_TOKENS."""
+        batches = []
+        current = []
+        current_tokens = 0
+        for index in indexes:
+            product = self.product_list[index]
+            tokens = estimate_tokens(product.external_product_name) \
+                + estimate_tokens(product.external_product_code) \
+                + estimate_tokens(similar_products[index]) + 20  # json keys and punctuation
+            if current and (len(current) >= RERANK_BATCH_SIZE or current_tokens + tokens > RERANK_BATCH_TOKENS):
+                batches.append(current)
+                current = []
+                current_tokens = 0
+            current.append(index)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
 
+    def _convert_products(self, indexes: List[int], similar_products: Dict[int, str]) -> List[List[Candidate]]:
+        """
+        Candidates for one rerank batch, in the order of indexes.
+        Falls back to one call per line for anything the batch did not answer.
+        """
+        batch_candidates = {}
+        if len(indexes) > 1:
+            batch_candidates = self._convert_batch(
+                [(index, self.product_list[index], similar_products[index]) for index in indexes]
+            )
 
+        converted = []
+        for index in indexes:
+            product = self.product_list[index]
+            candidates = batch_candidates.get(index)
+            if not candidates:
+                candidates = self._convert(
+                    product.external_product_name, product.external_product_code, similar_products[index]
+                )
+            self._debug_print(product, index, similar_products[index], candidates)
+            converted.append(candidates)
+        return converted
 
+    def _build_converted(self, single_product, product_index: int, candidates: List[Candidate]) -> ConvertedProduct:
+        external_name = single_product.external_product_name
+        external_code = single_product.external_product_code
+        quantity = single_product.quantities
 
         # Create the new structure
         pre_convert = PreConvert(
@@ -165,10 +339,301 @@ class ConvertProduct:
             converted=converted
         )
     
-    def convert_single_order(self):
-        converted_list = []
-        for index, product in enumerate(self.product_list):   
-            converted_list.append(self._convert_single_product(product, index))
-        
-        # Return as a list directly (not wrapped in ConvertOrder)
-        return converted_list
\ No newline at end of file
+    @staticmethod
+    def _line_key(single_product) -> tuple:
+        """Lines with the same canonical name and code convert to the same candidates."""
+        return (
+            canonicalize_product_name(single_product.external_product_name),
+            normalize_product_code(single_product.external_product_code),
+        )
+
+    @staticmethod
+    def _cacheable(candidates: List[Candidate]) -> bool:
+        # failed LLM calls must not be served to later requests
+        return not any(candidate.product_code == "ERROR" for candidate in candidates)
+
+    def _plan(self):
+        """
+        Returns ({index: candidates} for lines resolved by product code,
+                 {line_key: [index, ...]} for the remaining lines, duplicates grouped).
+        Only the first line of each group is sent to embeddings + LLM.
+        """
+        code_matches = {}
+        groups: Dict[tuple, List[int]] = {}
+        for index, product in enumerate(self.product_list):
+            candidates = self._match_by_code(product)
+            if candidates:
+                code_matches[index] = candidates
+            else:
+                groups.setdefault(self._line_key(product), []).append(index)
+        return code_matches, groups
+
+    def _retrieve(self, indexes: List[int]) -> Tuple[Dict[int, List[Candidate]], Dict[int, str]]:
+        """
+        Similarity matches for the lines, then the bypass decision per line.
+        Returns ({index: candidates} of lines confident enough to skip the LLM,
+                 {index: serialized matches} of the lines the LLM reranks).
+        """
+        # embed every name in one batch instead of once per line
+        names = [self.product_list[index].external_product_name for index in indexes]
+        similar_results = self.vdatabase.query_product_names_batch(names)
+        local, similar_products = {}, {}
+        for index, result in zip(indexes, similar_results):
+            product = self.product_list[index]
+            candidates = bypass_candidates(product.external_product_name, product.external_product_code, result)
+            if candidates:
+                local[index] = candidates
+            else:
+                similar_products[index] = serialize_matches(result)
+        return local, similar_products
+
+    def _publish(self, indexes: List[int], candidates_list: List[List[Candidate]], results: dict):
+        for index, candidates in zip(indexes, candidates_list):
+            key = self._line_key(self.product_list[index])
+            results[key] = candidates
+            self.result_cache.resolve(key, candidates, cache=self._cacheable(candidates))
+
+    def _assemble(self, code_matches: dict, groups: dict, results: dict) -> List[ConvertedProduct]:
+        candidates_by_index = dict(code_matches)
+        for key, indexes in groups.items():
+            for index in indexes:
+                candidates_by_index[index] = results[key]
+        return [
+            self._build_converted(product, index, candidates_by_index[index])
+            for index, product in enumerate(self.product_list)
+        ]
+
+    async def _convert_line(self, index: int, results: dict, semaphore: asyncio.Semaphore):
+        """One line through similarity search and, unless it is bypassed, the LLM."""
+        loop = asyncio.get_running_loop()
+        local, similar_products = await loop.run_in_executor(_executor, carry_context(self._retrieve), [index])
+        if local:
+            self._publish(list(local), list(local.values()), results)
+            return
+        async with semaphore:
+            candidates_list = await loop.run_in_executor(
+                _executor, carry_context(self._convert_products), [index], similar_products
+            )
+        self._publish([index], candidates_list, results)
+
+    async def _wait_shared(self, key, index: int, future, results: dict, leaders: list,
+                           semaphore: asyncio.Semaphore):
+        """
+        Result of a line another request is computing. If that request gives up
+        (client gone, upstream error) the line is claimed again and, unless a
+        third request got there first, converted here.
+        """
+        while True:
+            try:
+                # shielded: cancelling this request must not cancel the future other requests share
+                results[key] = await asyncio.shield(asyncio.wrap_future(future))
+                return
+            except KeyReleased:
+                pass
+            hits, claimed, waiting = self.result_cache.claim([key])
+            if key in hits:
+                results[key] = hits[key]
+                return
+            if key in waiting:
+                future = waiting[key]
+                continue
+            leaders.extend(claimed)
+            await self._convert_line(index, results, semaphore)
+            return
+
+    async def iter_single_order_async(self) -> AsyncIterator[ConvertedProduct]:
+        """
+        Yields each ConvertedProduct as soon as it is ready (completion order, not input order).
+        Product-code and cached lines come first, then each rerank batch as it finishes.
+        Use pre_convert.id to place a line.
+        """
+        loop = asyncio.get_running_loop()
+        code_matches, groups = self._plan()
+        hits, leaders, waiting = self.result_cache.claim(list(groups))
+        results = dict(hits)
+        tasks = []
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        try:
+            for index, candidates in code_matches.items():
+                yield self._build_converted(self.product_list[index], index, candidates)
+            for key in hits:
+                for index in groups[key]:
+                    yield self._build_converted(self.product_list[index], index, results[key])
+
+            async def wait_shared(key, future) -> List[tuple]:
+                await self._wait_shared(key, groups[key][0], future, results, leaders, semaphore)
+                return [key]
+
+            tasks = [asyncio.ensure_future(wait_shared(key, future)) for key, future in waiting.items()]
+
+            indexes = [groups[key][0] for key in leaders]
+            if indexes:
+                local, similar_products = await loop.run_in_executor(_executor, carry_context(self._retrieve), indexes)
+                self._publish(list(local), list(local.values()), results)
+                for index in local:
+                    key = self._line_key(self.product_list[index])
+                    for same in groups[key]:
+                        yield self._build_converted(self.product_list[same], same, results[key])
+
+                async def convert_batch(batch: List[int]) -> List[tuple]:
+                    async with semaphore:
+                        candidates_list = await loop.run_in_executor(
+                            _executor, carry_context(self._convert_products), batch, similar_products
+                        )
+                    self._publish(batch, candidates_list, results)
+                    return [self._line_key(self.product_list[index]) for index in batch]
+
+                tasks += [
+                    asyncio.ensure_future(convert_batch(batch))
+                    for batch in self._rerank_batches(list(similar_products), similar_products)
+                ]
+
+            for next_done in asyncio.as_completed(tasks):
+                for key in await next_done:
+                    for index in groups[key]:
+                        yield self._build_converted(self.product_list[index], index, results[key])
+        finally:
+            # client went away or something failed: stop our batches and hand
+            # the keys others wait on over to them, our error stays with us
+            for task in tasks:
+                task.cancel()
+            unresolved = [key for key in leaders if key not in results]
+            if unresolved:
+                self.result_cache.release(unresolved)
+
+    async def convert_single_order_async(self) -> List[ConvertedProduct]:
+        """
+        Every line of the order: rerank batches run concurrently on the
+        shared worker pool (at most max_concurrency at a time).
+        Output keeps the input order.
+        """
+        converted = [item async for item in self.iter_single_order_async()]
+        return sorted(converted, key=lambda item: item.pre_convert.id)
+
+    async def iter_pipeline_async(self, components: AsyncIterator[ConstructionComponent]) -> AsyncIterator[ConvertedProduct]:
+        """
+        Converts lines while `components` is still producing them (e.g. a file
+        being normalized). Each line is numbered in arrival order, resolved right
+        away when possible (product code, repeated line, cache) and otherwise
+        queued for the next rerank batch. A batch is sent when it has
+        RERANK_BATCH_SIZE lines, after PIPELINE_FLUSH_SECONDS without a new
+        line, or when the input ends.
+        Yields in completion order, like iter_single_order_async.
+        """
+        loop = asyncio.get_running_loop()
+        self.product_list = []
+        groups: Dict[tuple, List[int]] = {}
+        results = {}
+        leaders = []
+        pending: List[int] = []
+        tasks = []
+        ready: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        flush_timer = None
+        finished = object()
+
+        def emit(key):
+            for index in groups[key]:
+                ready.put_nowait(self._build_converted(self.product_list[index], index, results[key]))
+
+        def guard(coro) -> asyncio.Future:
+            # failures surface in the consumer through the ready queue
+            async def guarded():
+                try:
+                    await coro
+                except asyncio.CancelledError:
+                    raise
+                except BaseException as e:
+                    ready.put_nowait(e)
+            return asyncio.ensure_future(guarded())
+
+        def spawn(coro):
+            tasks.append(guard(coro))
+
+        async def wait_shared(key, future):
+            await self._wait_shared(key, groups[key][0], future, results, leaders, semaphore)
+            emit(key)
+
+        async def convert_batch(indexes: List[int]):
+            local, similar_products = await loop.run_in_executor(_executor, carry_context(self._retrieve), indexes)
+            self._publish(list(local), list(local.values()), results)
+            for index in local:
+                emit(self._line_key(self.product_list[index]))
+            for batch in self._rerank_batches(list(similar_products), similar_products):
+                async with semaphore:
+                    candidates_list = await loop.run_in_executor(
+                        _executor, carry_context(self._convert_products), batch, similar_products
+                    )
+                self._publish(batch, candidates_list, results)
+                for index in batch:
+                    emit(self._line_key(self.product_list[index]))
+
+        def flush():
+            nonlocal flush_timer
+            if flush_timer is not None:
+                flush_timer.cancel()
+                flush_timer = None
+            if pending:
+                spawn(convert_batch(list(pending)))
+                pending.clear()
+
+        def add(product):
+            nonlocal flush_timer
+            index = len(self.product_list)
+            self.product_list.append(product)
+
+            candidates = self._match_by_code(product)
+            if candidates:
+                ready.put_nowait(self._build_converted(product, index, candidates))
+                return
+
+            key = self._line_key(product)
+            if key in groups:
+                # repeated line: rides on the first one
+                groups[key].append(index)
+                if key in results:
+                    ready.put_nowait(self._build_converted(product, index, results[key]))
+                return
+            groups[key] = [index]
+
+            hits, claimed, waiting = self.result_cache.claim([key])
+            if key in hits:
+                results[key] = hits[key]
+                emit(key)
+            elif key in waiting:
+                spawn(wait_shared(key, waiting[key]))
+            else:
+                leaders.extend(claimed)
+                pending.append(index)
+                if len(pending) >= RERANK_BATCH_SIZE:
+                    flush()
+                elif flush_timer is None:
+                    flush_timer = loop.call_later(PIPELINE_FLUSH_SECONDS, flush)
+
+        async def read():
+            async for product in components:
+                add(product)
+            flush()
+            # tasks only ever grows before this point
+            await asyncio.gather(*tasks)
+            ready.put_nowait(finished)
+
+        reader = guard(read())
+        try:
+            while True:
+                item = await ready.get()
+                if item is finished:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            if flush_timer is not None:
+                flush_timer.cancel()
+            reader.cancel()
+            for task in tasks:
+                task.cancel()
+            unresolved = [key for key in leaders if key not in results]
+            if unresolved:
+                self.result_cache.release(unresolved)
@@ -1,42 +1,133 @@
 # services/order_normalizer.py (finalized for deterministic quantity handling)
 import pandas as pd
-from io import StringIO
+from io import BytesIO, StringIO
+import codecs
+import io
 import json
+import os
 import re
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+# openpyxl / pdfplumber are imported where they are used, a CSV request never loads them
 
 # output structure
 from app.schemas.normalized_order import NormalizedOrder, ConstructionComponent
 from app.schemas.detection import DetectionConfig
+# registered formats / compiled plans
+from app.services.detection_registry import (
+    HEADER_KEYWORDS, DetectionMismatchError, DetectionRegistry, ExtractionPlan, UnknownFormatError,
+    get_detection_registry, header_fingerprint
+)
+# stage timings
+from app.dependencies.metrics import timed, timed_iter
+
+# streaming ingestion
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "5000"))
+SNIFF_BYTES = 64 * 1024
+READ_BLOCK_BYTES = 1024 * 1024
+
+# pdf table extraction is CPU bound, pages are spread over worker processes
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "2"))
 
 
 class NormalizeCsvOrder:
-    def __init__(self, contents: bytes, detection_config: DetectionConfig):
+    def __init__(self, contents: Union[bytes, BinaryIO], detection_config: Optional[DetectionConfig] = None,
+                 chunk_rows: int = CSV_CHUNK_ROWS, registry: Optional[DetectionRegistry] = None):
         """
-        Accepts raw CSV file content and detection JSON config.
+        Accepts raw CSV file content (bytes or a binary file object such as
+        the spooled upload) and detection JSON config.
+        Without a detection config the format is looked up in the detection
+        registry by its header fingerprint (UnknownFormatError if not registered).
         Produces structured normalized data directly (no LLM for quantities).
+        The file is decoded and parsed in chunks of chunk_rows rows, so memory
+        stays flat regardless of file size.
         """
         self.detection_config = detection_config
-        self.df = self._parse_contents(contents)
-    def _parse_contents(self, contents: bytes) -> pd.DataFrame:
+        self.stream = BytesIO(contents) if isinstance(contents, (bytes, bytearray)) else contents
+        self.chunk_rows = chunk_rows
+        self.registry = registry if registry is not None else get_detection_registry()
+        # compiled plan of the last table read
+        self.plan: Optional[ExtractionPlan] = None
+
+    def _sniff_encoding(self) -> str:
         """
-        Decodes CSV bytes and parses to DataFrame.
-        Ensures first row is treated as data, not header.
+        UTF-8 if the whole stream decodes as UTF-8, otherwise Shift-JIS.
+        The prefix decides most files; a UTF-8 looking prefix is confirmed by
+        decoding the rest block by block without keeping it.
         """
-        try:
-            decoded = contents.decode("utf-8")
-        except UnicodeDecodeError:
-            decoded = contents.decode("shift-jis", errors="ignore")
-
-        df = pd.read_csv(
-            StringIO(decoded),
-            dtype=str,
-            header=None,   # 👈 make sure first row is data
-            keep_default_na=False,
-            na_values=["", "NA", "NaN"]
+        self.stream.seek(0)
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        with timed("decode"):
+            try:
+                decoder.decode(self.stream.read(SNIFF_BYTES))
+                while True:
+                    block = self.stream.read(READ_BLOCK_BYTES)
+                    if not block:
+                        break
+                    decoder.decode(block)
+                decoder.decode(b"", final=True)
+                encoding = "utf-8"
+            except UnicodeDecodeError:
+                encoding = "shift-jis"
+        self.stream.seek(0)
+        return encoding
+
+    def _open_text(self) -> TextIO:
+        # incremental decoding straight from the binary stream, no full decoded copy
+        encoding = self._sniff_encoding()
+        return io.TextIOWrapper(
+            self.stream,
+            encoding=encoding,
+            errors="ignore" if encoding == "shift-jis" else "strict",
+            newline=""
         )
-        return df.fillna("")
 
+    def _read_header(self, text: TextIO) -> List[str]:
+        """Cells of the first record; the C parser takes the table width from it too."""
+        prefix = text.read(SNIFF_BYTES)
+        text.seek(0)
+        first = pd.read_csv(StringIO(prefix), dtype=str, header=None, nrows=1, keep_default_na=False)
+        return first.iloc[0].tolist()
 
+    def read_header(self) -> List[str]:
+        text = self._open_text()
+        try:
+            return self._read_header(text)
+        finally:
+            text.detach()
+            self.stream.seek(0)
+
+    def _iter_frames(self) -> Iterator[Tuple[pd.DataFrame, ExtractionPlan]]:
+        """
+        Yields (chunk, compiled plan) in file order.
+        Chunks keep a running row index and only hold the columns
+        the plan references.
+        """
+        text = self._open_text()
+        try:
+            self.plan = plan = self.registry.plan_for(self._read_header(text), self.detection_config)
+            reader = pd.read_csv(
+                text,
+                dtype=str,
+                header=None,   # 👈 make sure first row is data
+                keep_default_na=False,
+                na_values=["", "NA", "NaN"],
+                usecols=plan.usecols,
+                chunksize=self.chunk_rows
+            )
+            with reader:
+                # parse includes decoding the chunk's text
+                for chunk in timed_iter("parse", reader):
+                    yield chunk.fillna(""), plan
+        finally:
+            text.detach()
 
     def _extract_quantity(self, value: str) -> float:
         """
@@ -62,119 +153,325 @@ class NormalizeCsvOrder:
 
 
 
-    def _extract_code(self, row: pd.Series) -> str:
+    def _extract_quantities(self, values: pd.Series) -> pd.Series:
         """
-        Try to extract product code from known columns.
-        Works with both numeric and string column names.
+        Vectorized _extract_quantity: first integer/decimal number of every cell,
+        commas removed, 0 where there is none.
+        """
+        numbers = values.astype(str).str.replace(",", "", regex=False).str.extract(
+            r"(\d+(?:\.\d+)?)", expand=False
+        )
+        # float() (not pd.to_numeric) so full-width digits matched by \d parse the same way
+        return numbers.map(float, na_action="ignore").fillna(0.0)
+
+    def _extract_codes(self, df: pd.DataFrame, plan: ExtractionPlan) -> pd.Series:
+        """Vectorized product code per row: first non-empty value among the plan's code columns."""
+        codes = pd.Series("", index=df.index, dtype=object)
+        # walk right to left so the left-most non-empty column wins
+        for col in reversed(plan.code_cols):
+            value = df[col].astype(str).str.strip()
+            codes = value.where(value != "", codes)
+        return codes
+
+    def _extract_names(self, df: pd.DataFrame, plan: ExtractionPlan) -> pd.Series:
+        parts = [df[c].astype(str).str.strip() for c in plan.name_cols]
+        names = parts[0]
+        for part in parts[1:]:
+            names = names + plan.name_sep + part
+        return names.str.strip() if len(parts) > 1 else names
+
+    def _prepare_rows(self, df: pd.DataFrame, plan: ExtractionPlan) -> pd.DataFrame:
+        """
+        Everything that can be computed per row in bulk:
+        name, quantity, code, the next row's quantity (look-ahead) and
+        whether the row is a note. Header / empty rows are dropped here.
+        """
+        with timed("normalize"):
+            names = self._extract_names(df, plan)
+            quantities = self._extract_quantities(df[plan.quantity_col])
+            rows = pd.DataFrame({
+                "name": names,
+                "quantity": quantities,
+                "code": self._extract_codes(df, plan),
+                # look-ahead uses the raw next row, even if that row is skipped later
+                "next_quantity": quantities.shift(-1, fill_value=0.0),
+            })
+            header = (names == "") | names.str.startswith("■")
+            for keyword in plan.header_keywords:
+                header |= names.str.contains(keyword, regex=False)
+            rows["note"] = names.str.startswith("※")
+            return rows[~header]
+
+    def _iter_prepared_rows(self, frames: Iterable[Tuple[pd.DataFrame, ExtractionPlan]]) -> Iterator[pd.DataFrame]:
+        """
+        _prepare_rows per chunk. The last raw row of a chunk is held back and
+        prepended to the next one, so its look-ahead sees the real next row.
+        A chunk with a different plan starts a new table: the held back row is
+        flushed on its own first.
+        """
+        carry, carry_plan = None, None
+        for frame, plan in frames:
+            if carry is not None:
+                if plan is carry_plan:
+                    frame = pd.concat([carry, frame])
+                else:
+                    yield self._prepare_rows(carry, carry_plan)
+            rows = self._prepare_rows(frame, plan)
+            carry, carry_plan = frame.iloc[-1:], plan
+            yield rows[rows.index != frame.index[-1]]
+        if carry is not None:
+            yield self._prepare_rows(carry, carry_plan)
+
+    def _assemble_components(self, prepared: Iterable[pd.DataFrame]) -> Iterator[ConstructionComponent]:
+        """
+        Group / continuation state machine over the prepared rows.
+        - row with quantity          -> new product (previous one is emitted)
+        - note row (※...)            -> skipped
+        - next row has a quantity    -> group header, skipped
+        - anything else              -> continuation of the current product name
         """
-        for col in row.index:
-            col_name = str(col)  # 👈 ensure it's always string
-            if any(keyword in col_name.lower() for keyword in ["code", "品番", "型番", "商品コード"]):
-                value = str(row[col]).strip()
-                if value:
-                    return value
-        return ""  # fallback
-
-
-    def convert_to_component_list(self) -> NormalizedOrder:
-        components = []
-        mixed_cfg = self.detection_config.mixed
-        qty_col = self.detection_config.quantity_col
-
         current_name = None
         current_quantity = None
         current_code = None
 
-        group_context = None  # track current group name
-
-        for idx, row in self.df.iterrows():
-            # --- Build name normally ---
-            if mixed_cfg.type == "single":
-                external_name = str(row.iloc[mixed_cfg.cols[0]]).strip()
-            elif mixed_cfg.type == "concat":
-                parts = [str(row.iloc[c]).strip() for c in mixed_cfg.cols]
-                external_name = mixed_cfg.sep.join(parts).strip()
-            else:
-                external_name = ""
-
-            # --- Skip header rows ---
-            if (not external_name 
-                or any(keyword in external_name for keyword in ["名称", "規格", "数量", "単位", "金額", "備考"]) 
-                or external_name.startswith("■")):
-                continue
-
-            # --- Quantity ---
-            quantity = self._extract_quantity(row.iloc[qty_col])
-            code = self._extract_code(row)
-
-            if quantity > 0:
-                # This is a product row
-                if current_name:
-                    # flush previous product
-                    components.append(ConstructionComponent(
-                        external_product_name=current_name,
-                        external_product_code=current_code or "",
-                        quantities=current_quantity or 0
-                    ))
-                # new product
-                current_name = external_name
-                current_quantity = quantity
-                current_code = code
-
-            else:
-                # --- No quantity row ---
-
-                # Detect blank/separator row → flush current product and reset
-                if not external_name.strip() or row.isna().all():
+        for rows in prepared:
+            for name, quantity, code, next_quantity, note in zip(
+                rows["name"], rows["quantity"], rows["code"], rows["next_quantity"], rows["note"]
+            ):
+                if quantity > 0:
                     if current_name:
-                        components.append(ConstructionComponent(
+                        yield ConstructionComponent(
                             external_product_name=current_name,
                             external_product_code=current_code or "",
                             quantities=current_quantity or 0
-                        ))
-                        current_name = None
-                        current_quantity = None
-                        current_code = None
-                    continue
-
-                # Skip obvious notes / disclaimers / headers
-                if (external_name.startswith("※")
-                    or any(keyword in external_name for keyword in ["名称", "規格", "数量", "単位", "金額", "備考"])):
-                    continue
-
-                # Look ahead: is this a group header? (next row has quantity)
-                next_qty = None
-                if idx + 1 < len(self.df):
-                    next_qty = self._extract_quantity(self.df.iloc[idx + 1, qty_col])
-                if next_qty and next_qty > 0:
-                    group_context = external_name
+                        )
+                    current_name = name
+                    current_quantity = quantity
+                    current_code = code
+                elif note or next_quantity > 0:
                     continue
-
-                # Otherwise, treat as continuation (only if no blank before)
-                if current_name:
-                    current_name += " " + external_name
-
-
-
-
+                elif current_name:
+                    current_name += " " + name
 
         # --- After loop, flush last product safely ---
         if current_name:
             # If the last name contains disclaimers/headers, clean them out
-            if ("※" in current_name 
-                or any(keyword in current_name for keyword in ["名称", "規格", "数量", "単位", "金額", "備考"])):
-                # cut off everything after the first keyword/disclaimer
-                for marker in ["※", "名称", "規格", "数量", "単位", "金額", "備考"]:
-                    if marker in current_name:
-                        current_name = current_name.split(marker)[0].strip()
-                        break
-
-            components.append(ConstructionComponent(
+            header_keywords = self.plan.header_keywords if self.plan else HEADER_KEYWORDS
+            for marker in ["※"] + header_keywords:
+                if marker in current_name:
+                    # cut off everything after the first keyword/disclaimer
+                    current_name = current_name.split(marker)[0].strip()
+                    break
+
+            yield ConstructionComponent(
                 external_product_name=current_name,
                 external_product_code=current_code or "",
                 quantities=current_quantity or 0
-            ))
+            )
 
+    def iter_components(self) -> Iterator[ConstructionComponent]:
+        """Components in file order, each emitted as soon as it is complete."""
+        return self._assemble_components(self._iter_prepared_rows(self._iter_frames()))
+
+    def convert_to_component_list(self) -> NormalizedOrder:
+        return NormalizedOrder(components=list(self.iter_components()))
+
+
+def extract_page_tables(source: Union[str, BinaryIO], page_numbers: List[int]) -> List[List[List[List[str]]]]:
+    """
+    Tables of the given pages: pages -> tables -> rows -> cells.
+    Runs in the pdf worker processes, so source is a file path there.
+    Merged cells (None) become "", line breaks inside a cell become spaces.
+    """
+    import pdfplumber
+
+    pages = []
+    with pdfplumber.open(source) as pdf:
+        for page_number in page_numbers:
+            page = pdf.pages[page_number]
+            tables = page.extract_tables()
+            # drop the page's parsed layout before moving on
+            page.close()
+            pages.append([
+                [["" if cell is None else str(cell).replace("\n", " ") for cell in row] for row in table]
+                for table in tables if table
+            ])
+    return pages
+
+
+# Create and reuse a single pool of pdf workers
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+
+def get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn: forking a process that already runs threads is not safe
+            _pdf_pool = ProcessPoolExecutor(
+                max_workers=PDF_MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pdf_pool
+
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is not None:
+            _pdf_pool.shutdown(cancel_futures=True)
+            _pdf_pool = None
+
+
+class NormalizePDFOrder(NormalizeCsvOrder):
+    def __init__(self, contents: Union[bytes, BinaryIO], detection_config: Optional[DetectionConfig] = None,
+                 registry: Optional[DetectionRegistry] = None, max_workers: int = PDF_MAX_WORKERS):
+        """
+        Accepts raw PDF file content and detection JSON config.
+        Tables are extracted page by page (in worker processes for multi-page
+        files), merged in page order and fed to the same row logic as
+        NormalizeCsvOrder. Column indexes in the detection config refer to the
+        columns of the extracted table.
+        """
+        super().__init__(contents, detection_config, registry=registry)
+        self.max_workers = max_workers
+
+    def _iter_tables(self) -> Iterator[List[List[str]]]:
+        """All tables of the PDF in page order."""
+        import pdfplumber
+
+        self.stream.seek(0)
+        with pdfplumber.open(self.stream) as pdf:
+            n_pages = len(pdf.pages)
+        self.stream.seek(0)
+        batches = [list(range(start, min(start + PDF_PAGES_PER_TASK, n_pages)))
+                   for start in range(0, n_pages, PDF_PAGES_PER_TASK)]
+
+        if len(batches) <= 1 or self.max_workers <= 1:
+            for batch in batches:
+                for tables in extract_page_tables(self.stream, batch):
+                    yield from tables
+            return
+
+        # workers open the file themselves, so only the path is sent to them
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+            while True:
+                block = self.stream.read(READ_BLOCK_BYTES)
+                if not block:
+                    break
+                tmp.write(block)
+            tmp.flush()
+            # map keeps page order while later batches are still being extracted
+            try:
+                for pages in get_pdf_pool().map(extract_page_tables, [tmp.name] * len(batches), batches):
+                    for tables in pages:
+                        yield from tables
+            except BrokenProcessPool:
+                # a crashed worker breaks the pool for good, start a fresh one next time
+                shutdown_pdf_pool()
+                raise
+
+    def _iter_frames(self) -> Iterator[Tuple[pd.DataFrame, ExtractionPlan]]:
+        """
+        Yields (table, compiled plan) in page order with a running row index.
+        Tables the detection config does not fit (stamp boxes, title blocks)
+        are skipped. Tables of the same width share a plan, so a table
+        continued on the next page is read as one.
+        Without a detection config the first table whose header row is a
+        registered format decides the config for the whole file.
+        """
+        config = self.detection_config
+        plans: Dict[int, Optional[ExtractionPlan]] = {}
+        offset = 0
+        for table in timed_iter("parse", self._iter_tables()):
+            header = table[0]
+            if len(header) not in plans:
+                try:
+                    plan = self.registry.plan_for(header, config)
+                except UnknownFormatError:
+                    continue
+                except DetectionMismatchError:
+                    plan = None
+                if config is None:
+                    config = self.registry.get(header_fingerprint(header))
+                plans[len(header)] = plan
+            plan = plans[len(header)]
+            if plan is None:
+                continue
+            self.plan = plan
+            frame = pd.DataFrame(table, index=range(offset, offset + len(table)), dtype=str)
+            offset += len(table)
+            yield frame, plan
+
+        if self.plan is None:
+            if config is None:
+                raise UnknownFormatError("Unknown file format: no table header of the PDF is registered; upload a detection JSON file")
+            raise DetectionMismatchError("No table in the PDF fits the detection config")
 
-        return NormalizedOrder(components=components)
 
+class NormalizeXlsxOrder(NormalizeCsvOrder):
+    def __init__(self, contents: Union[bytes, BinaryIO], detection_config: Optional[DetectionConfig] = None,
+                 chunk_rows: int = CSV_CHUNK_ROWS, registry: Optional[DetectionRegistry] = None):
+        """
+        Accepts raw XLSX file content and detection JSON config.
+        Sheets are streamed row by row (openpyxl read-only mode, no in-memory
+        workbook) and handed to the same row logic as NormalizeCsvOrder in
+        chunks of chunk_rows rows, keeping only the columns the plan uses.
+        Every visible sheet is its own table: the detection config (or the
+        registered format of the sheet's header row) is applied per sheet and
+        sheets the config does not fit are skipped.
+        """
+        super().__init__(contents, detection_config, chunk_rows=chunk_rows, registry=registry)
+
+    @staticmethod
+    def _cell(value) -> str:
+        return "" if value is None else str(value)
+
+    def _iter_sheet_frames(self, rows: Iterable[tuple], plan: ExtractionPlan) -> Iterator[Tuple[pd.DataFrame, ExtractionPlan]]:
+        """One sheet as (chunk, plan) with a running row index, only the plan's columns are kept."""
+        usecols = plan.usecols
+        offset = 0
+        batch = []
+        for row in rows:
+            batch.append([self._cell(row[c]) if c < len(row) else "" for c in usecols])
+            if len(batch) >= self.chunk_rows:
+                yield pd.DataFrame(batch, columns=usecols, index=range(offset, offset + len(batch)), dtype=str), plan
+                offset += len(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=usecols, index=range(offset, offset + len(batch)), dtype=str), plan
+
+    def _iter_sheets(self) -> Iterator[Iterator[Tuple[pd.DataFrame, ExtractionPlan]]]:
+        """Frames of every visible sheet that has a plan, one iterator per sheet."""
+        import openpyxl
+
+        self.stream.seek(0)
+        workbook = openpyxl.load_workbook(self.stream, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                if sheet.sheet_state != "visible":
+                    continue
+                rows = sheet.iter_rows(values_only=True)
+                first = next(rows, None)
+                if first is None:
+                    continue
+                try:
+                    plan = self.registry.plan_for([self._cell(value) for value in first], self.detection_config)
+                except (UnknownFormatError, DetectionMismatchError):
+                    continue
+                self.plan = plan
+                # the first row is data too, like in the csv
+                yield timed_iter("parse", self._iter_sheet_frames(chain([first], rows), plan))
+        finally:
+            workbook.close()
+
+        if self.plan is None:
+            if self.detection_config is None:
+                raise UnknownFormatError("Unknown file format: no sheet header of the workbook is registered; upload a detection JSON file")
+            raise DetectionMismatchError("No sheet of the workbook fits the detection config")
+
+    def iter_components(self) -> Iterator[ConstructionComponent]:
+        """Components sheet by sheet, a product never continues into the next sheet."""
+        for frames in self._iter_sheets():
+            yield from self._assemble_components(self._iter_prepared_rows(frames))
@@ -0,0 +1,108 @@
+# services/order_pipeline.py
+# raw file -> normalized lines -> internal candidates as connected stages:
+# every normalized line enters conversion as soon as the parser emits it
+import asyncio
+import threading
+from typing import AsyncIterator, BinaryIO, Iterator, Optional, TypeVar
+
+# settings
+from dotenv import load_dotenv
+import os
+
+from app.schemas.normalized_order import NormalizedOrder
+from app.schemas.converted_order import ConvertedProduct
+from app.schemas.detection import DetectionConfig
+from app.services.order_normalizer import NormalizeCsvOrder, NormalizePDFOrder, NormalizeXlsxOrder
+from app.services.order_converter import ConvertProduct
+from app.dependencies.resources import ConversionResources
+from app.dependencies.metrics import carry_context
+
+load_dotenv()
+# parsed lines buffered ahead of conversion before the parser thread waits
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1000"))
+
+T = TypeVar("T")
+
+
+def make_normalizer(source: BinaryIO, filename: str, detection_config: Optional[DetectionConfig]) -> NormalizeCsvOrder:
+    """Normalizer for the file type (by extension, CSV by default)."""
+    filename = (filename or "").lower()
+    if filename.endswith(".pdf"):
+        return NormalizePDFOrder(source, detection_config)
+    if filename.endswith(".xlsx"):
+        return NormalizeXlsxOrder(source, detection_config)
+    return NormalizeCsvOrder(source, detection_config)
+
+
+async def iter_in_thread(iterator: Iterator[T], maxsize: int = PIPELINE_QUEUE_SIZE) -> AsyncIterator[T]:
+    """
+    Runs a blocking iterator on a worker thread and yields its items on the event loop.
+    The bounded queue gives backpressure; closing this generator stops the thread.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+    end = object()
+
+    def produce():
+        try:
+            for item in iterator:
+                if stop.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(queue.put((item, None)), loop).result()
+            asyncio.run_coroutine_threadsafe(queue.put((end, None)), loop).result()
+        except BaseException as e:
+            if not stop.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put((end, e)), loop).result()
+        finally:
+            # release the file / workbook of an abandoned generator on its own thread
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    # parse / normalize timings of the producer thread belong to the caller's request
+    producer = loop.run_in_executor(None, carry_context(produce))
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is end:
+                break
+            yield item
+    finally:
+        stop.set()
+        # unblock a producer waiting on a full queue
+        while not queue.empty():
+            queue.get_nowait()
+        await asyncio.shield(producer)
+
+
+async def convert_raw_order(normalizer: NormalizeCsvOrder,
+                            resources: Optional[ConversionResources] = None) -> AsyncIterator[ConvertedProduct]:
+    """
+    Normalize and convert in one pass, converted lines in completion order
+    (pre-convert.id is the line's position in the normalized order).
+    The first line is read before returning, so a file that cannot be parsed
+    (unknown format, config that does not fit) raises here and not mid-stream.
+    """
+    components = iter_in_thread(normalizer.iter_components())
+    try:
+        first = await components.__anext__()
+    except StopAsyncIteration:
+        first = None
+    except BaseException:
+        await components.aclose()
+        raise
+
+    async def normalized():
+        try:
+            if first is not None:
+                yield first
+                async for component in components:
+                    yield component
+        finally:
+            await components.aclose()
+
+    converter = ConvertProduct(NormalizedOrder(components=[]), resources=resources)
+    return converter.iter_pipeline_async(normalized())
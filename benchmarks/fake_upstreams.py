@@ -0,0 +1,316 @@
+# benchmarks/fake_upstreams.py
+# local stand-ins for the OpenAI API (embeddings, chat, models) and a Pinecone index (query, upsert, update, delete)
+# with configurable latency, jitter and error injection; no network needed
+#   python -m benchmarks.fake_upstreams --openai-port 8101 --pinecone-port 8102 --chat-ms 1500 --error-rate 0.02
+# then run the app with
+#   OPENAI_BASE_URL=http://127.0.0.1:8101/v1 PINECONE_INDEX_HOST=http://127.0.0.1:8102
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from app.services.match_serializer import MATCH_HEADER
+
+
+class Latency:
+    """base_ms + per_item_ms * items, spread by +-jitter (fraction), failing with error_rate."""
+
+    def __init__(self, base_ms: float, per_item_ms: float = 0.0, jitter: float = 0.2,
+                 error_rate: float = 0.0, error_status: int = 429):
+        self.base_ms = base_ms
+        self.per_item_ms = per_item_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def wait(self, items: int = 1):
+        ms = (self.base_ms + self.per_item_ms * items) * (1 + random.uniform(-self.jitter, self.jitter))
+        time.sleep(max(ms, 0.0) / 1000)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+def embed_text(text: str, dimensions: int) -> np.ndarray:
+    """
+    Deterministic stand-in embedding: hashed character uni/bigrams of the NFKC text,
+    so names sharing characters (and part numbers) end up close, like real embeddings.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    vector = np.zeros(dimensions, dtype=np.float32)
+    grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+    for gram in grams:
+        digest = hashlib.blake2b(gram.encode(), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeCatalog:
+    """In-memory index of internal products, searched by cosine similarity."""
+
+    def __init__(self, products: List[Tuple[str, str]], size: int, dimensions: int = 1536, seed: int = 0):
+        rng = random.Random(seed)
+        entries = []
+        for name, code in products:
+            # the catalog spells names a little differently than the quotes do
+            entries.append((unicodedata.normalize("NFKC", name), code or f"P{len(entries):06d}"))
+        words = ["照明器具", "ダウンライト", "ケーブル", "VE管", "ボックス", "スイッチ", "コンセント", "端子", "ブレーカ", "LED"]
+        while len(entries) < size:
+            number = len(entries)
+            entries.append((f"{rng.choice(words)} {rng.choice('ABCDEFGHXYZ')}{rng.randint(10, 9999)}-{rng.choice(['W', 'B', 'S'])}",
+                            f"P{number:06d}"))
+        self.ids = [str(i) for i in range(len(entries))]
+        self.metadata = [{"internal_product_name": name, "internal_product_id": code} for name, code in entries]
+        self.dimensions = dimensions
+        self.vectors = np.stack([embed_text(name, dimensions) for name, _ in entries])
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    # writes of the catalog indexer (app/services/catalog_indexer.py)
+    def upsert(self, records: List[dict]):
+        with self._lock:
+            positions = {vector_id: i for i, vector_id in enumerate(self.ids)}
+            added = []
+            for record in records:
+                vector = np.asarray(record["values"], dtype=np.float32)
+                i = positions.get(record["id"])
+                if i is None:
+                    self.ids.append(record["id"])
+                    self.metadata.append(record.get("metadata") or {})
+                    added.append(vector)
+                else:
+                    self.vectors[i] = vector
+                    self.metadata[i] = record.get("metadata") or {}
+            if added:
+                self.vectors = np.vstack([self.vectors] + added)
+
+    def update(self, vector_id: str, metadata: dict):
+        with self._lock:
+            i = self.ids.index(vector_id)
+            self.metadata[i] = {**self.metadata[i], **metadata}
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            drop = set(ids)
+            keep = [i for i, vector_id in enumerate(self.ids) if vector_id not in drop]
+            self.ids = [self.ids[i] for i in keep]
+            self.metadata = [self.metadata[i] for i in keep]
+            self.vectors = self.vectors[keep]
+
+    def query(self, vector: List[float], top_k: int) -> List[dict]:
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape[0] != self.dimensions:
+            raise ValueError(f"Query dimension {query.shape[0]} does not match index dimension {self.dimensions}")
+        with self._lock:
+            ids, metadata, vectors = self.ids, self.metadata, self.vectors
+        scores = vectors @ query
+        k = min(top_k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{"id": ids[i], "score": float(scores[i]), "values": [], "metadata": metadata[i]} for i in top]
+
+
+def _candidates_from_table(table: str) -> List[dict]:
+    """The top rows of a serialized match table, as the LLM would return them."""
+    candidates = []
+    for row in table.splitlines():
+        if not row or row == MATCH_HEADER:
+            continue
+        parts = row.split("\t")
+        if len(parts) != 3:
+            continue
+        candidates.append({"master_id": 10001 + len(candidates), "product-name": parts[0],
+                           "product-code": parts[1], "score": float(parts[2] or 0)})
+        if len(candidates) == 3:
+            break
+    return candidates
+
+
+def fake_chat_answer(messages: List[dict]) -> Tuple[str, int]:
+    """JSON answer for ConvertProduct's single or batched rerank prompt, and the number of lines in it."""
+    user = messages[-1]["content"]
+    if user.startswith("{"):
+        products = json.loads(user).get("products", [])
+        results = [{"id": p["id"], "candidates": _candidates_from_table(p.get("matches", ""))} for p in products]
+        return json.dumps({"results": results}, ensure_ascii=False), len(products)
+    _, _, table = user.partition("Similarity matches:\n")
+    return json.dumps({"candidates": _candidates_from_table(table)}, ensure_ascii=False), 1
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 2)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fail(self, latency: Latency):
+        latency.wait()
+        self._send(latency.error_status, {"error": {"message": "injected error", "type": "rate_limit_exceeded"}})
+
+
+class FakeOpenAIHandler(_Handler):
+    embed: Latency
+    chat: Latency
+
+    def do_GET(self):
+        # models.retrieve, used by the startup warm-up
+        if self.path.startswith("/v1/models/"):
+            self._send(200, {"id": self.path.rsplit("/", 1)[-1], "object": "model", "created": 0, "owned_by": "fake"})
+        else:
+            self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path == "/v1/embeddings":
+            self._embeddings(body)
+        elif self.path == "/v1/chat/completions":
+            self._chat(body)
+        else:
+            self._send(404, {"error": {"message": "not found"}})
+
+    def _embeddings(self, body: dict):
+        if self.embed.should_fail():
+            return self._fail(self.embed)
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        dimensions = body.get("dimensions") or 1536
+        vectors = [embed_text(text, dimensions) for text in inputs]
+        self.embed.wait(len(inputs))
+        as_base64 = body.get("encoding_format") == "base64"
+        self._send(200, {
+            "object": "list",
+            "model": body.get("model"),
+            "data": [
+                {"object": "embedding", "index": i,
+                 "embedding": base64.b64encode(v.tobytes()).decode() if as_base64 else v.tolist()}
+                for i, v in enumerate(vectors)
+            ],
+            "usage": {"prompt_tokens": sum(map(_tokens, inputs)), "total_tokens": sum(map(_tokens, inputs))},
+        })
+
+    def _chat(self, body: dict):
+        if self.chat.should_fail():
+            return self._fail(self.chat)
+        content, lines = fake_chat_answer(body["messages"])
+        self.chat.wait(lines)
+        prompt_tokens = sum(_tokens(m["content"]) for m in body["messages"])
+        self._send(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": _tokens(content),
+                      "total_tokens": prompt_tokens + _tokens(content)},
+        })
+
+
+class FakePineconeHandler(_Handler):
+    catalog: FakeCatalog
+    vector: Latency
+
+    def do_POST(self):
+        body = self._read_json()
+        if self.path == "/query":
+            if self.vector.should_fail():
+                return self._fail(self.vector)
+            matches = self.catalog.query(body["vector"], body.get("topK", 10))
+            self.vector.wait()
+            self._send(200, {"matches": matches, "namespace": body.get("namespace", ""), "usage": {"readUnits": 5}})
+        elif self.path == "/describe_index_stats":
+            self._send(200, {"namespaces": {"": {"vectorCount": len(self.catalog)}},
+                             "dimension": self.catalog.dimensions, "indexFullness": 0.0,
+                             "totalVectorCount": len(self.catalog)})
+        elif self.path == "/vectors/upsert":
+            self.catalog.upsert(body["vectors"])
+            self.vector.wait()
+            self._send(200, {"upsertedCount": len(body["vectors"])})
+        elif self.path == "/vectors/update":
+            self.catalog.update(body["id"], body.get("setMetadata") or {})
+            self._send(200, {})
+        elif self.path == "/vectors/delete":
+            self.catalog.delete(body.get("ids") or [])
+            self._send(200, {})
+        else:
+            self._send(404, {"error": {"message": "not found"}})
+
+
+def _serve(handler: type, port: int, **attributes) -> ThreadingHTTPServer:
+    handler = type(handler.__name__, (handler,), attributes)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_fake_upstreams(openai_port: int, pinecone_port: int, embed: Latency, chat: Latency, vector: Latency,
+                         catalog: FakeCatalog) -> List[ThreadingHTTPServer]:
+    return [
+        _serve(FakeOpenAIHandler, openai_port, embed=embed, chat=chat),
+        _serve(FakePineconeHandler, pinecone_port, vector=vector, catalog=catalog),
+    ]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI + Pinecone servers for offline benchmarks")
+    parser.add_argument("--openai-port", type=int, default=8101)
+    parser.add_argument("--pinecone-port", type=int, default=8102)
+    parser.add_argument("--embed-ms", type=float, default=150, help="embeddings request latency")
+    parser.add_argument("--embed-ms-per-input", type=float, default=0.5)
+    parser.add_argument("--chat-ms", type=float, default=1500, help="chat completion latency")
+    parser.add_argument("--chat-ms-per-line", type=float, default=300, help="extra latency per reranked line")
+    parser.add_argument("--vector-ms", type=float, default=40, help="vector query latency")
+    parser.add_argument("--jitter", type=float, default=0.3, help="+- fraction applied to every latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--catalog-size", type=int, default=5000, help="products in the fake index")
+    args = parser.parse_args(argv)
+
+    from benchmarks.samples import sample_products
+
+    catalog = FakeCatalog(sample_products(), args.catalog_size)
+    errors = dict(error_rate=args.error_rate, error_status=args.error_status, jitter=args.jitter)
+    start_fake_upstreams(
+        args.openai_port, args.pinecone_port,
+        embed=Latency(args.embed_ms, args.embed_ms_per_input, **errors),
+        chat=Latency(args.chat_ms, args.chat_ms_per_line, **errors),
+        vector=Latency(args.vector_ms, **errors),
+        catalog=catalog,
+    )
+    print(f"fake openai on :{args.openai_port}, fake pinecone on :{args.pinecone_port} "
+          f"({len(catalog)} products)", flush=True)
+    threading.Event().wait()
+
+
+if __name__ == "__main__":
+    main()
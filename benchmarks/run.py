@@ -0,0 +1,251 @@
+# benchmarks/run.py
+# offline benchmark: the app under uvicorn against fake OpenAI / Pinecone servers (benchmarks/fake_upstreams.py)
+# drives /raw_order/normalize_csv and /normalized_order/convert_internal with the sample quotes
+# and scaled copies of them; reports p50/p95/p99 latency, lines per second and the server's peak RSS
+#   python -m benchmarks.run
+#   python -m benchmarks.run --convert-scales 1,10,50 --concurrency 4 --chat-ms 800 --error-rate 0.05
+#   python -m benchmarks.run --json bench.json
+import argparse
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.samples import load_samples, normalize_sample, scale_csv, scale_order
+
+# fake upstream options forwarded to benchmarks.fake_upstreams
+UPSTREAM_OPTIONS = ["embed_ms", "embed_ms_per_input", "chat_ms", "chat_ms_per_line", "vector_ms",
+                    "jitter", "error_rate", "error_status", "catalog_size"]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(check: Callable[[], bool], timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except (OSError, httpx.HTTPError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{what} did not start within {timeout:.0f}s")
+
+
+def port_open(port: int) -> bool:
+    with socket.socket() as s:
+        return s.connect_ex(("127.0.0.1", port)) == 0
+
+
+def proc_status_kb(pid: int, key: str) -> Optional[int]:
+    """VmRSS / VmHWM of a process in kB (Linux /proc)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(key + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss(pid: int) -> bool:
+    """Start a new VmHWM window (writing 5 to clear_refs resets the peak RSS)."""
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class Benchmark:
+    def __init__(self, base_url: str, server_pid: int, requests: int, concurrency: int):
+        self.client = httpx.Client(base_url=base_url, timeout=600)
+        self.server_pid = server_pid
+        self.requests = requests
+        self.concurrency = concurrency
+
+    def run(self, scenario: str, label: str, call: Callable[[], Tuple[int, int]]) -> dict:
+        """call() sends one request and returns (status code, lines in the response)."""
+        peak_reset = reset_peak_rss(self.server_pid)
+        latencies, lines, errors = [], 0, 0
+
+        def timed():
+            start = time.perf_counter()
+            status, n = call()
+            return time.perf_counter() - start, status, n
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for seconds, status, n in pool.map(lambda _: timed(), range(self.requests)):
+                latencies.append(seconds)
+                if status == 200:
+                    lines += n
+                else:
+                    errors += 1
+        wall = time.perf_counter() - started
+        peak_kb = proc_status_kb(self.server_pid, "VmHWM")
+        result = {
+            "scenario": scenario,
+            "input": label,
+            "requests": self.requests,
+            "errors": errors,
+            "lines_per_request": lines // max(1, self.requests - errors),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "lines_per_second": round(lines / wall, 1),
+            # since server start when the peak could not be reset
+            "peak_rss_mb": round(peak_kb / 1024, 1) if peak_kb else None,
+            "peak_rss_window": "scenario" if peak_reset else "process",
+        }
+        print(f"{scenario:<18} {label:<40} {result['lines_per_request']:>7} {result['errors']:>4} "
+              f"{result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+              f"{result['lines_per_second']:>9.1f} {result['peak_rss_mb'] or 0:>8.1f}", flush=True)
+        return result
+
+    def normalize_csv(self, name: str, contents: bytes, detection: dict) -> Tuple[int, int]:
+        response = self.client.post("/raw_order/normalize_csv", files={
+            "file": (name, contents, "text/csv"),
+            "detection": ("detection.json", json.dumps(detection).encode(), "application/json"),
+        })
+        return response.status_code, len(response.json().get("components", [])) if response.status_code == 200 else 0
+
+    def convert_internal(self, order_json: str) -> Tuple[int, int]:
+        response = self.client.post("/normalized_order/convert_internal", content=order_json,
+                                    headers={"Content-Type": "application/json"})
+        return response.status_code, len(response.json()) if response.status_code == 200 else 0
+
+
+def start_processes(args, workdir: str) -> Tuple[List[subprocess.Popen], str, int]:
+    openai_port, pinecone_port, app_port = free_port(), free_port(), free_port()
+    upstream_args = [sys.executable, "-m", "benchmarks.fake_upstreams",
+                     "--openai-port", str(openai_port), "--pinecone-port", str(pinecone_port)]
+    for option in UPSTREAM_OPTIONS:
+        upstream_args += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    upstreams = subprocess.Popen(upstream_args)
+
+    env = dict(os.environ)
+    env.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+        "PINECONE_API_KEY": "bench",
+        "PINECONE_INDEX_HOST": f"http://127.0.0.1:{pinecone_port}",
+        "VECTOR_BACKEND": "pinecone",
+        # no background jobs, nothing written next to the real caches
+        "JOB_WORKERS": "0",
+        "JOB_STORE_PATH": os.path.join(workdir, "jobs.sqlite3"),
+        "JOB_DATA_DIR": os.path.join(workdir, "jobs"),
+        "EMBEDDING_CACHE_PATH": os.path.join(workdir, "embedding_cache.sqlite3"),
+        "DETECTION_REGISTRY_PATH": os.path.join(workdir, "detection_registry.json"),
+    })
+    if not args.warm_caches:
+        # every request pays for embeddings, vector queries and the LLM
+        env.update({"EMBEDDING_CACHE_ENABLED": "0", "CONVERSION_CACHE_TTL": "0"})
+    log = open(os.path.join(workdir, "server.log"), "w")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{args.app}:app", "--host", "127.0.0.1", "--port", str(app_port),
+         "--log-level", "warning"],
+        env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    processes = [upstreams, server]
+    try:
+        wait_for(lambda: port_open(openai_port) and port_open(pinecone_port), 120, "fake upstreams")
+        wait_for(lambda: httpx.get(f"http://127.0.0.1:{app_port}/docs").status_code == 200, 120, "app server")
+    except BaseException:
+        stop_processes(processes)
+        raise
+    return processes, f"http://127.0.0.1:{app_port}", server.pid
+
+
+def stop_processes(processes: List[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def parse_scales(value: str) -> List[int]:
+    return [int(scale) for scale in value.split(",") if scale.strip()]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Offline latency / throughput benchmark")
+    parser.add_argument("--app", default="app.main", help="module with the FastAPI app (app.main, app.main_convert, ...)")
+    parser.add_argument("--scenarios", default="normalize,convert")
+    parser.add_argument("--normalize-scales", type=parse_scales, default=[1, 10, 100],
+                        help="row multipliers for the sample CSVs")
+    parser.add_argument("--convert-scales", type=parse_scales, default=[1, 10],
+                        help="line multipliers for the normalized samples")
+    parser.add_argument("--requests", type=int, default=10, help="requests per input")
+    parser.add_argument("--concurrency", type=int, default=2, help="requests in flight")
+    parser.add_argument("--warm-caches", action="store_true", help="keep the embedding / conversion caches on")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--embed-ms", type=float, default=150)
+    parser.add_argument("--embed-ms-per-input", type=float, default=0.5)
+    parser.add_argument("--chat-ms", type=float, default=1500)
+    parser.add_argument("--chat-ms-per-line", type=float, default=300)
+    parser.add_argument("--vector-ms", type=float, default=40)
+    parser.add_argument("--jitter", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--catalog-size", type=int, default=5000)
+    args = parser.parse_args(argv)
+    scenarios = set(args.scenarios.split(","))
+
+    samples = load_samples()
+    if not samples:
+        raise SystemExit("no sample CSVs found, run from the repository root")
+
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory() as workdir:
+        processes, base_url, server_pid = start_processes(args, workdir)
+        try:
+            bench = Benchmark(base_url, server_pid, args.requests, args.concurrency)
+            print(f"{'scenario':<18} {'input':<40} {'lines':>7} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} "
+                  f"{'p99 ms':>9} {'lines/s':>9} {'rss MB':>8}", flush=True)
+            if "normalize" in scenarios:
+                for name, contents, detection in samples:
+                    for scale in args.normalize_scales:
+                        data = scale_csv(contents, scale)
+                        results.append(bench.run("normalize_csv", f"{name[:32]} x{scale}",
+                                                 lambda: bench.normalize_csv(name, data, detection)))
+            if "convert" in scenarios:
+                for name, contents, detection in samples:
+                    order = normalize_sample(contents, detection)
+                    for scale in args.convert_scales:
+                        order_json = scale_order(order, scale).model_dump_json()
+                        results.append(bench.run("convert_internal", f"{name[:32]} x{scale}",
+                                                 lambda: bench.convert_internal(order_json)))
+        finally:
+            stop_processes(processes)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2, ensure_ascii=False, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# benchmarks/samples.py
+# the real quote files used by the benchmark, their detection configs, and synthetic scaling
+import glob
+import os
+from typing import Dict, List, Tuple
+
+from app.schemas.detection import DetectionConfig
+from app.schemas.normalized_order import NormalizedOrder
+from app.services.order_normalizer import NormalizeCsvOrder
+
+SAMPLE_DIR = glob.glob("data_*")[0] if glob.glob("data_*") else "data"
+
+# file name -> detection config (0-based columns of that export)
+SAMPLE_CSVS: Dict[str, dict] = {
+    # テキスト変換 export: 明細_品番, 明細_品名, 明細_数量
+    "utf8_見積→テキスト変換・葛飾区奥戸ＰＪ新築工事　.csv":
+        {"mixed": {"type": "single", "cols": [3]}, "quantity_col": 8, "code_col": 2},
+    # same export in Shift_JIS, exercises encoding detection
+    "見積→テキスト変換・葛飾区奥戸ＰＪ新築工事　.csv":
+        {"mixed": {"type": "single", "cols": [3]}, "quantity_col": 8, "code_col": 2},
+    # full export, 150+ columns per row
+    "utf8_見積→・葛飾区奥戸ＰＪ新築工事　.csv":
+        {"mixed": {"type": "single", "cols": [115]}, "quantity_col": 122, "code_col": 114},
+}
+
+
+def load_samples() -> List[Tuple[str, bytes, dict]]:
+    """(file name, contents, detection config) of every sample CSV that exists."""
+    samples = []
+    for name, detection in SAMPLE_CSVS.items():
+        path = os.path.join(SAMPLE_DIR, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                samples.append((name, f.read(), detection))
+    return samples
+
+
+def scale_csv(contents: bytes, factor: int) -> bytes:
+    """Header once, data rows repeated factor times."""
+    header, _, body = contents.partition(b"\n")
+    if not body.endswith(b"\n"):
+        body += b"\n"
+    return header + b"\n" + body * factor
+
+
+def scale_order(order: NormalizedOrder, factor: int) -> NormalizedOrder:
+    """
+    Lines repeated factor times; copies get a suffix so they are distinct
+    lines for the caches and the upstream calls, like a bigger quote would be.
+    """
+    components = []
+    for copy in range(factor):
+        for component in order.components:
+            suffix = f" {copy}" if copy else ""
+            components.append(component.model_copy(update={
+                "external_product_name": component.external_product_name + suffix
+            }))
+    return NormalizedOrder(components=components)
+
+
+def normalize_sample(contents: bytes, detection: dict) -> NormalizedOrder:
+    return NormalizeCsvOrder(contents, DetectionConfig(**detection)).convert_to_component_list()
+
+
+def sample_products() -> List[Tuple[str, str]]:
+    """Unique (name, code) pairs of all samples, the seed of the fake catalog."""
+    products = {}
+    for _, contents, detection in load_samples():
+        for component in normalize_sample(contents, detection).components:
+            products.setdefault(component.external_product_name, component.external_product_code)
+    return list(products.items())
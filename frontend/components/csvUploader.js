@@ -1,9 +1,20 @@
 import { parseCSV } from "../utils/parseCSV.js";
-import { sendDataToAPI } from "../services/apiClient.js";
-import { renderTable } from "./tableManager.js";
+import { streamDataFromAPI } from "../services/apiClient.js";
+import { resetTable, upsertRow } from "./tableManager.js";
 import { logError } from "../utils/errorHandler.js";
 import { config } from "../config/appConfig.js";
 
+// normalized CSV rows (external_product_name, external_product_code, quantities) -> NormalizedOrder
+function toNormalizedOrder(rows) {
+  return {
+    components: rows.map(row => ({
+      external_product_name: row.external_product_name ?? "",
+      external_product_code: row.external_product_code ?? "",
+      quantities: Number(row.quantities) || 0
+    }))
+  };
+}
+
 export function setupCSVUploader() {
   const input = document.getElementById(config.inputId);
   if (!input) return logError("Uploader", `Missing input element: ${config.inputId}`);
@@ -14,8 +25,10 @@ export function setupCSVUploader() {
 
     try {
       const parsed = await parseCSV(file);
-      const transformed = await sendDataToAPI(parsed, config.apiUrl);
-      renderTable(transformed, config.outputId);
+      resetTable();
+      // rows show up as soon as each line is converted, not after the whole order
+      await streamDataFromAPI(toNormalizedOrder(parsed), config.apiUrl,
+        (row) => upsertRow(row, config.outputId));
     } catch (err) {
       logError("CSV Upload Flow", err);
     }
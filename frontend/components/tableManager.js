@@ -1,4 +1,6 @@
 let tableInstance = null;
+// resolves once Tabulator has built the table, rows can only be added after that
+let tableBuilt = null;
 
 export function renderTable(data, containerId) {
   tableInstance = new Tabulator(`#${containerId}`, {
@@ -11,13 +13,40 @@ export function renderTable(data, containerId) {
     }))
   });
 
+  const table = tableInstance;
+  tableBuilt = new Promise(resolve => table.on("tableBuilt", resolve));
+
   tableInstance.on("cellEdited", (cell) => {
     console.log("✏️ Cell edited:", cell.getField(), cell.getOldValue(), "→", cell.getValue());
   });
 }
 
+// drop the previous order's table before streaming a new one
+export function resetTable() {
+  if (tableInstance) {
+    tableInstance.destroy();
+    tableInstance = null;
+    tableBuilt = null;
+  }
+}
+
 export function exportTable() {
   if (tableInstance) {
     tableInstance.download("csv", "edited_table_data.csv");
   }
 }
+
+// place a streamed row at its position; rows carry their pre-convert id
+export function upsertRow(row, containerId) {
+  const id = row["pre-convert"]?.id;
+  const flat = { id, ...row["pre-convert"], ...row.converted?.candidates?.[0] };
+
+  if (!tableInstance) {
+    renderTable([flat], containerId);
+    return;
+  }
+  const table = tableInstance;
+  tableBuilt
+    .then(() => table.updateOrAddData([flat]))
+    .then(() => table.setSort("id", "asc"));
+}
@@ -2,5 +2,6 @@ export const config = {
   inputId: "csvInput",
   outputId: "converted-product-table",
   exportBtnId: "exportBtn",
-  apiUrl: "http://127.0.0.1:8000/convert-csv"
+  // NDJSON stream, one converted line at a time
+  apiUrl: "http://127.0.0.1:8000/normalized_order/convert_internal/stream"
 };
@@ -12,3 +12,35 @@ export async function sendDataToAPI(data, apiUrl) {
 
   return await response.json();
 }
+
+// POST data to an NDJSON streaming endpoint (e.g. /normalized_order/convert_internal/stream)
+// and call onItem for every object as soon as its line arrives.
+export async function streamDataFromAPI(data, apiUrl, onItem) {
+  const response = await fetch(apiUrl, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(data)
+  });
+
+  if (!response.ok) {
+    const errorText = await response.text();
+    throw new Error(`Server responded with ${response.status}: ${errorText}`);
+  }
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffered = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffered += decoder.decode(value, { stream: true });
+
+    const lines = buffered.split("\n");
+    buffered = lines.pop();
+    for (const line of lines) {
+      if (line.trim()) onItem(JSON.parse(line));
+    }
+  }
+  if (buffered.trim()) onItem(JSON.parse(buffered));
+}
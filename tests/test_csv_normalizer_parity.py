@@ -0,0 +1,146 @@
+# the vectorized, chunked NormalizeCsvOrder against the original row-by-row implementation
+# (iterrows over the whole file) on the sample quote exports
+import csv
+import glob
+import os
+import re
+from io import StringIO
+
+import pandas as pd
+import pytest
+
+from app.schemas.detection import DetectionConfig
+from app.schemas.normalized_order import ConstructionComponent
+from app.services.order_normalizer import NormalizeCsvOrder
+
+SAMPLE_DIR = next(iter(glob.glob("data_川口・葛飾区奥戸ＰＪ新築工事")), None)
+SAMPLE_FILES = sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.csv"))) if SAMPLE_DIR else []
+
+HEADER_KEYWORDS = ["名称", "規格", "数量", "単位", "金額", "備考"]
+CODE_KEYWORDS = ["code", "品番", "型番", "商品コード"]
+
+# the two layouts of the samples (テキスト変換 export and the full export), a concat of two
+# columns, and a layout without code_col that falls back to code-like column names
+DETECTIONS = [
+    {"mixed": {"type": "single", "cols": [3]}, "quantity_col": 8, "code_col": 2},
+    {"mixed": {"type": "single", "cols": [115]}, "quantity_col": 122, "code_col": 114},
+    {"mixed": {"type": "concat", "cols": [1, 3], "sep": " "}, "quantity_col": 8},
+    {"mixed": {"type": "single", "cols": [4]}, "quantity_col": 11},
+]
+CHUNK_ROWS = [1, 2, 7, 50, 10000]
+
+
+def baseline_quantity(value) -> float:
+    if not value or str(value).strip() == "":
+        return 0
+    match = re.search(r"\d+(?:\.\d+)?", str(value).replace(",", "").strip())
+    if match:
+        num = match.group()
+        return float(num) if "." in num else int(num)
+    return 0
+
+
+def baseline_code(row: pd.Series, code_col) -> str:
+    if code_col is not None:
+        return str(row.iloc[code_col]).strip() if code_col < len(row) else ""
+    for col in row.index:
+        if any(keyword in str(col).lower() for keyword in CODE_KEYWORDS):
+            value = str(row[col]).strip()
+            if value:
+                return value
+    return ""
+
+
+def decode(contents: bytes) -> str:
+    try:
+        return contents.decode("utf-8")
+    except UnicodeDecodeError:
+        return contents.decode("shift-jis", errors="ignore")
+
+
+def read_table(contents: bytes, detection: DetectionConfig) -> pd.DataFrame:
+    """
+    The whole file as the row-by-row normalizer read it. Ragged exports (U57MSU_*)
+    do not parse that way; those are read with only the columns the detection uses,
+    like NormalizeCsvOrder does, and widened back so positions stay the same.
+    """
+    text = decode(contents)
+    options = dict(dtype=str, header=None, keep_default_na=False, na_values=["", "NA", "NaN"])
+    try:
+        return pd.read_csv(StringIO(text), **options).fillna("")
+    except pd.errors.ParserError:
+        pass
+    n_columns = len(next(csv.reader(StringIO(text))))
+    used = {detection.quantity_col, *detection.mixed.cols}
+    if detection.code_col is not None and detection.code_col < n_columns:
+        used.add(detection.code_col)
+    df = pd.read_csv(StringIO(text), usecols=sorted(used), **options).fillna("")
+    return df.reindex(columns=range(n_columns), fill_value="")
+
+
+def baseline_components(df: pd.DataFrame, detection: DetectionConfig) -> list:
+    """The row-by-row normalizer as it was before vectorization, on an already parsed table."""
+    mixed, qty_col = detection.mixed, detection.quantity_col
+    components = []
+    current_name = current_quantity = current_code = None
+
+    def flush():
+        components.append(ConstructionComponent(
+            external_product_name=current_name,
+            external_product_code=current_code or "",
+            quantities=current_quantity or 0
+        ))
+
+    for idx, row in df.iterrows():
+        if mixed.type == "single":
+            name = str(row.iloc[mixed.cols[0]]).strip()
+        else:
+            name = mixed.sep.join(str(row.iloc[c]).strip() for c in mixed.cols).strip()
+        if not name or any(k in name for k in HEADER_KEYWORDS) or name.startswith("■"):
+            continue
+        quantity = baseline_quantity(row.iloc[qty_col])
+        code = baseline_code(row, detection.code_col)
+        if quantity > 0:
+            if current_name:
+                flush()
+            current_name, current_quantity, current_code = name, quantity, code
+            continue
+        if name.startswith("※"):
+            continue
+        if idx + 1 < len(df) and baseline_quantity(df.iloc[idx + 1, qty_col]) > 0:
+            continue
+        if current_name:
+            current_name += " " + name
+
+    if current_name:
+        for marker in ["※"] + HEADER_KEYWORDS:
+            if marker in current_name:
+                current_name = current_name.split(marker)[0].strip()
+                break
+        flush()
+    return [component.model_dump() for component in components]
+
+
+def fits(contents: bytes, detection: DetectionConfig) -> bool:
+    columns = max(contents.split(b"\n", 1)[0].count(b","), 0) + 1
+    used = detection.mixed.cols + [detection.quantity_col] + \
+        ([detection.code_col] if detection.code_col is not None else [])
+    return max(used) < columns
+
+
+@pytest.mark.skipif(not SAMPLE_FILES, reason="sample quote exports not checked out")
+@pytest.mark.parametrize("path", SAMPLE_FILES, ids=os.path.basename)
+def test_vectorized_normalizer_matches_row_by_row(path):
+    with open(path, "rb") as f:
+        contents = f.read()
+    checked = 0
+    for raw in DETECTIONS:
+        detection = DetectionConfig(**raw)
+        if not fits(contents, detection):
+            continue
+        expected = baseline_components(read_table(contents, detection), detection)
+        for chunk_rows in CHUNK_ROWS:
+            normalized = NormalizeCsvOrder(contents, detection, chunk_rows=chunk_rows).convert_to_component_list()
+            assert [c.model_dump() for c in normalized.components] == expected, (raw, chunk_rows)
+        checked += 1
+    assert checked
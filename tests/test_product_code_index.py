@@ -0,0 +1,42 @@
+from app.dependencies.product_code_index import ProductCodeIndex, looks_like_part_number
+
+CATALOG = [
+    ("HC-5L2", "ケーブル HC-5L2"),
+    ("5C2V", "同軸ケーブル 5C2V"),
+    ("2000", "ボックス 2000"),
+    ("XFX460AENLE9", "iD6900D−W150昼白色"),
+]
+
+
+def make_index() -> ProductCodeIndex:
+    index = ProductCodeIndex()
+    index.load_entries(CATALOG)
+    return index
+
+
+def test_code_column_matches_exactly():
+    index = make_index()
+    assert index.resolve("5C2V", "同軸ケーブル") == [("5C2V", "同軸ケーブル 5C2V")]
+    assert index.resolve("ｘｆｘ４６０ａｅｎ－ｌｅ９") == [("XFX460AENLE9", "iD6900D−W150昼白色")]
+
+
+def test_part_number_in_name():
+    index = make_index()
+    assert index.resolve("", "ケーブル HC-5L2 10m") == [("HC-5L2", "ケーブル HC-5L2")]
+    assert index.resolve("", "照明 ＸＦＸ４６０ＡＥＮ－ＬＥ９") == [("XFX460AENLE9", "iD6900D−W150昼白色")]
+
+
+def test_short_or_numeric_name_tokens_are_not_codes():
+    index = make_index()
+    # "5C2V" names the cable type of another product, "2000" is a length
+    assert index.resolve("", "テレビ端子 5C2V 用") == []
+    assert index.resolve("", "LED 2000 lm") == []
+
+
+def test_looks_like_part_number():
+    assert looks_like_part_number("HC-5L2")
+    assert looks_like_part_number("ｘｆｘ４６０ａｅｎ－ｌｅ９")
+    assert not looks_like_part_number("5C2V")
+    assert not looks_like_part_number("20241211")
+    assert not looks_like_part_number("ケーブル")
+    assert not looks_like_part_number("IV1.25sq")
@@ -0,0 +1,91 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.dependencies.product_code_index import ProductCodeIndex
+from app.dependencies.resources import ConversionResources
+from app.dependencies.result_cache import KeyReleased, SingleFlightCache
+from app.schemas.converted_order import Candidate
+from app.schemas.normalized_order import ConstructionComponent, NormalizedOrder
+from app.services.order_converter import ConvertProduct
+
+ORDER = NormalizedOrder(components=[
+    ConstructionComponent(external_product_name="VVFケーブル 2.0-3C", external_product_code="", quantities=10)
+])
+
+
+class FakeConverter(ConvertProduct):
+    """Skips the vector database and the LLM; can hold or fail its rerank call."""
+
+    def __init__(self, cache: SingleFlightCache, gate: threading.Event = None, error: Exception = None):
+        super().__init__(ORDER, resources=ConversionResources(None, None, ProductCodeIndex(), cache))
+        self.started = threading.Event()
+        self.gate = gate
+        self.error = error
+
+    def _retrieve(self, indexes):
+        return {}, {index: "" for index in indexes}
+
+    def _convert_products(self, indexes, similar_products):
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return [[Candidate(master_id=1, product_name="VVF 2.0-3C", product_code="VVF2.0-3C", score=0.9)]
+                for _ in indexes]
+
+
+async def wait_until_shared(cache: SingleFlightCache):
+    while cache.stats()["shared_in_flight"] == 0:
+        await asyncio.sleep(0)
+
+
+def test_release_hands_key_to_waiter():
+    cache = SingleFlightCache()
+    _, leaders, _ = cache.claim(["a"])
+    _, _, waiting = cache.claim(["a"])
+    cache.release(leaders)
+    assert isinstance(waiting["a"].exception(), KeyReleased)
+    # the waiter claims the key again and is now its leader
+    assert cache.claim(["a"])[1] == ["a"]
+
+
+def test_waiter_takes_over_when_leader_is_cancelled():
+    async def run():
+        cache = SingleFlightCache()
+        gate = threading.Event()
+        first = FakeConverter(cache, gate=gate)
+        leader = asyncio.ensure_future(first.convert_single_order_async())
+        await asyncio.get_running_loop().run_in_executor(None, first.started.wait)
+
+        waiter = asyncio.ensure_future(FakeConverter(cache).convert_single_order_async())
+        await wait_until_shared(cache)
+        leader.cancel()
+        gate.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await waiter
+
+    converted = asyncio.run(run())
+    assert [c.product_code for c in converted[0].converted.candidates] == ["VVF2.0-3C"]
+
+
+def test_waiter_takes_over_when_leader_fails():
+    async def run():
+        cache = SingleFlightCache()
+        gate = threading.Event()
+        first = FakeConverter(cache, gate=gate, error=RuntimeError("upstream down"))
+        leader = asyncio.ensure_future(first.convert_single_order_async())
+        await asyncio.get_running_loop().run_in_executor(None, first.started.wait)
+
+        waiter = asyncio.ensure_future(FakeConverter(cache).convert_single_order_async())
+        await wait_until_shared(cache)
+        gate.set()
+        with pytest.raises(RuntimeError):
+            await leader
+        return await waiter
+
+    converted = asyncio.run(run())
+    assert [c.product_code for c in converted[0].converted.candidates] == ["VVF2.0-3C"]
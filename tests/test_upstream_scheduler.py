@@ -0,0 +1,47 @@
+from app.dependencies import upstream_scheduler
+from app.dependencies.upstream_scheduler import AdaptiveConcurrency, UpstreamScheduler
+
+
+class ServerError(Exception):
+    status_code = 500
+
+
+def test_failed_first_call_does_not_poison_latency():
+    concurrency = AdaptiveConcurrency("test", initial=8, maximum=64)
+    concurrency.acquire()
+    concurrency.release_failed(throttled=False)
+    assert concurrency.usual_latency is None
+    assert concurrency.limit == 8
+
+    for _ in range(20):
+        concurrency.acquire()
+        concurrency.release(0.01)
+    assert concurrency.usual_latency > 0
+    assert concurrency.limit > 8
+    assert concurrency.in_flight == 0
+
+
+def test_scheduler_recovers_after_failed_first_call(monkeypatch):
+    monkeypatch.setattr(upstream_scheduler.time, "sleep", lambda seconds: None)
+    scheduler = UpstreamScheduler("test", initial_concurrency=8, max_concurrency=64, max_retries=2)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ServerError("boom")
+        return "ok"
+
+    assert scheduler.call(flaky) == "ok"
+    for _ in range(10):
+        assert scheduler.call(lambda: "ok") == "ok"
+    assert scheduler.concurrency.usual_latency is not None
+    assert scheduler.concurrency.limit > 8
+
+
+def test_throttled_call_halves_the_limit():
+    concurrency = AdaptiveConcurrency("test", initial=8, maximum=64)
+    concurrency.acquire()
+    concurrency.release_failed(throttled=True)
+    assert concurrency.limit == 4
+    assert concurrency.usual_latency is None